@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scheduler adattivo dei probe, appreso dallo storico delle pubblicazioni
+Per ogni fonte registra quando ogni volantino (hash del link o del PDF) è comparso
+per la prima volta, stima una distribuzione delle pubblicazioni per giorno della
+settimana e ora e da questa ricava i prossimi probe: fitti intorno alle finestre
+di uscita attese, radi nel resto della settimana. Finché una fonte ha troppo poco
+storico si usa l'intervallo fisso di default.
+
+Uso:
+    python adaptive_scheduler.py due deco eurospin --json   # fonti da controllare adesso
+    python adaptive_scheduler.py next deco --count 10       # prossimi orari di probe
+    python adaptive_scheduler.py show deco                  # finestre di uscita stimate
+    python adaptive_scheduler.py simulate deco              # probe e ritardo vs intervallo fisso
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import json
+from datetime import datetime, timedelta
+
+# Accanto al modulo: probe lanciati dallo scheduler e a mano condividono lo stesso storico
+DEFAULT_HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    os.environ.get('PUBLICATION_HISTORY_FILE', 'publication_history.json'))
+
+# Intervalli tra un probe e l'altro
+DENSE_INTERVAL = timedelta(minutes=15)
+DEFAULT_INTERVAL = timedelta(hours=1)
+SPARSE_INTERVAL = timedelta(hours=6)
+
+# Sotto questo numero di pubblicazioni osservate il modello non è affidabile
+MIN_EVENTS = 3
+# Un'ora è finestra di uscita se pesa almeno WINDOW_FACTOR volte la media (1/168)
+WINDOW_FACTOR = 3.0
+# Le pubblicazioni vecchie contano la metà ogni HALF_LIFE_DAYS giorni
+HALF_LIFE_DAYS = 56
+# Ogni pubblicazione pesa anche sulle ore adiacenti (uscite a cavallo dell'ora)
+SMOOTHING = ((-1, 0.25), (0, 0.5), (1, 0.25))
+# Le pubblicazioni più vecchie vengono eliminate al salvataggio
+RETENTION_DAYS = 365
+
+HOURS_PER_WEEK = 7 * 24
+WEEKDAYS = ('lun', 'mar', 'mer', 'gio', 'ven', 'sab', 'dom')
+
+
+def _parse(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _next_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+
+class PublicationHistory:
+    """Prima comparsa di ogni volantino per fonte, più l'orario dell'ultimo probe (file JSON)"""
+
+    def __init__(self, history_file=DEFAULT_HISTORY_FILE):
+        self.history_file = str(history_file)
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Scrive lo storico su disco (atomicamente), scartando le pubblicazioni oltre la retention"""
+        cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).isoformat()
+        for source in self.data.values():
+            source['flyers'] = {
+                flyer_hash: first_seen for flyer_hash, first_seen in source.get('flyers', {}).items()
+                if first_seen is None or first_seen >= cutoff
+            }
+        tmp_file = f"{self.history_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.history_file)
+
+    def _source(self, source):
+        return self.data.setdefault(source, {'flyers': {}, 'last_probe': None})
+
+    def record(self, source, flyer_hashes, seen_at=None, bootstrap=False):
+        """
+        Registra gli hash visti in una pagina; restituisce quelli nuovi.
+        Con bootstrap=True (primo probe di una fonte) gli hash vengono solo memorizzati:
+        erano già pubblicati e non dicono nulla sull'orario di uscita.
+        """
+        flyers = self._source(source)['flyers']
+        seen_at = None if bootstrap else (seen_at or datetime.now()).isoformat()
+        new_hashes = [flyer_hash for flyer_hash in flyer_hashes if flyer_hash not in flyers]
+        for flyer_hash in new_hashes:
+            flyers[flyer_hash] = seen_at
+        return new_hashes
+
+    def mark_probed(self, source, when=None):
+        self._source(source)['last_probe'] = (when or datetime.now()).isoformat()
+
+    def last_probe(self, source):
+        return _parse(self.data.get(source, {}).get('last_probe'))
+
+    def events(self, source):
+        """Orari di prima comparsa delle pubblicazioni, in ordine"""
+        flyers = self.data.get(source, {}).get('flyers', {})
+        return sorted(_parse(first_seen) for first_seen in flyers.values() if first_seen)
+
+    def model(self, source, now=None):
+        return PublicationModel.fit(self.events(source), now=now)
+
+
+class PublicationModel:
+    """Distribuzione delle pubblicazioni sulle 168 ore della settimana"""
+
+    def __init__(self, weights, events):
+        self.weights = weights
+        self.events = events
+        self.total = sum(weights)
+
+    @classmethod
+    def fit(cls, timestamps, now=None, half_life_days=HALF_LIFE_DAYS):
+        now = now or datetime.now()
+        weights = [0.0] * HOURS_PER_WEEK
+        for ts in timestamps:
+            age_days = max((now - ts).total_seconds() / 86400, 0)
+            weight = 0.5 ** (age_days / half_life_days)
+            slot = ts.weekday() * 24 + ts.hour
+            for offset, share in SMOOTHING:
+                weights[(slot + offset) % HOURS_PER_WEEK] += weight * share
+        return cls(weights, len(timestamps))
+
+    @property
+    def trained(self):
+        return self.events >= MIN_EVENTS and self.total > 0
+
+    def share(self, when):
+        """Quota delle pubblicazioni attese nell'ora di `when`"""
+        if not self.total:
+            return 1 / HOURS_PER_WEEK
+        return self.weights[when.weekday() * 24 + when.hour] / self.total
+
+    def in_window(self, when):
+        return self.trained and self.share(when) >= WINDOW_FACTOR / HOURS_PER_WEEK
+
+    def interval(self, when):
+        if not self.trained:
+            return DEFAULT_INTERVAL
+        return DENSE_INTERVAL if self.in_window(when) else SPARSE_INTERVAL
+
+    def next_probe(self, last_probe):
+        """Prossimo probe dopo `last_probe`; un intervallo rado si accorcia se nel frattempo si apre una finestra"""
+        candidate = last_probe + self.interval(last_probe)
+        hour = _next_hour(last_probe)
+        while hour < candidate:
+            if self.in_window(hour):
+                return max(hour, last_probe + DENSE_INTERVAL)
+            hour += timedelta(hours=1)
+        return candidate
+
+    def probe_times(self, start, count):
+        times = []
+        when = start
+        for _ in range(count):
+            when = self.next_probe(when)
+            times.append(when)
+        return times
+
+    def windows(self):
+        """Ore della settimana considerate finestre di uscita: [(giorno, ora, quota)]"""
+        if not self.trained:
+            return []
+        return [
+            (slot // 24, slot % 24, weight / self.total)
+            for slot, weight in enumerate(self.weights)
+            if weight / self.total >= WINDOW_FACTOR / HOURS_PER_WEEK
+        ]
+
+
+def due_sources(history, sources, now=None):
+    """Fonti il cui prossimo probe è già scaduto (mai controllate = da controllare)"""
+    now = now or datetime.now()
+    due = []
+    for source in sources:
+        last_probe = history.last_probe(source)
+        if last_probe is None or history.model(source, now=now).next_probe(last_probe) <= now:
+            due.append(source)
+    return due
+
+
+def simulate(events, fixed_interval=DEFAULT_INTERVAL):
+    """
+    Ripercorre lo storico confrontando i probe adattivi con un intervallo fisso:
+    numero di richieste e ritardo medio tra pubblicazione e primo probe successivo.
+    Il modello è stimato sull'intero storico, quindi la stima è ottimistica.
+    """
+    if not events:
+        return None
+    model = PublicationModel.fit(events, now=events[-1])
+    start = events[0].replace(minute=0, second=0, microsecond=0)
+    end = events[-1] + SPARSE_INTERVAL
+
+    def run(next_time):
+        probes = [start]
+        while probes[-1] < end:
+            probes.append(next_time(probes[-1]))
+        delays = []
+        index = 0
+        for event in events:
+            while probes[index] < event:
+                index += 1
+            delays.append((probes[index] - event).total_seconds() / 60)
+        return {'requests': len(probes), 'mean_delay_minutes': round(sum(delays) / len(delays), 1),
+                'max_delay_minutes': round(max(delays), 1)}
+
+    return {
+        'events': len(events),
+        'adaptive': run(model.next_probe),
+        'fixed': run(lambda when: when + fixed_interval)
+    }
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Scheduler adattivo dei probe volantini')
+    parser.add_argument('--history', default=DEFAULT_HISTORY_FILE, help='File dello storico pubblicazioni')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    due_parser = subparsers.add_parser('due', help='Fonti da controllare adesso')
+    due_parser.add_argument('sources', nargs='+')
+    due_parser.add_argument('--json', action='store_true', help='Stampa la lista in JSON')
+
+    next_parser = subparsers.add_parser('next', help='Prossimi orari di probe di una fonte')
+    next_parser.add_argument('source')
+    next_parser.add_argument('--count', type=int, default=10)
+
+    show_parser = subparsers.add_parser('show', help='Finestre di uscita stimate di una fonte')
+    show_parser.add_argument('source')
+
+    record_parser = subparsers.add_parser('record', help='Registra manualmente una pubblicazione')
+    record_parser.add_argument('source')
+    record_parser.add_argument('flyer_hash')
+    record_parser.add_argument('--at', type=datetime.fromisoformat, help='Orario ISO (default: adesso)')
+
+    simulate_parser = subparsers.add_parser('simulate', help='Confronta probe adattivi e intervallo fisso sullo storico')
+    simulate_parser.add_argument('source')
+    simulate_parser.add_argument('--interval', type=int, default=60, help='Intervallo fisso in minuti (default: 60)')
+
+    args = parser.parse_args()
+    history = PublicationHistory(args.history)
+
+    if args.command == 'due':
+        due = due_sources(history, args.sources)
+        print(json.dumps(due) if args.json else '\n'.join(due))
+    elif args.command == 'next':
+        model = history.model(args.source)
+        start = history.last_probe(args.source) or datetime.now()
+        print(f"📅 {args.source}: {model.events} pubblicazioni, modello {'attivo' if model.trained else 'non addestrato (intervallo fisso)'}")
+        for when in model.probe_times(start, args.count):
+            marker = '🔥' if model.in_window(when) else '  '
+            print(f"{marker} {WEEKDAYS[when.weekday()]} {when.isoformat(timespec='minutes')}")
+    elif args.command == 'show':
+        model = history.model(args.source)
+        if not model.trained:
+            print(f"⚠️  {args.source}: solo {model.events} pubblicazioni, servono almeno {MIN_EVENTS}")
+            return
+        print(f"📊 {args.source}: {model.events} pubblicazioni")
+        for weekday, hour, share in model.windows():
+            print(f"   {WEEKDAYS[weekday]} {hour:02d}:00  {share * 100:5.1f}%")
+    elif args.command == 'record':
+        new_hashes = history.record(args.source, [args.flyer_hash], seen_at=args.at)
+        history.save()
+        print(f"🆕 Registrato {args.flyer_hash}" if new_hashes else f"🔁 {args.flyer_hash} già noto")
+    elif args.command == 'simulate':
+        result = simulate(history.events(args.source), timedelta(minutes=args.interval))
+        if result is None:
+            print(f"⚠️  Nessuna pubblicazione registrata per {args.source}")
+            return
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
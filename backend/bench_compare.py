@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Controllo delle regressioni di prestazioni sui risultati di benchmark.py
+Salva una baseline per scraper e fase (tempo di parsing, byte scaricati, RSS,
+upload al secondo, ...) e confronta un nuovo run con essa: stampa una tabella
+delle differenze ed esce con codice 1 se una metrica peggiora oltre la soglia.
+Accetta anche i report del test di carico di mock_api.py (upload/s, latenze e quota
+di upload falliti per target e concorrenza).
+
+Uso:
+    python benchmark.py run fixtures/negozi --output bench.json
+    python bench_compare.py save bench.json                       # aggiorna la baseline
+    python bench_compare.py compare bench.json --threshold 0.15   # exit 1 se regressione
+    python bench_compare.py compare bench.json --metric-threshold rss_peak_bytes=0.05 --all
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import sys
+import json
+import time
+
+DEFAULT_BASELINE_FILE = os.environ.get('BENCH_BASELINE_FILE', 'bench_baseline.json')
+DEFAULT_THRESHOLD = 0.10
+
+EXIT_OK = 0
+EXIT_REGRESSION = 1
+EXIT_ERROR = 2
+
+# Metriche confrontate (ultima parte della chiave) → (unità, più alto è meglio)
+METRICS = {
+    'wall_s': ('s', False),
+    'cpu_s': ('s', False),
+    'other_wall_s': ('s', False),
+    'latency_p50_s': ('s', False),
+    'latency_p95_s': ('s', False),
+    'rss_peak_bytes': ('bytes', False),
+    'alloc_peak_bytes': ('bytes', False),
+    'bytes_in': ('bytes', False),
+    'requests': ('count', False),
+    'api_requests': ('count', False),
+    'uploads_per_s': ('rate', True),
+    'failure_rate': ('ratio', False),
+}
+
+# Sotto queste differenze assolute una variazione è rumore di misura, non regressione
+NOISE_FLOOR = {'s': 0.002, 'bytes': 64 * 1024, 'count': 0, 'rate': 0, 'ratio': 0.02}
+
+
+def flatten_report(report):
+    """
+    Metriche piatte di un report: {gruppo: {chiave: valore}}.
+    benchmark.py → gruppo = scraper, chiavi 'wall_s', 'stages.parse.wall_s', ...
+    mock_api.py load → gruppo = 'load:<target>', chiavi 'c4.uploads_per_s', 'c4.failure_rate', ...
+    Gli upload falliti del load test (es. con --error-rate) sono una metrica, non un
+    run fallito: il gruppo è 'failed' solo se a un livello nessun upload riesce.
+    """
+    groups = {}
+    for name, summary in report.get('scrapers', {}).items():
+        metrics = {key: value for key, value in summary.items() if key in METRICS}
+        for stage, fields in summary.get('stages', {}).items():
+            for key, value in fields.items():
+                if key in METRICS:
+                    metrics[f"stages.{stage}.{key}"] = value
+        if summary.get('errors') or summary.get('misses'):
+            # Un run con errori o richieste non registrate non misura la stessa cosa
+            metrics['failed'] = True
+        groups[name] = metrics
+    for target, levels in report.get('targets', {}).items():
+        metrics = {}
+        for level in levels:
+            for key, value in level.items():
+                if key in METRICS:
+                    metrics[f"c{level['concurrency']}.{key}"] = value
+            if level.get('uploads'):
+                metrics[f"c{level['concurrency']}.failure_rate"] = level.get('failed', 0) / level['uploads']
+                if not level.get('succeeded'):
+                    metrics['failed'] = True
+        groups[f"load:{target}"] = metrics
+    return groups
+
+
+def load_report(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def merge_reports(paths):
+    """Metriche di più report; a parità di gruppo vince l'ultimo"""
+    groups = {}
+    for path in paths:
+        groups.update(flatten_report(load_report(path)))
+    return groups
+
+
+class Baseline:
+    """Metriche di riferimento per gruppo (scraper o target di carico), file JSON"""
+
+    def __init__(self, baseline_file=DEFAULT_BASELINE_FILE):
+        self.baseline_file = str(baseline_file)
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.baseline_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @property
+    def exists(self):
+        return bool(self.data.get('groups'))
+
+    @property
+    def groups(self):
+        return self.data.get('groups', {})
+
+    def update(self, groups, source=None):
+        """Sostituisce la baseline dei gruppi indicati, lasciando invariati gli altri"""
+        stored = self.data.setdefault('groups', {})
+        for name, metrics in groups.items():
+            stored[name] = {
+                'metrics': {key: value for key, value in metrics.items() if key != 'failed'},
+                'source': source,
+                'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+            }
+
+    def save(self):
+        """Scrive la baseline su disco (atomicamente)"""
+        self.data['version'] = 1
+        self.data['groups'] = dict(sorted(self.data.get('groups', {}).items()))
+        tmp_file = f"{self.baseline_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.baseline_file)
+
+
+def threshold_for(key, threshold, overrides):
+    """Soglia relativa di una metrica: chiave completa, poi nome della metrica, poi default"""
+    if key in overrides:
+        return overrides[key]
+    return overrides.get(key.rsplit('.', 1)[-1], threshold)
+
+
+def compare_metric(key, baseline, current, threshold, noise_floor=NOISE_FLOOR):
+    """Esito del confronto: (delta relativo, 'regression' | 'improvement' | 'ok')"""
+    unit, higher_is_better = METRICS[key.rsplit('.', 1)[-1]]
+    if baseline == 0:
+        delta = 0.0 if current == 0 else float('inf')
+    else:
+        delta = (current - baseline) / baseline
+    worse = current < baseline if higher_is_better else current > baseline
+    beyond = abs(delta) > threshold and abs(current - baseline) > noise_floor[unit]
+    if not beyond:
+        return delta, 'ok'
+    return delta, 'regression' if worse else 'improvement'
+
+
+def compare(baseline_groups, current_groups, threshold=DEFAULT_THRESHOLD, overrides=None, noise_floor=NOISE_FLOOR):
+    """
+    Confronta le metriche correnti con la baseline.
+    Restituisce le righe [{group, key, baseline, current, delta, status}]; status è
+    'regression', 'improvement', 'ok', 'new' (metrica senza baseline), 'missing'
+    (metrica sparita) o 'failed' (run con errori).
+    """
+    overrides = overrides or {}
+    rows = []
+    for group in sorted(current_groups):
+        current = current_groups[group]
+        stored = baseline_groups.get(group, {}).get('metrics')
+        if current.get('failed'):
+            rows.append({'group': group, 'key': 'errori', 'baseline': None, 'current': None, 'delta': None, 'status': 'failed'})
+        if stored is None:
+            rows.append({'group': group, 'key': '*', 'baseline': None, 'current': None, 'delta': None, 'status': 'new'})
+            continue
+        for key in sorted(set(stored) | set(current)):
+            if key == 'failed':
+                continue
+            row = {'group': group, 'key': key, 'baseline': stored.get(key), 'current': current.get(key), 'delta': None}
+            if key not in current:
+                row['status'] = 'missing'
+            elif key not in stored:
+                row['status'] = 'new'
+            else:
+                row['delta'], row['status'] = compare_metric(key, stored[key], current[key],
+                                                             threshold_for(key, threshold, overrides), noise_floor)
+            rows.append(row)
+    return rows
+
+
+def format_value(key, value):
+    if value is None:
+        return '-'
+    unit = METRICS[key.rsplit('.', 1)[-1]][0] if key.rsplit('.', 1)[-1] in METRICS else 'count'
+    if unit == 's':
+        return f"{value * 1000:.1f} ms"
+    if unit == 'bytes':
+        return f"{value / 1024 / 1024:.2f} MB" if value >= 1024 * 1024 else f"{value / 1024:.1f} KB"
+    if unit == 'rate':
+        return f"{value:.1f}/s"
+    if unit == 'ratio':
+        return f"{value * 100:.1f}%"
+    return str(value)
+
+
+STATUS_LABELS = {
+    'regression': '❌ regressione',
+    'improvement': '✅ migliorata',
+    'ok': '   invariata',
+    'new': '🆕 nuova',
+    'missing': '➖ assente',
+    'failed': '❌ run con errori',
+}
+
+
+def print_table(rows, show_all=False):
+    """Tabella delle differenze; senza show_all solo le righe fuori soglia o anomale"""
+    shown = [row for row in rows if show_all or row['status'] != 'ok']
+    if not shown:
+        print("✅ Nessuna metrica fuori soglia")
+        return
+    headers = ('gruppo', 'metrica', 'baseline', 'attuale', 'Δ', 'esito')
+    table = []
+    for row in shown:
+        if row['delta'] is None:
+            delta = ''
+        elif row['delta'] == float('inf'):
+            delta = '+∞'
+        else:
+            delta = f"{row['delta'] * 100:+.1f}%"
+        table.append((row['group'], row['key'], format_value(row['key'], row['baseline']),
+                      format_value(row['key'], row['current']), delta, STATUS_LABELS[row['status']]))
+    widths = [max(len(str(line[i])) for line in [headers] + table) for i in range(len(headers) - 1)]
+    for line in [headers] + table:
+        cells = [str(cell).ljust(width) if i < 2 else str(cell).rjust(width) for i, (cell, width) in enumerate(zip(line, widths))]
+        print('  '.join(cells + [line[-1]]))
+
+
+def _parse_overrides(values):
+    overrides = {}
+    for value in values or []:
+        key, sep, amount = value.partition('=')
+        if not sep:
+            raise ValueError(f"soglia non valida: {value} (atteso METRICA=VALORE)")
+        overrides[key.strip()] = float(amount)
+    return overrides
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Controllo regressioni sui benchmark VolantinoMix')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_FILE, help='File della baseline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    save_parser = subparsers.add_parser('save', help='Salva i report come nuova baseline')
+    save_parser.add_argument('reports', nargs='+')
+    save_parser.add_argument('--scrapers', help='Solo questi gruppi (separati da virgole)')
+
+    compare_parser = subparsers.add_parser('compare', help='Confronta i report con la baseline')
+    compare_parser.add_argument('reports', nargs='+')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help=f'Peggioramento relativo tollerato (default: {DEFAULT_THRESHOLD})')
+    compare_parser.add_argument('--metric-threshold', action='append', metavar='METRICA=VALORE',
+                                help='Soglia per metrica, es. rss_peak_bytes=0.05 o stages.parse.wall_s=0.2 (ripetibile)')
+    compare_parser.add_argument('--min-time-ms', type=float, default=NOISE_FLOOR['s'] * 1000,
+                                help='Differenze di tempo più piccole sono rumore (default: 2 ms)')
+    compare_parser.add_argument('--all', action='store_true', help='Mostra anche le metriche invariate')
+    compare_parser.add_argument('--json', help='Scrive anche le righe del confronto in questo file')
+    compare_parser.add_argument('--update', action='store_true', help='Se non ci sono regressioni aggiorna la baseline')
+
+    args = parser.parse_args()
+    baseline = Baseline(args.baseline)
+
+    try:
+        current = merge_reports(args.reports)
+    except (OSError, ValueError) as e:
+        print(f"❌ Report non leggibile: {e}", file=sys.stderr)
+        sys.exit(EXIT_ERROR)
+    source = ', '.join(os.path.basename(path) for path in args.reports)
+
+    if args.command == 'save':
+        if args.scrapers:
+            wanted = {name.strip() for name in args.scrapers.split(',')}
+            current = {name: metrics for name, metrics in current.items() if name in wanted}
+        failed = sorted(name for name, metrics in current.items() if metrics.get('failed'))
+        if failed:
+            print(f"⚠️  Run con errori, baseline non aggiornata per: {', '.join(failed)}")
+            current = {name: metrics for name, metrics in current.items() if name not in failed}
+        baseline.update(current, source=source)
+        baseline.save()
+        print(f"💾 Baseline aggiornata per {len(current)} gruppi in {args.baseline}")
+        return
+
+    if not baseline.exists:
+        print(f"❌ Nessuna baseline in {args.baseline}: eseguire prima 'save'", file=sys.stderr)
+        sys.exit(EXIT_ERROR)
+    try:
+        overrides = _parse_overrides(args.metric_threshold)
+    except ValueError as e:
+        parser.error(str(e))
+    noise_floor = dict(NOISE_FLOOR, s=args.min_time_ms / 1000)
+
+    rows = compare(baseline.groups, current, args.threshold, overrides, noise_floor)
+    print(f"📊 Confronto con la baseline {args.baseline} (soglia {args.threshold * 100:.0f}%)")
+    print_table(rows, show_all=args.all)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2, default=str)
+
+    regressions = [row for row in rows if row['status'] in ('regression', 'failed')]
+    improvements = [row for row in rows if row['status'] == 'improvement']
+    print(f"\n{'❌' if regressions else '✅'} {len(regressions)} regressioni, {len(improvements)} miglioramenti "
+          f"su {len(rows)} metriche")
+    if regressions:
+        sys.exit(EXIT_REGRESSION)
+    if args.update:
+        baseline.update(current, source=source)
+        baseline.save()
+        print(f"💾 Baseline aggiornata in {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline degli scraper su risposte registrate (vedi fixtures.py)
+Ogni scraper gira dal suo entry point reale, in una cartella temporanea e senza
+rete: le risposte arrivano dall'archivio, le pause di rate limiting vengono saltate
+e l'API VolantinoMix è simulata (o quella indicata con --api, oppure mock_api.py
+con --mock-api). I metodi principali di ogni scraper sono avvolti in fasi
+(discover, parse, download, dedup, upload, più 'http' per ogni richiesta
+riprodotta) di cui si misurano tempo reale e CPU esclusivi (al netto delle
+sottofasi), picco di allocazioni tracemalloc e picco RSS.
+Il risultato è un JSON leggibile da bench_compare.py.
+`startup` misura invece l'avvio a freddo di ogni entry point (python -X importtime
+in un interprete nuovo, come per ogni job) contro il budget di startup_budget.json,
+e fallisce se un modulo pesante da caricare solo al primo uso (selenium, bs4,
+numpy, PyMuPDF) viene importato all'avvio.
+
+Uso:
+    python benchmark.py record fixtures/negozi --scrapers deco,mersi     # registra dal vivo
+    python benchmark.py run fixtures/negozi --repeat 5 --output bench.json
+    python benchmark.py startup                     # exit 1 se un entry point sfora il budget
+    python benchmark.py startup --update            # ricalcola i budget su questa macchina
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+from fixtures import STUB_API_BASE, FixtureArchive, RecordingAdapter, ReplayAdapter, use_adapter
+
+STAGE_FIELDS = ('calls', 'wall_s', 'cpu_s', 'alloc_peak_bytes', 'rss_peak_bytes')
+
+
+def peak_rss_bytes():
+    """Picco di memoria residente del processo (0 se non misurabile)"""
+    if not RESOURCE_AVAILABLE:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta KiB, macOS byte
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageProfiler:
+    """
+    Tempi per fase con pila per thread: il tempo di una sottofase (es. 'http' dentro
+    'download') viene tolto dalla fase che la contiene. Le allocazioni sono il picco
+    tracemalloc durante la fase, sottofasi comprese.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name):
+        stack = self._stack()
+        frame = {'child_wall': 0.0, 'child_cpu': 0.0, 'mem_start': 0, 'peak': 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['mem_start'] = frame['peak'] = current
+        stack.append(frame)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            stack.pop()
+            alloc = 0
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                frame['peak'] = max(frame['peak'], peak)
+                alloc = frame['peak'] - frame['mem_start']
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            if stack:
+                stack[-1]['child_wall'] += wall
+                stack[-1]['child_cpu'] += cpu
+            with self._lock:
+                stats = self.stages.setdefault(name, dict.fromkeys(STAGE_FIELDS, 0))
+                stats['calls'] += 1
+                stats['wall_s'] += wall - frame['child_wall']
+                stats['cpu_s'] += cpu - frame['child_cpu']
+                stats['alloc_peak_bytes'] = max(stats['alloc_peak_bytes'], alloc)
+                stats['rss_peak_bytes'] = max(stats['rss_peak_bytes'], peak_rss_bytes())
+
+    def wrap(self, owner, attribute, name):
+        """Sostituisce il metodo `attribute` dell'oggetto con una versione cronometrata"""
+        method = getattr(owner, attribute)
+
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+
+        setattr(owner, attribute, timed)
+
+
+@contextmanager
+def skipped_sleeps():
+    """time.sleep diventa istantaneo; restituisce il totale dei secondi saltati"""
+    skipped = {'seconds': 0.0}
+    original = time.sleep
+
+    def fake_sleep(seconds):
+        skipped['seconds'] += seconds
+
+    time.sleep = fake_sleep
+    try:
+        yield skipped
+    finally:
+        time.sleep = original
+
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+# ---------------------------------------------------------------------------
+# Scraper: costruzione, entry point e metodi misurati come fasi
+# Gli import sono locali: ogni benchmark carica solo lo scraper che esegue
+# ---------------------------------------------------------------------------
+
+def _volantini(api_base):
+    from scraper_volantini import VolantiniScraper
+    return VolantiniScraper(download_folder='volantini')
+
+
+def _deco(api_base):
+    from scraper_deco import DecoVolantiniScraper
+    return DecoVolantiniScraper(download_folder='volantini_deco', api_base_url=api_base)
+
+
+def _ipercoop(api_base):
+    import scraper_ipercoop
+    # Il browser non passa dall'adapter: offline si usano solo le richieste HTTP
+    scraper_ipercoop.SELENIUM_AVAILABLE = False
+    return scraper_ipercoop.IpercoopVolantiniScraper(download_folder='volantini_ipercoop', api_base_url=api_base)
+
+
+def _mersi(api_base):
+    from scraper_mersi import MersiVolantiniScraper
+    return MersiVolantiniScraper(upload_url=f'{api_base}/pdfs/upload', download_dir='volantini/mersi')
+
+
+def _eurospin(api_base):
+    from scraper_eurospin import EurospinScraper
+    scraper = EurospinScraper(api_base_url=api_base)
+    # Indici dei duplicati nella cartella temporanea del run, non quelli condivisi accanto ai moduli
+    scraper.near_duplicates.index_file = os.path.abspath('perceptual_index.json')
+    scraper.text_duplicates.index_file = os.path.abspath('text_index.json')
+    return scraper
+
+
+def _eurospin_site(api_base):
+    from scraper_eurospin_site import EurospinSiteScraper
+    return EurospinSiteScraper(api_base_url=api_base)
+
+
+def _lidl_site(api_base):
+    from scraper_lidl_site import LidlSiteScraper
+    return LidlSiteScraper(api_base_url=api_base)
+
+
+def _md_site(api_base):
+    from scraper_md_site import MDSiteScraper
+    return MDSiteScraper(api_base_url=api_base)
+
+
+SITE_STAGES = {'find_pdf_links': 'parse', 'download_pdf': 'download', 'upload': 'upload'}
+
+SCRAPERS = {
+    'volantini': (_volantini, lambda s: s.scrape_site(),
+                  {'extract_pdf_links': 'parse', 'download_pdf': 'download'}),
+    'deco': (_deco, lambda s: s.scrape_and_upload(),
+             {'extract_pdf_links': 'parse', 'download_pdf': 'download', 'upload_to_volantinomix': 'upload'}),
+    'ipercoop': (_ipercoop, lambda s: s.scrape_and_upload(mode='auto'),
+                 {'extract_pdf_links_by_id': 'discover', 'probe_volantino_ids': 'probe', 'extract_pdf_links': 'parse',
+                  'download_pdf': 'download', 'upload_to_volantinomix': 'upload'}),
+    'mersi': (_mersi, lambda s: s.run(),
+              {'scrape': 'parse', 'download_pdf': 'download', 'upload_pdf': 'upload'}),
+    'eurospin': (_eurospin, lambda s: s.scrape(),
+                 {'search_volantini_html': 'discover', 'search_alternative_sources': 'discover',
+                  'extract_volantini_info': 'parse',
+                  'find_sfoglia_volantino_pdf': 'parse', 'download_pdf': 'download',
+                  'near_duplicates.check': 'dedup', 'text_duplicates.classify': 'dedup',
+                  'upload_to_volantinomix': 'upload'}),
+    'eurospin-site': (_eurospin_site, lambda s: s.run(), SITE_STAGES),
+    'lidl-site': (_lidl_site, lambda s: s.run(), SITE_STAGES),
+    'md-site': (_md_site, lambda s: s.run(), SITE_STAGES),
+}
+
+
+# Entry point misurati da `startup` → modulo importato dal job
+STARTUP_ENTRY_POINTS = {
+    'volantini': 'scraper_volantini',
+    'deco': 'scraper_deco',
+    'ipercoop': 'scraper_ipercoop',
+    'mersi': 'scraper_mersi',
+    'eurospin': 'scraper_eurospin',
+    'eurospin-site': 'scraper_eurospin_site',
+    'lidl-site': 'scraper_lidl_site',
+    'md-site': 'scraper_md_site',
+    'integrator': 'integrazione_volantini',
+}
+# Pacchetti da importare solo al primo utilizzo, mai all'avvio di un entry point
+DEFERRED_IMPORTS = ('selenium', 'bs4', 'numpy', 'pymupdf', 'fitz')
+# Moduli che un entry point importa solo per un'opzione (integrator: --full)
+DEFERRED_BY_ENTRY_POINT = {'integrator': ('scraper_volantini', 'scraper_mersi')}
+STARTUP_BUDGET_FILE = os.environ.get('STARTUP_BUDGET_FILE',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json'))
+STARTUP_HEADROOM = 0.5
+
+
+def measure_import(module, repeat=5):
+    """
+    Import di `module` in interpreti nuovi con -X importtime. Restituisce la mediana
+    del tempo cumulativo (ms), i moduli importati e gli import diretti più costosi.
+    """
+    times, imported, children = [], set(), {}
+    # Il primo giro scalda la cache del filesystem e non viene contato
+    for attempt in range(repeat + 1):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'import fallito')
+        cumulative, pending = None, []
+        for line in completed.stderr.splitlines():
+            fields = line.split('|')
+            if not line.startswith('import time:') or len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            name = fields[2].rstrip()
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            imported.add(name.strip())
+            # importtime stampa gli import figli prima del modulo che li contiene
+            if depth == 1:
+                pending.append((name.strip(), int(fields[1]) / 1000))
+            elif depth == 0:
+                if name.strip() == module:
+                    cumulative = int(fields[1]) / 1000
+                    if attempt:
+                        for child, ms in pending:
+                            children.setdefault(child, []).append(ms)
+                pending = []
+        if cumulative is None:
+            raise RuntimeError(f'{module} non trovato nell\'output di importtime')
+        if attempt:
+            times.append(cumulative)
+    top = sorted(((child, statistics.median(values)) for child, values in children.items()),
+                 key=lambda child: child[1], reverse=True)[:3]
+    return statistics.median(times), imported, top
+
+
+def load_startup_budget(path=STARTUP_BUDGET_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'entry_points': {}}
+
+
+def startup_benchmark(names, repeat=5, budget_file=STARTUP_BUDGET_FILE, update=False, headroom=STARTUP_HEADROOM):
+    """Misura l'avvio degli entry point; restituisce True se tutti rispettano budget e import differiti"""
+    budget = load_startup_budget(budget_file)
+    limits = budget.setdefault('entry_points', {})
+    ok = True
+    print(f"{'Entry point':<14} {'Import (ms)':>11} {'Budget':>8}  Esito   Import più costosi")
+    for name in names:
+        module = STARTUP_ENTRY_POINTS[name]
+        try:
+            elapsed, imported, top = measure_import(module, repeat)
+        except RuntimeError as e:
+            print(f"{name:<14} {'-':>11} {'-':>8}  ❌      {e}")
+            ok = False
+            continue
+        deferred = DEFERRED_IMPORTS + DEFERRED_BY_ENTRY_POINT.get(name, ())
+        eager = sorted({module_name for module_name in imported if module_name.split('.')[0] in deferred})
+        eager = sorted({module_name.split('.')[0] for module_name in eager})
+        if update:
+            # Arrotondato per eccesso ai 10 ms, con margine per il rumore tra macchine e giri
+            limits[name] = int(-(-elapsed * (1 + headroom) // 10) * 10)
+        limit = limits.get(name)
+        over = limit is not None and elapsed > limit
+        status = '❌' if over or eager else ('✅' if limit is not None else '⚠️ ')
+        detail = ', '.join(f"{child} {ms:.0f}" for child, ms in top)
+        if eager:
+            detail = f"importati all'avvio: {', '.join(eager)}"
+        print(f"{name:<14} {elapsed:>11.1f} {limit if limit is not None else '-':>8}  {status}      {detail}")
+        ok = ok and not over and not eager
+
+    if update:
+        budget.update({'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'headroom': headroom})
+        tmp_file = f"{budget_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(budget, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        os.replace(tmp_file, budget_file)
+        print(f"💾 Budget aggiornati in {budget_file}")
+    return ok
+
+
+def _instrument(profiler, scraper, stages):
+    for path, stage in stages.items():
+        owner = scraper
+        *parents, attribute = path.split('.')
+        for parent in parents:
+            owner = getattr(owner, parent)
+        profiler.wrap(owner, attribute, stage)
+
+
+def run_once(name, archive, api_base=None, trace_memory=True, verbose=False):
+    """Una esecuzione offline di uno scraper: fasi, richieste riprodotte e totali"""
+    factory, entry, stages = SCRAPERS[name]
+    profiler = StageProfiler(trace_memory=trace_memory)
+    adapter = ReplayAdapter(archive, api_base=api_base)
+    adapter.wrap = lambda: profiler.stage('http')
+    workdir = tempfile.mkdtemp(prefix=f'bench_{name}_')
+    output = None if verbose else io.StringIO()
+    error = None
+
+    if trace_memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with working_directory(workdir), use_adapter(adapter), skipped_sleeps() as skipped, \
+                redirect_stdout(output or sys.stdout):
+            with profiler.stage('setup'):
+                scraper = factory(api_base or STUB_API_BASE)
+            _instrument(profiler, scraper, stages)
+            try:
+                entry(scraper)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        if trace_memory:
+            tracemalloc.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    upload = profiler.stages.get('upload', {})
+    result = {
+        'wall_s': wall,
+        'cpu_s': cpu,
+        'other_wall_s': max(wall - sum(stage['wall_s'] for stage in profiler.stages.values()), 0.0),
+        'rss_peak_bytes': peak_rss_bytes(),
+        'requests': adapter.stats['requests'],
+        'bytes_in': adapter.stats['bytes'],
+        'misses': adapter.stats['misses'],
+        'api_requests': adapter.stats['api_requests'],
+        'uploads': upload.get('calls', 0),
+        'uploads_per_s': upload['calls'] / upload['wall_s'] if upload.get('wall_s') else 0.0,
+        'sleep_skipped_s': skipped['seconds'],
+        'stages': profiler.stages,
+        'missed_urls': adapter.missed_urls[:20],
+        'error': error
+    }
+    return result
+
+
+def summarize(runs):
+    """Mediana di tempi e throughput sulle ripetizioni, massimo per memoria"""
+    def median(key, items):
+        return statistics.median(item.get(key, 0) for item in items)
+
+    summary = {key: median(key, runs) for key in ('wall_s', 'cpu_s', 'other_wall_s', 'uploads_per_s')}
+    for key in ('requests', 'bytes_in', 'misses', 'api_requests', 'uploads', 'sleep_skipped_s'):
+        summary[key] = runs[0][key]
+    summary['rss_peak_bytes'] = max(run['rss_peak_bytes'] for run in runs)
+    summary['errors'] = sorted({run['error'] for run in runs if run['error']})
+    summary['missed_urls'] = runs[0]['missed_urls']
+
+    stage_names = sorted({stage for run in runs for stage in run['stages']})
+    summary['stages'] = {}
+    for stage in stage_names:
+        samples = [run['stages'].get(stage, dict.fromkeys(STAGE_FIELDS, 0)) for run in runs]
+        summary['stages'][stage] = {
+            'calls': samples[0]['calls'],
+            'wall_s': median('wall_s', samples),
+            'cpu_s': median('cpu_s', samples),
+            'alloc_peak_bytes': max(sample['alloc_peak_bytes'] for sample in samples),
+            'rss_peak_bytes': max(sample['rss_peak_bytes'] for sample in samples)
+        }
+    return summary
+
+
+def benchmark_scraper(name, archive, repeat=3, api_base=None, trace_memory=True, verbose=False):
+    # La prima esecuzione scalda import e cache del processo e non entra nelle statistiche
+    run_once(name, archive, api_base, trace_memory=False)
+    runs = [run_once(name, archive, api_base, trace_memory, verbose) for _ in range(repeat)]
+    return summarize(runs)
+
+
+def record(archive_path, names, api_base=None):
+    """Esegue gli scraper sulla rete reale salvando tutte le risposte nell'archivio"""
+    archive = FixtureArchive(archive_path)
+    for name in names:
+        factory, entry, _ = SCRAPERS[name]
+        adapter = RecordingAdapter(archive, api_base=api_base)
+        workdir = tempfile.mkdtemp(prefix=f'record_{name}_')
+        print(f"🎙️  Registrazione {name}...")
+        try:
+            with working_directory(workdir), use_adapter(adapter):
+                entry(factory(api_base or STUB_API_BASE))
+        except Exception as e:
+            print(f"❌ Registrazione {name} fallita: {e}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        archive.save()
+        print(f"✅ {name}: {adapter.stats['requests']} risposte, {adapter.stats['bytes'] / 1024:.0f} KB")
+
+
+def _run_isolated(name, args):
+    """Esegue il benchmark di uno scraper in un processo separato (RSS non condiviso)"""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+        output = tmp.name
+    command = [sys.executable, os.path.abspath(__file__), 'run', os.path.abspath(args.archive),
+               '--scrapers', name, '--repeat', str(args.repeat), '--output', output, '--in-process']
+    if args.api:
+        command += ['--api', args.api]
+    if args.no_tracemalloc:
+        command.append('--no-tracemalloc')
+    try:
+        completed = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode != 0:
+            return {'errors': [f'processo terminato con codice {completed.returncode}']}
+        with open(output, 'r', encoding='utf-8') as f:
+            return json.load(f)['scrapers'][name]
+    finally:
+        os.remove(output)
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark offline degli scraper VolantinoMix')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='Registra le risposte reali nell\'archivio')
+    record_parser.add_argument('archive')
+    record_parser.add_argument('--scrapers', default=','.join(SCRAPERS), help='Elenco separato da virgole (default: tutti)')
+    record_parser.add_argument('--api', help='API reale per gli upload (default: API simulata)')
+
+    run_parser = subparsers.add_parser('run', help='Esegue il benchmark offline sull\'archivio')
+    run_parser.add_argument('archive')
+    run_parser.add_argument('--scrapers', default=','.join(SCRAPERS), help='Elenco separato da virgole (default: tutti)')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Ripetizioni misurate per scraper (default: 3)')
+    run_parser.add_argument('--api', help='API da usare per gli upload (default: API simulata)')
+    run_parser.add_argument('--mock-api', action='store_true', help='Upload verso mock_api.py avviata in-process (multipart e deduplica reali)')
+    run_parser.add_argument('--output', help='File JSON dei risultati (default: stdout)')
+    run_parser.add_argument('--no-tracemalloc', action='store_true', help='Non tracciare le allocazioni (tempi meno disturbati)')
+    run_parser.add_argument('--in-process', action='store_true', help='Tutti gli scraper nello stesso processo')
+    run_parser.add_argument('--verbose', action='store_true', help='Mostra l\'output degli scraper')
+
+    startup_parser = subparsers.add_parser('startup', help='Tempo di import degli entry point contro il budget')
+    startup_parser.add_argument('--entry-points', default=','.join(STARTUP_ENTRY_POINTS),
+                                help='Elenco separato da virgole (default: tutti)')
+    startup_parser.add_argument('--repeat', type=int, default=5, help='Interpreti misurati per entry point (default: 5)')
+    startup_parser.add_argument('--budget', default=STARTUP_BUDGET_FILE, help='File JSON dei budget in ms')
+    startup_parser.add_argument('--update', action='store_true', help='Riscrive i budget dalle misure attuali')
+    startup_parser.add_argument('--headroom', type=float, default=STARTUP_HEADROOM,
+                                help='Margine sui tempi misurati con --update (default: 0.5 = +50%%)')
+
+    args = parser.parse_args()
+    if args.command == 'startup':
+        names = [name.strip() for name in args.entry_points.split(',') if name.strip()]
+        unknown = [name for name in names if name not in STARTUP_ENTRY_POINTS]
+        if unknown:
+            parser.error(f"entry point sconosciuti: {', '.join(unknown)} (disponibili: {', '.join(STARTUP_ENTRY_POINTS)})")
+        if not startup_benchmark(names, args.repeat, args.budget, args.update, args.headroom):
+            sys.exit(1)
+        return
+
+    names = [name.strip() for name in args.scrapers.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCRAPERS]
+    if unknown:
+        parser.error(f"scraper sconosciuti: {', '.join(unknown)} (disponibili: {', '.join(SCRAPERS)})")
+
+    if args.command == 'record':
+        record(args.archive, names, api_base=args.api)
+        return
+
+    archive = FixtureArchive(args.archive)
+    if not archive.entries:
+        print(f"❌ Archivio vuoto o inesistente: {args.archive}", file=sys.stderr)
+        sys.exit(1)
+
+    mock_api = None
+    if args.mock_api and not args.api:
+        from mock_api import MockVolantinoMixAPI
+        mock_api = MockVolantinoMixAPI().start()
+        args.api = mock_api.api_base_url
+
+    results = {}
+    for name in names:
+        print(f"⏱️  Benchmark {name}...", file=sys.stderr)
+        if args.in_process or len(names) == 1:
+            results[name] = benchmark_scraper(name, archive, args.repeat, args.api,
+                                              trace_memory=not args.no_tracemalloc, verbose=args.verbose)
+        else:
+            results[name] = _run_isolated(name, args)
+    if mock_api:
+        mock_api.stop()
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'archive': os.path.abspath(args.archive),
+        'repeat': args.repeat,
+        'tracemalloc': not args.no_tracemalloc,
+        'scrapers': results
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"💾 Risultati salvati in {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
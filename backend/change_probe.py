@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Probe economico "c'è un nuovo volantino?" condiviso dagli scraper
+Scarica solo la pagina di ingresso con una GET condizionale (If-None-Match /
+If-Modified-Since), estrae i link ai volantini, ne calcola un'impronta e la confronta
+con quella dell'ultimo probe. I link nuovi finiscono nello storico delle
+pubblicazioni (adaptive_scheduler.py), da cui si stimano gli orari dei probe successivi.
+Il codice di uscita dice allo scheduler se serve uno scraping completo:
+    0  nessuna novità
+    10 pagina cambiata (o primo probe): avviare lo scraping completo
+    1  errore durante il probe
+Un'impronta nuova resta "in sospeso" finché lo scraping completo non va a buon fine
+(`--probe-commit`, lanciato dallo scheduler dopo l'uscita 0 dello scraping): se lo
+scraping fallisce, il probe successivo vede ancora la pagina come cambiata.
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from url_utils import URLSet, url_key
+from adaptive_scheduler import PublicationHistory
+
+EXIT_UNCHANGED = 0
+EXIT_CHANGED = 10
+EXIT_ERROR = 1
+
+STATE_FILENAME = 'probe_state.json'
+
+LINK_ATTRIBUTES = ('href', 'src', 'data-pdf', 'data-url', 'data-href', 'data-link')
+
+
+def extract_flyer_links(html, base_url, keywords=()):
+    """Link della pagina che puntano a PDF o contengono una delle parole chiave"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    links = URLSet()
+    for element in soup.find_all(True):
+        for attr in LINK_ATTRIBUTES:
+            value = element.get(attr)
+            if not isinstance(value, str) or not value.strip() or value.startswith(('#', 'javascript:', 'mailto:')):
+                continue
+            lowered = value.lower()
+            if '.pdf' in lowered or any(keyword in lowered for keyword in keywords):
+                links.add(value, base=base_url)
+    return list(links)
+
+
+def link_hash(link):
+    """Identificativo stabile di un volantino nello storico delle pubblicazioni"""
+    return hashlib.sha1(url_key(link).encode('utf-8')).hexdigest()[:16]
+
+
+def links_fingerprint(links):
+    """Impronta SHA-256 dell'insieme dei link (indipendente da ordine e forma dell'URL)"""
+    keys = sorted({url_key(link) for link in links})
+    return hashlib.sha256('\n'.join(keys).encode('utf-8')).hexdigest()
+
+
+class ChangeProbe:
+    """
+    GET condizionale della pagina di ingresso con stato persistente per URL.
+    Con `source` ogni probe aggiorna lo storico delle pubblicazioni della fonte.
+    """
+
+    def __init__(self, state_file, session, timeout=15, source=None, history=None):
+        self.state_file = str(state_file)
+        self.session = session
+        self.timeout = timeout
+        self.source = source
+        self.history = history or (PublicationHistory() if source else None)
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Scrive lo stato su disco (atomicamente)"""
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+
+    def run(self, url, extract_links):
+        """
+        Esegue il probe di `url`; extract_links(html, base_url) restituisce i link ai volantini.
+        Restituisce {'status': 'changed'|'unchanged'|'error', 'http_status', 'links', 'fingerprint'}.
+        """
+        entry = self.state.get(url, {})
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        now = datetime.now().isoformat()
+        links = None
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                result = {'status': 'unchanged', 'http_status': 304,
+                          'links': entry.get('links', 0), 'fingerprint': entry.get('fingerprint')}
+            else:
+                response.raise_for_status()
+                links = extract_links(response.content, response.url)
+                fingerprint = links_fingerprint(links)
+                changed = fingerprint != entry.get('fingerprint')
+                result = {'status': 'changed' if changed else 'unchanged', 'http_status': response.status_code,
+                          'links': len(links), 'fingerprint': fingerprint}
+                validators = {
+                    'etag': response.headers.get('etag'),
+                    'last_modified': response.headers.get('last-modified'),
+                    'fingerprint': fingerprint,
+                    'links': len(links)
+                }
+                if changed:
+                    # Etag e impronta restano quelli confermati: fino al commit la pagina risulta cambiata
+                    entry['pending'] = dict(validators, changed_at=now)
+                else:
+                    entry.update(validators)
+                    entry.pop('pending', None)
+        except Exception as e:
+            print(f"❌ Probe fallito per {url}: {e}")
+            self._update_history(None, bootstrap=False)
+            return {'status': 'error', 'http_status': None, 'links': 0, 'fingerprint': None, 'error': str(e)}
+
+        first_probe = 'checked_at' not in entry
+        entry['checked_at'] = now
+        self.state[url] = entry
+        self.save()
+
+        icon = '🆕' if result['status'] == 'changed' else '💤'
+        print(f"{icon} Probe {url}: {result['status']} (HTTP {result['http_status']}, {result['links']} link)")
+        self._update_history(links, bootstrap=first_probe)
+        return result
+
+    def commit(self, url=None):
+        """
+        Conferma le impronte in sospeso (di `url` o di tutte le pagine) dopo uno scraping
+        completo riuscito; restituisce gli URL confermati
+        """
+        committed = []
+        for page_url, entry in self.state.items():
+            if url is not None and page_url != url:
+                continue
+            pending = entry.pop('pending', None)
+            if pending:
+                entry.update(pending)
+                committed.append(page_url)
+        if committed:
+            self.save()
+        return committed
+
+    def _update_history(self, links, bootstrap):
+        """Registra l'orario del probe e la prima comparsa dei link nuovi"""
+        if not self.history:
+            return
+        self.history.mark_probed(self.source)
+        if links:
+            new_hashes = self.history.record(self.source, [link_hash(link) for link in links], bootstrap=bootstrap)
+            if new_hashes and not bootstrap:
+                print(f"🆕 {len(new_hashes)} nuovi volantini registrati nello storico di {self.source}")
+        self.history.save()
+
+
+def commit_pending(state_file):
+    """Conferma le impronte in sospeso del file di stato (vedi ChangeProbe.commit)"""
+    committed = ChangeProbe(state_file, session=None).commit()
+    print(f"✅ Impronte del probe confermate: {len(committed)}")
+    return committed
+
+
+def exit_code(result):
+    """Codice di uscita del processo per l'esito di un probe"""
+    return {'changed': EXIT_CHANGED, 'unchanged': EXIT_UNCHANGED}.get(result['status'], EXIT_ERROR)
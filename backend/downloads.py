@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Download in streaming condiviso dagli scraper
+Legge solo il primo blocco della risposta e lo classifica (PDF, HTML, immagine,
+sconosciuto): se non è il tipo atteso chiude subito la connessione e registra il
+motivo nelle statistiche dell'esecuzione, senza trasferire il resto del corpo.
+I file accettati vengono scritti in streaming su un file .part e rinominati
+atomicamente, calcolando l'hash durante la scrittura.
+Se la connessione cade a metà, il file .part resta su disco insieme al suo validatore
+(ETag o Last-Modified): il download successivo riprende con Range/If-Range e, se il
+server non lo supporta o il file è cambiato, riparte da zero.
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import re
+import json
+import time
+from datetime import datetime
+
+import metrics
+import tracing
+from hashing import CHUNK_SIZE as HASH_CHUNK_SIZE, LEGACY_HASH, new_hasher
+
+CHUNK_SIZE = 64 * 1024
+# Le specifiche PDF ammettono fino a 1024 byte prima dell'header %PDF-
+SNIFF_BYTES = 1024
+
+IMAGE_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n',
+    b'\xff\xd8\xff',
+    b'GIF87a',
+    b'GIF89a',
+)
+HTML_MARKERS = (b'<!doctype html', b'<html', b'<head', b'<body', b'<script', b'<?xml')
+
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+def sniff(head):
+    """Classifica i primi byte di una risposta: 'pdf', 'html', 'image', 'empty' o 'unknown'"""
+    if not head:
+        return 'empty'
+    if b'%PDF-' in head[:SNIFF_BYTES]:
+        return 'pdf'
+    if head.startswith(IMAGE_SIGNATURES) or (head[:4] == b'RIFF' and head[8:12] == b'WEBP'):
+        return 'image'
+    text = head[:SNIFF_BYTES].lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith(HTML_MARKERS) or b'<html' in text:
+        return 'html'
+    return 'unknown'
+
+
+def record_rejection(stats, reason):
+    """Conta un download scartato nelle statistiche dell'esecuzione (stats['rejected'][motivo])"""
+    if stats is not None:
+        rejected = stats.setdefault('rejected', {})
+        rejected[reason] = rejected.get(reason, 0) + 1
+
+
+def _count(stats, key, amount=1):
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + amount
+
+
+def _validator(response):
+    """Valore per If-Range: ETag forte oppure Last-Modified (None se la risposta non è riprendibile)"""
+    if response.headers.get('accept-ranges', '').lower() == 'none':
+        return None
+    # Byte decompressi su disco: un Range sul corpo compresso non si riattacca al .part
+    if response.headers.get('content-encoding', 'identity').lower() != 'identity':
+        return None
+    etag = response.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('last-modified')
+
+
+def partial_paths(dest_path):
+    """Percorsi del file parziale e del suo validatore"""
+    return f"{dest_path}.part", f"{dest_path}.part.json"
+
+
+def discard_partial(dest_path):
+    """Elimina un download parziale e il relativo validatore"""
+    for path in partial_paths(dest_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class StreamedDownload:
+    """
+    Risposta in streaming di cui è già stato letto (e classificato) solo il primo blocco.
+
+        with StreamedDownload(session, url, stats=self.stats, dest_path=path) as download:
+            if not download.expect('pdf'):
+                return None
+            saved = download.save()
+    """
+
+    def __init__(self, session, url, timeout=30, stats=None, headers=None, dest_path=None):
+        self.started = time.perf_counter()
+        self.session = session
+        self.url = url
+        self.stats = stats
+        # Con dest_path il download è riprendibile: un .part valido viene completato con Range
+        self.dest_path = str(dest_path) if dest_path else None
+        self.offset = 0
+
+        partial = self._load_partial()
+        headers = dict(headers or {})
+        if self.dest_path:
+            # iter_content() scrive i byte decodificati: gli offset del .part valgono solo senza compressione
+            headers.setdefault('Accept-Encoding', 'identity')
+        request_headers = dict(headers)
+        if partial:
+            request_headers['Range'] = f"bytes={partial['offset']}-"
+            request_headers['If-Range'] = partial['validator']
+        self.response = session.get(url, stream=True, timeout=timeout, headers=request_headers or None)
+
+        if partial:
+            if self.response.status_code == 206 and self._range_start() == partial['offset']:
+                self.offset = partial['offset']
+                _count(stats, 'resumed')
+                _count(stats, 'resumed_bytes', self.offset)
+            else:
+                # 200: file cambiato o Range ignorato; 416/206 incoerente: il parziale non serve più
+                discard_partial(self.dest_path)
+                if self.response.status_code != 200:
+                    self.close()
+                    self.response = session.get(url, stream=True, timeout=timeout, headers=headers)
+
+        try:
+            self.response.raise_for_status()
+        except Exception:
+            record_rejection(stats, f"http_{self.response.status_code}")
+            metrics.observe_download(session, url, time.perf_counter() - self.started, 0, 0,
+                                     status=self.response.status_code)
+            self.close()
+            raise
+
+        self._chunks = self.response.iter_content(CHUNK_SIZE)
+        if self.offset:
+            # Il tipo si decide sull'inizio del file, già su disco
+            with open(partial_paths(self.dest_path)[0], 'rb') as f:
+                self.head = f.read(SNIFF_BYTES)
+        else:
+            head = b''
+            for chunk in self._chunks:
+                head += chunk
+                if len(head) >= SNIFF_BYTES:
+                    break
+            self.head = head
+        self.kind = sniff(self.head)
+        self.content_type = self.response.headers.get('content-type', '').lower()
+
+    def _load_partial(self):
+        """Parziale riprendibile per dest_path: {'offset', 'validator'} o None"""
+        if not self.dest_path:
+            return None
+        part_path, meta_path = partial_paths(self.dest_path)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            offset = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != self.url or not meta.get('validator') or offset <= 0:
+            discard_partial(self.dest_path)
+            return None
+        return {'offset': offset, 'validator': meta['validator']}
+
+    def _range_start(self):
+        match = _CONTENT_RANGE_RE.match(self.response.headers.get('content-range', ''))
+        return int(match.group(1)) if match else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        """Chiude la connessione senza leggere il resto del corpo"""
+        try:
+            self.response.close()
+        except Exception:
+            pass
+
+    def expect(self, *kinds):
+        """True se il contenuto è di uno dei tipi attesi, altrimenti chiude e registra il motivo"""
+        if self.kind in kinds:
+            return True
+        if self.offset:
+            discard_partial(self.dest_path)
+        self.reject(self.kind)
+        return False
+
+    def reject(self, reason):
+        """Scarta la risposta: chiude subito la connessione e conta il motivo"""
+        record_rejection(self.stats, reason)
+        self.close()
+
+    def save(self, dest_path=None, unchanged_md5=None):
+        """
+        Scrive il corpo in dest_path passando dal file .part (rename atomico).
+        Se il trasferimento si interrompe e la risposta ha un validatore, il .part
+        resta su disco per la ripresa; altrimenti viene eliminato.
+        Se l'MD5 coincide con `unchanged_md5` il file esistente non viene toccato.
+        Restituisce {'path', 'size', 'md5', 'written', 'resumed_from'}.
+        """
+        dest_path = str(dest_path or self.dest_path)
+        if self.offset and dest_path != self.dest_path:
+            raise ValueError('Un download ripreso va salvato nel dest_path indicato alla richiesta')
+        part_path, meta_path = partial_paths(dest_path)
+        hasher = new_hasher(LEGACY_HASH)
+        size = self.offset
+
+        if self.offset:
+            # Riprende l'hash dai byte già scaricati nell'esecuzione precedente
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                    hasher.update(block)
+
+        validator = _validator(self.response) if dest_path == self.dest_path else None
+        if validator:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'url': self.url, 'validator': validator,
+                           'updated_at': datetime.now().isoformat()}, f)
+
+        try:
+            with tracing.span('body', url=self.url) as body_span, open(part_path, 'ab' if self.offset else 'wb') as f:
+                for chunk in self._iter_body():
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    size += len(chunk)
+                body_span.set(bytes=size - self.offset, resumed_from=self.offset)
+        except BaseException:
+            if validator:
+                _count(self.stats, 'interrupted')
+            else:
+                discard_partial(dest_path)
+            raise
+        finally:
+            self.close()
+
+        metrics.observe_download(self.session, self.url, time.perf_counter() - self.started, size - self.offset, size)
+        md5 = hasher.hexdigest()
+        result = {'path': dest_path, 'size': size, 'md5': md5, 'written': True, 'resumed_from': self.offset}
+        if unchanged_md5 is not None and md5 == unchanged_md5:
+            discard_partial(dest_path)
+            result['written'] = False
+            return result
+
+        os.replace(part_path, dest_path)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        return result
+
+    def _iter_body(self):
+        if self.head and not self.offset:
+            yield self.head
+        for chunk in self._chunks:
+            if chunk:
+                yield chunk
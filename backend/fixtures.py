@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Archivio di risposte HTTP registrate per benchmark e prove offline degli scraper
+Un archivio è una cartella con index.json (metodo + URL canonico → stato, header,
+URL finale) e i corpi delle risposte in bodies/, salvati una sola volta per
+contenuto. RecordingAdapter registra le risposte reali mentre lo scraper gira,
+ReplayAdapter le restituisce senza rete; use_adapter() li installa su tutte le
+sessioni requests, comprese requests.get/post usate direttamente dagli scraper.
+Le chiamate all'API VolantinoMix non vengono mai registrate né riprodotte: vanno
+all'API indicata o, se manca, ricevono una risposta minima di successo.
+
+Uso:
+    python fixtures.py list fixtures/negozi
+    python fixtures.py import fixtures/negozi https://www.mersisupermercati.com/volantino/ ../mersi_volantino.html
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import io
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from hashing import STRONG_HASH, hash_bytes
+from url_utils import canonicalize_url
+
+INDEX_FILENAME = 'index.json'
+BODIES_DIRNAME = 'bodies'
+ARCHIVE_VERSION = 1
+
+# Host fittizio dell'API quando il benchmark non ne indica una reale
+STUB_API_BASE = 'http://volantinomix.bench/api'
+
+# Header che non valgono più per il corpo già decompresso salvato nell'archivio
+DROPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'set-cookie', 'connection', 'keep-alive')
+
+
+def request_key(method, url):
+    return f"{method.upper()} {canonicalize_url(url)}"
+
+
+class FixtureArchive:
+    """Cartella con indice JSON delle risposte e corpi deduplicati per SHA-256"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.bodies_dir = os.path.join(self.path, BODIES_DIRNAME)
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.path, INDEX_FILENAME), 'r', encoding='utf-8') as f:
+                return json.load(f).get('entries', {})
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Scrive l'indice su disco (atomicamente)"""
+        os.makedirs(self.path, exist_ok=True)
+        index_file = os.path.join(self.path, INDEX_FILENAME)
+        with self._lock:
+            snapshot = {'version': ARCHIVE_VERSION, 'entries': dict(sorted(self.entries.items()))}
+        tmp_file = f"{index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, index_file)
+
+    def add(self, method, url, status, headers, body, final_url=None, reason=''):
+        """Aggiunge (o sostituisce) la risposta a `method url`"""
+        digest = hash_bytes(body, (STRONG_HASH,))[STRONG_HASH] if body else None
+        if digest:
+            os.makedirs(self.bodies_dir, exist_ok=True)
+            body_path = os.path.join(self.bodies_dir, digest)
+            if not os.path.exists(body_path):
+                with open(body_path, 'wb') as f:
+                    f.write(body)
+        headers = {name.lower(): value for name, value in headers.items() if name.lower() not in DROPPED_HEADERS}
+        if method.upper() != 'HEAD':
+            headers['content-length'] = str(len(body))
+        with self._lock:
+            self.entries[request_key(method, url)] = {
+                'status': status,
+                'reason': reason,
+                'url': final_url or url,
+                'headers': headers,
+                'body': digest,
+                'size': len(body),
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+            }
+
+    def get(self, method, url):
+        """(voce, corpo) registrati per `method url`, oppure (None, b'')"""
+        entry = self.entries.get(request_key(method, url))
+        if entry is None and method.upper() == 'HEAD':
+            # HEAD non registrata: si ricava dalla GET con gli stessi header e senza corpo
+            entry = self.entries.get(request_key('GET', url))
+            return (entry, b'') if entry else (None, b'')
+        if entry is None:
+            return None, b''
+        if not entry['body']:
+            return entry, b''
+        with open(os.path.join(self.bodies_dir, entry['body']), 'rb') as f:
+            return entry, f.read()
+
+
+def stub_api_response(request):
+    """Risposta minima dell'API VolantinoMix: /health ok e upload riusciti"""
+    path = urlsplit(request.url).path
+    if path.endswith('/health'):
+        return 200, {'status': 'OK'}
+    if request.method == 'POST' and path.endswith('/upload'):
+        return 200, {
+            'success': True,
+            'message': 'Upload simulato',
+            'data': {'uploadedFiles': [{'filename': 'benchmark.pdf'}], 'totalFlyersCreated': 1, 'totalDuplicatesSkipped': 0}
+        }
+    return 404, {'success': False, 'message': f'Endpoint non simulato: {path}'}
+
+
+def build_response(request, status, headers, body, url=None, reason='', connection=None):
+    """requests.Response costruita in memoria, leggibile anche in streaming"""
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.raw = io.BytesIO(body)
+    response.url = url or request.url
+    response.request = request
+    response.connection = connection
+    return response
+
+
+class _AdapterBase(BaseAdapter):
+    """Instrada le chiamate all'API (reale o simulata) e conta richieste e byte"""
+
+    def __init__(self, api_base=None):
+        super().__init__()
+        self.api_host = urlsplit(api_base or STUB_API_BASE).netloc
+        self.stub_api = api_base is None
+        self.live = HTTPAdapter()
+        self.stats = {'requests': 0, 'bytes': 0, 'api_requests': 0, 'misses': 0}
+        self.missed_urls = []
+        self._lock = threading.Lock()
+        # Richiamata attorno a ogni richiesta (es. per cronometrare la fase 'http')
+        self.wrap = None
+
+    def _count(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def send(self, request, **kwargs):
+        if urlsplit(request.url).netloc == self.api_host:
+            self._count(api_requests=1)
+            if not self.stub_api:
+                return self.live.send(request, **kwargs)
+            status, payload = stub_api_response(request)
+            body = json.dumps(payload).encode('utf-8')
+            return build_response(request, status, {'content-type': 'application/json', 'content-length': str(len(body))},
+                                  body, connection=self)
+        if self.wrap:
+            with self.wrap():
+                return self._send(request, **kwargs)
+        return self._send(request, **kwargs)
+
+    def _send(self, request, **kwargs):
+        raise NotImplementedError
+
+    def close(self):
+        self.live.close()
+
+
+class RecordingAdapter(_AdapterBase):
+    """Esegue le richieste sulla rete e salva ogni risposta nell'archivio"""
+
+    def __init__(self, archive, api_base=None):
+        super().__init__(api_base)
+        self.archive = archive
+
+    def _send(self, request, **kwargs):
+        response = self.live.send(request, **kwargs)
+        # Il corpo viene letto per intero: iter_content lo riproduce poi dalla memoria
+        body = response.content
+        self.archive.add(request.method, request.url, response.status_code, response.headers, body,
+                         final_url=response.url, reason=response.reason or '')
+        self._count(requests=1, bytes=len(body))
+        return response
+
+
+class ReplayAdapter(_AdapterBase):
+    """Risponde dall'archivio senza rete; le richieste non registrate ricevono 404"""
+
+    def __init__(self, archive, api_base=None):
+        super().__init__(api_base)
+        self.archive = archive
+
+    def _send(self, request, **kwargs):
+        entry, body = self.archive.get(request.method, request.url)
+        if entry is None:
+            with self._lock:
+                self.stats['misses'] += 1
+                self.missed_urls.append(f"{request.method} {request.url}")
+            return build_response(request, 404, {'content-length': '0'}, b'', reason='Not Recorded', connection=self)
+        self._count(requests=1, bytes=len(body))
+        return build_response(request, entry['status'], entry['headers'], body,
+                              reason=entry.get('reason', ''), connection=self)
+
+
+@contextmanager
+def use_adapter(adapter):
+    """Installa `adapter` come trasporto di ogni sessione requests per la durata del blocco"""
+    original = requests.Session.get_adapter
+    requests.Session.get_adapter = lambda session, url: adapter
+    try:
+        yield adapter
+    finally:
+        requests.Session.get_adapter = original
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Archivio di risposte HTTP registrate')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='Elenca le risposte registrate')
+    list_parser.add_argument('archive')
+
+    import_parser = subparsers.add_parser('import', help='Aggiunge un file locale come risposta a una GET')
+    import_parser.add_argument('archive')
+    import_parser.add_argument('url')
+    import_parser.add_argument('file')
+    import_parser.add_argument('--content-type', help='Default: dedotto dall\'estensione (.pdf/.html)')
+
+    args = parser.parse_args()
+    archive = FixtureArchive(args.archive)
+
+    if args.command == 'list':
+        total = 0
+        for key, entry in sorted(archive.entries.items()):
+            total += entry['size']
+            print(f"{entry['status']}  {entry['size']:>10}  {key}")
+        print(f"📦 {len(archive.entries)} risposte, {total / 1024 / 1024:.1f} MB")
+    elif args.command == 'import':
+        with open(args.file, 'rb') as f:
+            body = f.read()
+        content_type = args.content_type or ('application/pdf' if args.file.lower().endswith('.pdf') else 'text/html; charset=utf-8')
+        archive.add('GET', args.url, 200, {'content-type': content_type}, body, reason='OK')
+        archive.save()
+        print(f"✅ {args.url} ← {args.file} ({len(body)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hashing dei file condiviso dagli scraper
+Legge i file via mmap (o a blocchi da 1 MiB), calcola più digest in una sola passata
+(forte: SHA-256, veloce: xxhash se installato, altrimenti BLAKE2b) e permette di
+elaborare molti file in parallelo con un thread pool: hashlib rilascia il GIL sui blocchi grandi.
+HashCache evita di rileggere i file invariati: bastano i metadati di stat().
+
+Uso benchmark:
+    python3 hashing.py bench volantini/ [--workers 4]
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+CHUNK_SIZE = 1024 * 1024
+
+# MD5 resta il default: è il formato di metadata.fileHash lato Node
+LEGACY_HASH = 'md5'
+STRONG_HASH = 'sha256'
+FAST_HASH = 'xxh3_64' if XXHASH_AVAILABLE else 'blake2b'
+
+
+def new_hasher(algorithm):
+    """Crea un oggetto hash per nome (algoritmi hashlib o xxhash)"""
+    if algorithm.startswith('xxh'):
+        if not XXHASH_AVAILABLE:
+            raise ValueError(f"{algorithm} richiede il pacchetto xxhash")
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def _update_all(hashers, data):
+    # Slice di memoryview da 1 MiB: nessuna copia, e hashlib rilascia il GIL sopra i 2 KiB
+    with memoryview(data) as view:
+        for offset in range(0, len(view), CHUNK_SIZE):
+            with view[offset:offset + CHUNK_SIZE] as block:
+                for hasher in hashers:
+                    hasher.update(block)
+
+
+def hash_bytes(data, algorithms=(LEGACY_HASH,)):
+    """Digest esadecimali di un contenuto in memoria"""
+    hashers = [new_hasher(name) for name in algorithms]
+    _update_all(hashers, data)
+    return {name: hasher.hexdigest() for name, hasher in zip(algorithms, hashers)}
+
+
+def hash_file(file_path, algorithms=(LEGACY_HASH,), use_mmap=True):
+    """Digest esadecimali di un file, calcolati in una sola lettura"""
+    hashers = [new_hasher(name) for name in algorithms]
+
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap and size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                _update_all(hashers, mapped)
+        else:
+            buffer = bytearray(CHUNK_SIZE)
+            view = memoryview(buffer)
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                for hasher in hashers:
+                    hasher.update(view[:read])
+
+    return {name: hasher.hexdigest() for name, hasher in zip(algorithms, hashers)}
+
+
+def hash_files(file_paths, algorithms=(LEGACY_HASH,), workers=None):
+    """Hash di molti file in parallelo; restituisce {percorso: {algoritmo: digest}}"""
+    file_paths = list(file_paths)
+    workers = workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda path: hash_file(path, algorithms), file_paths)
+        return dict(zip(file_paths, results))
+
+
+class HashCache:
+    """
+    Cache persistente dei digest indicizzata per (percorso, inode, dimensione, mtime_ns).
+    Se i metadati del file non cambiano il digest viene restituito senza leggere il file;
+    qualsiasi modifica dei metadati invalida automaticamente la voce.
+    """
+
+    def __init__(self, cache_file):
+        self.cache_file = str(cache_file)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Scrive la cache su disco (atomicamente) se è cambiata"""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self.entries)
+            self._dirty = False
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def get(self, file_path, algorithms=(LEGACY_HASH,)):
+        """Digest del file, dalla cache se i metadati non sono cambiati"""
+        key = os.path.abspath(file_path)
+        st = os.stat(key)
+        signature = [st.st_ino, st.st_size, st.st_mtime_ns]
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and entry['signature'] == signature:
+                missing = [name for name in algorithms if name not in entry['digests']]
+                if not missing:
+                    self.hits += 1
+                    return {name: entry['digests'][name] for name in algorithms}
+            else:
+                entry = None
+            self.misses += 1
+
+        digests = hash_file(key, algorithms)
+
+        with self._lock:
+            if entry is not None:
+                entry['digests'].update(digests)
+            else:
+                self.entries[key] = {'signature': signature, 'digests': dict(digests)}
+            self._dirty = True
+        return digests
+
+    def prune(self):
+        """Rimuove le voci dei file che non esistono più"""
+        with self._lock:
+            stale = [key for key in self.entries if not os.path.exists(key)]
+            for key in stale:
+                del self.entries[key]
+            if stale:
+                self._dirty = True
+        return len(stale)
+
+
+def _legacy_md5(file_path):
+    """Implementazione storica degli scraper (blocchi da 4096 byte), solo per confronto"""
+    hash_md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest()
+
+
+def benchmark(folder, workers=None):
+    """Misura il throughput (MB/s) delle varianti su tutti i PDF di una cartella"""
+    paths = [os.path.join(root, name)
+             for root, _, names in os.walk(folder)
+             for name in names if name.lower().endswith('.pdf')]
+    if not paths:
+        print(f"⚠️  Nessun PDF trovato in {folder}")
+        return []
+
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    variants = [
+        ('md5 blocchi 4 KiB (storico)', lambda: [_legacy_md5(p) for p in paths]),
+        ('md5 letture 1 MiB', lambda: [hash_file(p, use_mmap=False) for p in paths]),
+        ('md5 mmap', lambda: [hash_file(p) for p in paths]),
+        (f'{STRONG_HASH}+{FAST_HASH} mmap', lambda: [hash_file(p, (STRONG_HASH, FAST_HASH)) for p in paths]),
+        (f'{FAST_HASH} mmap', lambda: [hash_file(p, (FAST_HASH,)) for p in paths]),
+        (f'{STRONG_HASH}+{FAST_HASH} thread pool', lambda: hash_files(paths, (STRONG_HASH, FAST_HASH), workers)),
+    ]
+
+    print(f"📁 {len(paths)} PDF, {total_bytes / (1024 * 1024):.1f} MB")
+    results = []
+    for label, run in variants:
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        throughput = total_bytes / (1024 * 1024) / elapsed if elapsed else float('inf')
+        results.append({'variant': label, 'seconds': round(elapsed, 3), 'mb_per_s': round(throughput, 1)})
+        print(f"   {label:<40} {elapsed:8.3f}s {throughput:10.1f} MB/s")
+    return results
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Hashing file volantini')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bench_parser = subparsers.add_parser('bench', help='Benchmark di throughput su una cartella di PDF')
+    bench_parser.add_argument('folder', help='Cartella con i PDF')
+    bench_parser.add_argument('--workers', type=int, default=None, help='Thread del pool (default: CPU, max 8)')
+
+    hash_parser = subparsers.add_parser('hash', help='Stampa i digest di uno o più file')
+    hash_parser.add_argument('files', nargs='+')
+    hash_parser.add_argument('--algorithms', default=f'{STRONG_HASH},{FAST_HASH}')
+
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args.folder, args.workers)
+    else:
+        algorithms = tuple(args.algorithms.split(','))
+        for path, digests in hash_files(args.files, algorithms).items():
+            print(path, ' '.join(f"{name}:{digest}" for name, digest in digests.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
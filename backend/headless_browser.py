@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Browser headless per gli scraper basati su Selenium
+Ogni job di scraping è un processo a sé: il browser si avvia quando serve, blocca
+immagini, font, media e fogli di stile e si chiude all'uscita dal context manager.
+wait_for_page_ready sostituisce le attese fisse con l'attesa della rete inattiva.
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import time
+from contextlib import contextmanager
+
+import tracing
+from lazy_imports import is_installed
+
+# Selenium si importa solo quando si avvia davvero un browser
+SELENIUM_AVAILABLE = is_installed('selenium')
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# Conta le fetch/XHR avviate e non ancora concluse in window.__volantinomixInflight.
+# Le voci di performance.getEntriesByType('resource') compaiono solo a richiesta finita:
+# senza contatore una XHR lenta sembrerebbe rete inattiva
+INFLIGHT_TRACKER_JS = """
+(function () {
+    if (window.__volantinomixInflight !== undefined) return;
+    window.__volantinomixInflight = 0;
+    var done = function () { window.__volantinomixInflight = Math.max(window.__volantinomixInflight - 1, 0); };
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function () {
+            window.__volantinomixInflight++;
+            try {
+                return originalFetch.apply(this, arguments).finally(done);
+            } catch (e) {
+                done();
+                throw e;
+            }
+        };
+    }
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        window.__volantinomixInflight++;
+        this.addEventListener('loadend', done, { once: true });
+        try {
+            return originalSend.apply(this, arguments);
+        } catch (e) {
+            this.removeEventListener('loadend', done);
+            done();
+            throw e;
+        }
+    };
+})();
+"""
+
+# Pattern bloccati via CDP (Network.setBlockedURLs): risorse mai usate dagli scraper
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3', '*.ogg',
+    '*.css'
+]
+
+# Preferenze Chrome: 2 = blocca (CSS e font sono bloccati via CDP)
+BLOCKED_CONTENT_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.managed_default_content_settings.media_stream': 2,
+    'profile.managed_default_content_settings.plugins': 2
+}
+
+
+def _build_options(user_agent, block_resources):
+    """Costruisce le opzioni Chrome headless"""
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    # 'eager': driver.get ritorna a DOMContentLoaded, il resto lo attende wait_for_page_ready
+    chrome_options.page_load_strategy = 'eager'
+    chrome_options.add_argument('--headless=new')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--disable-extensions')
+    chrome_options.add_argument('--mute-audio')
+    chrome_options.add_argument(f'--user-agent={user_agent}')
+
+    if block_resources:
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_experimental_option('prefs', BLOCKED_CONTENT_PREFS)
+
+    return chrome_options
+
+
+def _create_driver(user_agent, block_resources):
+    """Avvia un'istanza Chrome"""
+    from selenium import webdriver
+
+    driver = webdriver.Chrome(options=_build_options(user_agent, block_resources))
+
+    # Contatore delle fetch/XHR in corso installato prima degli script della pagina
+    try:
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': INFLIGHT_TRACKER_JS})
+    except Exception as e:
+        print(f"⚠️  Contatore richieste in corso via CDP non disponibile: {e}")
+
+    if block_resources:
+        # Le preferenze non coprono CSS, font e media: li blocchiamo a livello di rete
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+        except Exception as e:
+            print(f"⚠️  Blocco risorse via CDP non disponibile: {e}")
+
+    return driver
+
+
+@contextmanager
+def headless_browser(user_agent=DEFAULT_USER_AGENT, block_resources=True):
+    """Context manager che avvia Chrome headless e lo chiude all'uscita"""
+    if not SELENIUM_AVAILABLE:
+        raise RuntimeError('Selenium non disponibile')
+
+    driver = _create_driver(user_agent, block_resources)
+    try:
+        yield driver
+    finally:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+# Snapshot dello stato di rendering: stato documento, elementi trovati, risorse di rete concluse,
+# fetch/XHR in corso. Senza lo script CDP il contatore si installa qui e vede solo le richieste successive
+PAGE_STATE_JS = INFLIGHT_TRACKER_JS + """
+return [
+    document.readyState,
+    document.querySelectorAll(arguments[0]).length,
+    performance.getEntriesByType('resource').length,
+    window.__volantinomixInflight
+];
+"""
+
+
+@tracing.traced('selenium.wait', arg='selector')
+def wait_for_page_ready(driver, selector, timeout=15, settle=0.75, poll=0.2):
+    """
+    Attende che la pagina sia pronta invece di dormire un tempo fisso.
+
+    La pagina è pronta quando, per almeno `settle` secondi, il numero di elementi
+    `selector` e il numero di richieste di rete concluse restano invariati, nessuna
+    fetch/XHR è in corso (rete inattiva) e il documento ha elementi oppure ha
+    completato il caricamento.
+    `timeout` è il limite massimo di attesa. Restituisce il numero di elementi trovati.
+    """
+    deadline = time.monotonic() + timeout
+    last_state = None
+    stable_since = time.monotonic()
+
+    while True:
+        ready_state, count, resources, inflight = driver.execute_script(PAGE_STATE_JS, selector)
+        now = time.monotonic()
+
+        state = (count, resources, inflight)
+        if state != last_state:
+            last_state = state
+            stable_since = now
+        elif now - stable_since >= settle and not inflight and (count > 0 or ready_state == 'complete'):
+            return count
+
+        if now >= deadline:
+            print(f"⚠️  Timeout attesa rendering ({timeout}s): {count} elementi '{selector}'")
+            return count
+
+        time.sleep(poll)
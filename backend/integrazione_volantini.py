@@ -14,11 +14,15 @@ from datetime import datetime, timedelta
 import time
 from pathlib import Path
 import re
-from scraper_volantini import VolantiniScraper
-from scraper_mersi import MersiVolantiniScraper
+from hashing import LEGACY_HASH, HashCache
+from near_duplicates import NearDuplicateDetector
+from text_similarity import TextDuplicateDetector
+import metrics
+import tracing
+import profiling
 
 class VolantinoMixIntegrator:
-    def __init__(self, api_base_url=None, volantini_folder="volantini"):
+    def __init__(self, api_base_url=None, volantini_folder="volantini", force=False):
         # Auto-detect API URL based on environment
         if api_base_url is None:
             port = os.environ.get('PORT', '3000')
@@ -26,11 +30,23 @@ class VolantinoMixIntegrator:
         self.api_base_url = api_base_url
         self.volantini_folder = volantini_folder
         self.session = requests.Session()
+        # Latenze e byte degli upload per le metriche Prometheus
+        metrics.instrument_session(self.session, 'integrator')
+        tracing.instrument_session(self.session)
+        self.started_at = time.time()
+        # Con force=True carica anche i PDF riconosciuti come duplicati (percettivi o testuali)
+        self.force = force
+        self.hash_cache = None
         self.stats = {
             'processed': 0,
             'uploaded': 0,
             'errors': 0,
-            'skipped': 0
+            'skipped': 0,
+            'near_duplicates': 0,
+            'near_duplicates_flagged': 0,
+            'text_duplicates': 0,
+            'text_duplicates_flagged': 0,
+            'new_versions': 0
         }
         
     def extract_store_info_from_filename(self, filename):
@@ -119,6 +135,7 @@ class VolantinoMixIntegrator:
             }
         }
     
+    @tracing.traced('upload', arg='file')
     def upload_pdf_to_api(self, pdf_path, store_name, category, location):
         """Carica un PDF tramite l'API di upload"""
         try:
@@ -217,6 +234,7 @@ class VolantinoMixIntegrator:
             print(f"❌ Errore generico: {e}")
             return False
     
+    @tracing.traced('source', source='integrator')
     def process_downloaded_pdfs(self):
         """Elabora tutti i PDF scaricati e li carica nel sistema"""
         if not os.path.exists(self.volantini_folder):
@@ -232,11 +250,43 @@ class VolantinoMixIntegrator:
         print(f"📁 Trovati {len(pdf_files)} PDF da elaborare")
         print("-" * 50)
         
+        # I digest dei file invariati arrivano dalla cache: solo stat(), nessuna lettura
+        self.hash_cache = HashCache(os.path.join(self.volantini_folder, '.hash_cache.json'))
+        # Lo stesso volantino può arrivare ricodificato da fonti diverse: confronto percettivo
+        near_duplicates = NearDuplicateDetector()
+        text_duplicates = TextDuplicateDetector()
+        
         for pdf_file in pdf_files:
             self.stats['processed'] += 1
             pdf_path = os.path.join(self.volantini_folder, pdf_file)
             
             try:
+                file_hash = self.hash_cache.get(pdf_path)[LEGACY_HASH]
+                
+                hashes, match = near_duplicates.check(pdf_path)
+                if match and near_duplicates.skip and not self.force:
+                    print(f"🔁 Quasi-duplicato di {match[0]} (distanza {match[1]:.1f}): {pdf_file}")
+                    self.stats['near_duplicates'] += 1
+                    continue
+                if match:
+                    # Soglia non ancora tarata: il match viene segnalato, l'upload prosegue
+                    print(f"🔁 NEAR_DUPLICATE {pdf_file} ~ {match[0]} (distanza {match[1]:.1f}), upload comunque")
+                    self.stats['near_duplicates_flagged'] += 1
+                
+                # Copie degli aggregatori: stesso testo anche con pagine o copertina diverse
+                signature, outcome, text_match = text_duplicates.classify(pdf_path)
+                if outcome == 'duplicate' and text_duplicates.skip and not self.force:
+                    print(f"🔁 Duplicato testuale di {text_match[0]} (Jaccard {text_match[1]:.2f}): {pdf_file}")
+                    self.stats['text_duplicates'] += 1
+                    continue
+                if outcome == 'duplicate':
+                    # Come per i quasi duplicati: il match viene segnalato, l'upload prosegue
+                    print(f"🔁 TEXT_DUPLICATE {pdf_file} ~ {text_match[0]} (Jaccard {text_match[1]:.2f}), upload comunque")
+                    self.stats['text_duplicates_flagged'] += 1
+                if outcome == 'new_version':
+                    print(f"🆕 Nuova versione di {text_match[0]} (Jaccard {text_match[1]:.2f}): {pdf_file}")
+                    self.stats['new_versions'] += 1
+                
                 # Estrai informazioni dal nome file
                 store_name = self.extract_store_info_from_filename(pdf_file)
                 category = self.determine_category_from_store(store_name)
@@ -262,6 +312,9 @@ class VolantinoMixIntegrator:
                 
                 if success:
                     self.stats['uploaded'] += 1
+                    near_duplicates.register(os.path.abspath(pdf_path), hashes, source='integrazione', md5=file_hash)
+                    text_duplicates.register(os.path.abspath(pdf_path), signature, source='integrazione', md5=file_hash,
+                                             previous_version=text_match[0] if outcome == 'new_version' else None)
                 else:
                     self.stats['errors'] += 1
                 
@@ -272,6 +325,7 @@ class VolantinoMixIntegrator:
                 print(f"❌ Errore nell'elaborazione di {pdf_file}: {e}")
                 self.stats['errors'] += 1
         
+        self.hash_cache.save()
         self.print_integration_summary()
     
     def print_integration_summary(self):
@@ -283,8 +337,12 @@ class VolantinoMixIntegrator:
         print(f"✅ PDF caricati con successo: {self.stats['uploaded']}")
         print(f"⏭️  PDF saltati: {self.stats['skipped']}")
         print(f"⚠️ Duplicati saltati: {self.stats.get('duplicates', 0)}")
+        print(f"🔁 Quasi-duplicati segnalati: {self.stats['near_duplicates_flagged']}, saltati: {self.stats['near_duplicates']}")
+        print(f"🔁 Duplicati testuali segnalati: {self.stats['text_duplicates_flagged']}, saltati: {self.stats['text_duplicates']}")
+        print(f"🆕 Nuove versioni di volantini esistenti: {self.stats['new_versions']}")
         print(f"❌ Errori: {self.stats['errors']}")
         print(f"🌐 API endpoint: {self.api_base_url}")
+        metrics.finish_run('integrator', self.stats, self.started_at)
         
         # Salva statistiche
         stats_file = os.path.join(self.volantini_folder, 'integration_stats.json')
@@ -314,8 +372,12 @@ class VolantinoMixIntegrator:
             print(f"❌ Impossibile connettersi all'API: {e}")
             return False
 
-def run_complete_workflow():
+def run_complete_workflow(force=False):
     """Esegue il workflow completo: scraping + integrazione"""
+    # Gli scraper servono solo con --full: la sola integrazione non li importa
+    from scraper_volantini import VolantiniScraper
+    from scraper_mersi import MersiVolantiniScraper
+    
     print("🚀 AVVIO WORKFLOW COMPLETO VOLANTINOMIX")
     print("=" * 50)
     
@@ -335,7 +397,7 @@ def run_complete_workflow():
     print("\n🔗 FASE 2: INTEGRAZIONE CON VOLANTINOMIX")
     print("-" * 40)
     
-    integrator = VolantinoMixIntegrator()
+    integrator = VolantinoMixIntegrator(force=force)
     
     # Testa connessione API
     if not integrator.test_api_connection():
@@ -349,20 +411,26 @@ def run_complete_workflow():
 
 def main():
     """Funzione principale"""
-    import sys
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Integrazione dei volantini scaricati con VolantinoMix')
+    parser.add_argument('--full', action='store_true', help='Workflow completo: scraping e poi integrazione')
+    parser.add_argument('--force', action='store_true', help='Carica anche i PDF riconosciuti come duplicati')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
     
-    if len(sys.argv) > 1 and sys.argv[1] == '--full':
+    if args.full:
         # Workflow completo
-        run_complete_workflow()
+        profiling.run_profiled(args.profile, 'integrator-full', run_complete_workflow, force=args.force)
     else:
         # Solo integrazione
         print("🔗 INTEGRAZIONE VOLANTINI CON VOLANTINOMIX")
         print("=" * 45)
         
-        integrator = VolantinoMixIntegrator()
+        integrator = VolantinoMixIntegrator(force=args.force)
         
         if integrator.test_api_connection():
-            integrator.process_downloaded_pdfs()
+            profiling.run_profiled(args.profile, 'integrator', integrator.process_downloaded_pdfs)
         else:
             print("❌ Assicurati che il server VolantinoMix sia in esecuzione")
 
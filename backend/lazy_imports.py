@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import differiti delle dipendenze pesanti (numpy, PyMuPDF)
+Gli scraper girano come un processo per job: i moduli usati solo su alcuni
+percorsi (deduplica dei PDF) non devono pesare sull'avvio di ogni job.
+lazy_module() verifica subito che il modulo sia installato, senza importarlo,
+e lo carica al primo accesso a un suo attributo (importlib.util.LazyLoader).
+
+Uso:
+    np = lazy_module('numpy')                  # None se non installato
+    fitz = lazy_module('pymupdf', 'fitz')      # il primo disponibile
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import sys
+import importlib.util
+
+
+def lazy_module(*names):
+    """Primo dei moduli indicati che risulta installato, caricato al primo utilizzo; None se nessuno"""
+    for name in names:
+        if name in sys.modules:
+            return sys.modules[name]
+        try:
+            spec = importlib.util.find_spec(name)
+        except (ImportError, ValueError):
+            spec = None
+        if spec is None or spec.loader is None:
+            continue
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
+    return None
+
+
+def is_installed(name):
+    """True se il pacchetto è importabile, senza importarlo"""
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
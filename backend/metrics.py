@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metriche degli scraper in formato testo Prometheus
+Contatori, gauge e istogrammi di latenza etichettati per fonte, host e fase
+(fetch delle pagine, download dei volantini, upload verso l'API). Gli scraper
+sono processi brevi: a fine esecuzione export_run() somma le metriche del run a
+quelle cumulative della fonte (<dir>/<fonte>.json) e riscrive <dir>/<fonte>.prom,
+pronto per il textfile collector di node_exporter. Il processo residente
+(/metrics del server Node, che unisce i file .prom, oppure `python metrics.py serve`)
+espone tutte le fonti.
+
+Uso:
+    python metrics.py show                  # metriche cumulative di tutte le fonti
+    python metrics.py serve --port 9108     # esposizione HTTP su /metrics
+    python metrics.py check                 # le richieste vengono registrate anche col tracing attivo
+Lo storico per run (confronti e trend settimanali) è in metrics_store.py.
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+
+# Accanto al modulo, indipendente dalla cwd; un percorso relativo in METRICS_TEXTFILE_DIR
+# si risolve dalla cartella backend, come in utils/prometheusTextfiles.js
+DEFAULT_TEXTFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    os.environ.get('METRICS_TEXTFILE_DIR', 'metrics'))
+
+# Limiti superiori dei bucket (secondi e byte)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(7))  # 64 KB … 256 MB
+
+# Chiavi delle statistiche di esecuzione riportate come volantini per esito
+RESULT_KEYS = ('found', 'downloaded', 'skipped', 'errors', 'uploaded', 'duplicates')
+
+# Singole richieste del run corrente (fase, host, secondi, byte, stato, inizio epoch) per lo storico di metrics_store
+_run_requests = []
+_run_requests_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etichette attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(suffisso, etichette extra, valori etichette, valore)] in formato Prometheus"""
+        with self._lock:
+            return [('', (), key, value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, extra, key, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_number(value)}")
+        return '\n'.join(lines)
+
+    def state(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, state):
+        """Somma (o, per le gauge, sostituisce) i valori salvati di un run precedente"""
+        with self._lock:
+            for key, value in state:
+                key = tuple(key)
+                if key in self.values and self.kind != 'gauge':
+                    self.values[key] = self._add(value, self.values[key])
+                else:
+                    self.values[key] = value
+
+    @staticmethod
+    def _add(a, b):
+        return a + b
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self.values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    @staticmethod
+    def _add(a, b):
+        return {'buckets': [x + y for x, y in zip(a['buckets'], b['buckets'])],
+                'sum': a['sum'] + b['sum'], 'count': a['count'] + b['count']}
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, entry in sorted(self.values.items()):
+                # I bucket sono già cumulativi: ogni osservazione conta in tutti quelli con limite >= valore
+                for bound, count in zip(self.buckets, entry['buckets']):
+                    samples.append(('_bucket', (('le', _format_number(float(bound))),), key, count))
+                samples.append(('_bucket', (('le', '+Inf'),), key, entry['count']))
+                samples.append(('_sum', (), key, entry['sum']))
+                samples.append(('_count', (), key, entry['count']))
+        return samples
+
+
+class Registry:
+    """Insieme di metriche con nome univoco"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Tutte le metriche con almeno un valore, in formato testo Prometheus 0.0.4"""
+        blocks = [metric.render() for name, metric in sorted(self.metrics.items()) if metric.values]
+        return '\n'.join(blocks) + '\n' if blocks else ''
+
+    def state(self):
+        return {name: metric.state() for name, metric in self.metrics.items() if metric.values}
+
+    def merge(self, state):
+        for name, values in state.items():
+            if name in self.metrics:
+                self.metrics[name].merge(values)
+
+    def empty_copy(self):
+        """Registro con le stesse metriche e nessun valore"""
+        copy = Registry()
+        for metric in self.metrics.values():
+            kwargs = {'buckets': metric.buckets} if isinstance(metric, Histogram) else {}
+            copy._register(type(metric), metric.name, metric.documentation, metric.labelnames, **kwargs)
+        return copy
+
+    def clear(self):
+        for metric in self.metrics.values():
+            with metric._lock:
+                metric.values.clear()
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'volantinomix_request_duration_seconds',
+    'Durata delle richieste HTTP per fase (fetch pagine, probe HEAD, download volantini, upload API)',
+    ('source', 'host', 'stage'))
+REQUEST_BYTES = REGISTRY.counter(
+    'volantinomix_request_bytes_total', 'Byte ricevuti (fetch, probe, download) o inviati (upload)',
+    ('source', 'host', 'stage'))
+REQUEST_ERRORS = REGISTRY.counter(
+    'volantinomix_request_errors_total', 'Risposte HTTP con stato >= 400', ('source', 'host', 'stage'))
+FLYER_BYTES = REGISTRY.histogram(
+    'volantinomix_flyer_bytes', 'Dimensione dei volantini scaricati', ('source',), buckets=SIZE_BUCKETS)
+FLYERS = REGISTRY.counter(
+    'volantinomix_flyers_total', 'Volantini per esito (found, downloaded, skipped, errors, uploaded)',
+    ('source', 'result'))
+RUN_SECONDS = REGISTRY.gauge(
+    'volantinomix_run_duration_seconds', 'Durata dell\'ultima esecuzione dello scraper', ('source',))
+LAST_RUN = REGISTRY.gauge(
+    'volantinomix_last_run_timestamp_seconds', 'Fine dell\'ultima esecuzione (epoch)', ('source',))
+
+
+def _host(url):
+    return urlsplit(url).netloc or 'unknown'
+
+
+def _body_size(request):
+    body = request.body
+    if body is None:
+        return 0
+    return len(body) if isinstance(body, (bytes, str)) else int(request.headers.get('content-length', 0))
+
+
+def _sample(stage, host, seconds, size, status):
+    # Chiamata a richiesta conclusa: l'inizio si ricava dalla durata
+    started = time.time() - seconds
+    with _run_requests_lock:
+        _run_requests.append((stage, host, seconds, size, status, started))
+
+
+def take_requests():
+    """Richieste registrate dall'inizio del run (o dall'ultima chiamata), svuotando l'elenco"""
+    with _run_requests_lock:
+        samples = list(_run_requests)
+        _run_requests.clear()
+    return samples
+
+
+def instrument_session(session, source):
+    """
+    Registra le richieste della sessione: POST come 'upload', GET non in streaming
+    come 'fetch' (pagine), gli altri metodi (HEAD di verifica) come 'probe'.
+    I GET in streaming sono i download dei volantini e vengono misurati da
+    downloads.StreamedDownload, che conosce i byte effettivi.
+    """
+    session.metrics_source = source
+
+    def on_response(response, *args, **kwargs):
+        request = response.request
+        stage = {'POST': 'upload', 'GET': 'fetch'}.get(request.method, 'probe')
+        if stage == 'fetch' and kwargs.get('stream'):
+            return response
+        host = _host(request.url)
+        seconds = response.elapsed.total_seconds()
+        if stage == 'fetch':
+            # Il corpo verrebbe letto subito dopo l'hook: leggerlo qui misura anche il trasferimento
+            started = time.perf_counter()
+            size = len(response.content)
+            seconds += time.perf_counter() - started
+        else:
+            size = _body_size(request)
+        REQUEST_SECONDS.observe(seconds, source=source, host=host, stage=stage)
+        REQUEST_BYTES.inc(size, source=source, host=host, stage=stage)
+        _sample(stage, host, seconds, size, response.status_code)
+        if response.status_code >= 400:
+            REQUEST_ERRORS.inc(source=source, host=host, stage=stage)
+        return response
+
+    session.hooks['response'].append(on_response)
+    return session
+
+
+def observe_download(session, url, seconds, transferred, size, status=200):
+    """Download di un volantino da una sessione strumentata (altrimenti non fa nulla)"""
+    source = getattr(session, 'metrics_source', None)
+    if not source:
+        return
+    host = _host(url)
+    REQUEST_SECONDS.observe(seconds, source=source, host=host, stage='download')
+    REQUEST_BYTES.inc(transferred, source=source, host=host, stage='download')
+    _sample('download', host, seconds, transferred, status)
+    if status >= 400:
+        REQUEST_ERRORS.inc(source=source, host=host, stage='download')
+    else:
+        FLYER_BYTES.observe(size, source=source)
+
+
+def record_run(source, stats, duration=None):
+    """Esiti dei volantini (dalle statistiche dello scraper) e durata dell'esecuzione"""
+    for key in RESULT_KEYS:
+        value = stats.get(key)
+        if isinstance(value, (int, float)) and value:
+            FLYERS.inc(value, source=source, result=key)
+    for reason, count in (stats.get('rejected') or {}).items():
+        FLYERS.inc(count, source=source, result=f"rejected_{reason}")
+    if duration is not None:
+        RUN_SECONDS.set(round(duration, 3), source=source)
+    LAST_RUN.set(round(time.time(), 3), source=source)
+
+
+def export_run(source, registry=REGISTRY, textfile_dir=DEFAULT_TEXTFILE_DIR):
+    """
+    Somma il run corrente alle metriche cumulative della fonte e riscrive <fonte>.prom
+    (atomicamente, come richiesto dal textfile collector). Restituisce il percorso.
+    """
+    os.makedirs(textfile_dir, exist_ok=True)
+    state_file = os.path.join(textfile_dir, f"{source}.json")
+    prom_file = os.path.join(textfile_dir, f"{source}.prom")
+
+    cumulative = registry.empty_copy()
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            cumulative.merge(json.load(f))
+    except (OSError, ValueError):
+        pass
+    cumulative.merge(registry.state())
+
+    for path, content in ((state_file, json.dumps(cumulative.state())), (prom_file, cumulative.render())):
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_file, path)
+    registry.clear()
+    return prom_file
+
+
+def finish_run(source, stats, started=None):
+    """Fine esecuzione di uno scraper: registra gli esiti, esporta e salva il run nello storico; mai bloccante"""
+    duration = None if started is None else time.time() - started
+    try:
+        record_run(source, stats, duration)
+        export_run(source)
+    except Exception as e:
+        print(f"⚠️  Esportazione metriche fallita: {e}")
+    try:
+        import metrics_store
+        metrics_store.record_run(source, stats, take_requests(), started, duration)
+    except Exception as e:
+        print(f"⚠️  Salvataggio storico metriche fallito: {e}")
+
+
+def collect(textfile_dir=DEFAULT_TEXTFILE_DIR):
+    """
+    Metriche cumulative di tutte le fonti in un unico testo Prometheus: i file .prom
+    non si possono concatenare (HELP/TYPE ripetuti), quindi si uniscono gli stati JSON
+    """
+    combined = REGISTRY.empty_copy()
+    try:
+        names = sorted(name for name in os.listdir(textfile_dir) if name.endswith('.json'))
+    except OSError:
+        return ''
+    for name in names:
+        try:
+            with open(os.path.join(textfile_dir, name), 'r', encoding='utf-8') as f:
+                combined.merge(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return combined.render()
+
+
+def serve(port, host='0.0.0.0', textfile_dir=DEFAULT_TEXTFILE_DIR):
+    """Espone le metriche di tutte le fonti su http://host:port/metrics (bloccante)"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = collect(textfile_dir).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"📊 Metriche su http://{host}:{port}/metrics (da {textfile_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def self_check():
+    """
+    GET verso un server locale da una sessione strumentata per metriche e tracing,
+    con il tracing attivo: la richiesta deve finire nelle metriche come 'fetch'
+    e nel trace come span HTTP. Restituisce True se entrambe le cose avvengono.
+    """
+    import requests
+    import tracing
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    body = b'volantinomix' * 1024
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    class SpanNames:
+        def __init__(self):
+            self.names = []
+
+        def span_started(self, span):
+            pass
+
+        def span_ended(self, span):
+            self.names.append(span.name)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    listener = SpanNames()
+    tracing.TRACER.listeners.append(listener)
+    try:
+        session = requests.Session()
+        instrument_session(session, 'self-check')
+        tracing.instrument_session(session)
+        take_requests()
+        session.get(f"http://127.0.0.1:{server.server_address[1]}/", timeout=10)
+        fetches = [sample for sample in take_requests() if sample[0] == 'fetch']
+    finally:
+        tracing.TRACER.listeners.remove(listener)
+        server.shutdown()
+        server.server_close()
+
+    ok = True
+    if not fetches or fetches[0][3] != len(body):
+        print(f"❌ Richiesta non registrata nelle metriche con il tracing attivo: {fetches}")
+        ok = False
+    if 'HTTP GET' not in listener.names:
+        print(f"❌ Richiesta non tracciata: {listener.names}")
+        ok = False
+    if ok:
+        print(f"✅ Metriche e tracing registrano la richiesta ({fetches[0][3]} byte, {fetches[0][2]:.3f}s)")
+    return ok
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Metriche Prometheus degli scraper VolantinoMix')
+    parser.add_argument('--dir', default=DEFAULT_TEXTFILE_DIR, help='Cartella delle metriche esportate')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('show', help='Stampa le metriche cumulative')
+
+    serve_parser = subparsers.add_parser('serve', help='Espone le metriche via HTTP')
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=int(os.environ.get('METRICS_PORT', 9108)))
+
+    subparsers.add_parser('check', help='Verifica che le richieste siano registrate anche con il tracing attivo')
+
+    args = parser.parse_args()
+    if args.command == 'show':
+        print(collect(args.dir), end='')
+    elif args.command == 'serve':
+        serve(args.port, args.host, args.dir)
+    elif args.command == 'check':
+        if not self_check():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Storico delle esecuzioni degli scraper su SQLite
+metrics.finish_run() salva qui ogni run: durata, pagine scaricate, byte, volantini
+nuovi/duplicati/in errore e latenza p50/p95 dei fetch, più le singole richieste
+(fase, host, secondi, byte, stato, inizio). Le metriche Prometheus di metrics.py sono
+cumulative; qui si confrontano run specifici e si seguono i trend settimanali.
+Nel trend "rete" è il tempo con almeno una richiesta HTTP in corso (lato retailer/API,
+unione degli intervalli: le richieste concorrenti non si sommano),
+"nostro" il resto della durata (parsing, PDF, attese): se sale la p95 dei fetch
+è il retailer a rallentare, se sale il tempo nostro siamo noi.
+
+Uso:
+    python metrics_store.py runs --source lidl-site
+    python metrics_store.py compare 41 57                 # due run qualsiasi
+    python metrics_store.py compare --source eurospin     # ultimi due run della fonte
+    python metrics_store.py trend --weeks 8
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import sys
+import time
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+
+import metrics
+
+DEFAULT_DB_FILE = os.environ.get('METRICS_DB', os.path.join(metrics.DEFAULT_TEXTFILE_DIR, 'runs.sqlite3'))
+# Le singole richieste servono per percentili esatti e dettaglio per host; i run restano per sempre
+REQUEST_RETENTION_DAYS = int(os.environ.get('METRICS_REQUEST_RETENTION_DAYS', 180))
+DUPLICATE_KEYS = ('duplicates', 'near_duplicates', 'text_duplicates')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    started_at REAL,
+    finished_at REAL NOT NULL,
+    duration REAL,
+    pages INTEGER NOT NULL DEFAULT 0,
+    downloads INTEGER NOT NULL DEFAULT 0,
+    uploads INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    network_seconds REAL NOT NULL DEFAULT 0,
+    request_errors INTEGER NOT NULL DEFAULT 0,
+    flyers_found INTEGER NOT NULL DEFAULT 0,
+    flyers_new INTEGER NOT NULL DEFAULT 0,
+    flyers_duplicate INTEGER NOT NULL DEFAULT 0,
+    flyers_error INTEGER NOT NULL DEFAULT 0,
+    fetch_p50 REAL,
+    fetch_p95 REAL
+);
+CREATE INDEX IF NOT EXISTS runs_source_time ON runs (source, finished_at);
+CREATE TABLE IF NOT EXISTS requests (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    host TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    bytes INTEGER NOT NULL,
+    status INTEGER,
+    started REAL
+);
+CREATE INDEX IF NOT EXISTS requests_run ON requests (run_id);
+"""
+
+# (colonna, etichetta, formato) nell'ordine delle tabelle di confronto
+COLUMNS = (
+    ('duration', 'Durata (s)', '{:.2f}'),
+    ('network_seconds', 'Rete (s)', '{:.2f}'),
+    ('own_seconds', 'Nostro (s)', '{:.2f}'),
+    ('pages', 'Pagine', '{:d}'),
+    ('downloads', 'Download', '{:d}'),
+    ('uploads', 'Upload', '{:d}'),
+    ('megabytes', 'MB', '{:.2f}'),
+    ('fetch_p50', 'Fetch p50 (s)', '{:.3f}'),
+    ('fetch_p95', 'Fetch p95 (s)', '{:.3f}'),
+    ('request_errors', 'Errori HTTP', '{:d}'),
+    ('flyers_found', 'Volantini trovati', '{:d}'),
+    ('flyers_new', 'Nuovi', '{:d}'),
+    ('flyers_duplicate', 'Duplicati', '{:d}'),
+    ('flyers_error', 'Errori', '{:d}'),
+)
+
+
+def percentile(values, q):
+    """Percentile q (0-100) con interpolazione lineare; None senza valori"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _count(value):
+    """Le statistiche degli scraper riportano gli errori come numero o come elenco"""
+    if isinstance(value, (list, tuple, dict)):
+        return len(value)
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def connect(db_file=DEFAULT_DB_FILE):
+    directory = os.path.dirname(db_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Più scraper possono chiudere il run insieme: si attende il lock invece di fallire
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.executescript(SCHEMA)
+    # Database creati prima della colonna con l'inizio delle richieste
+    if 'started' not in {row['name'] for row in conn.execute('PRAGMA table_info(requests)')}:
+        conn.execute('ALTER TABLE requests ADD COLUMN started REAL')
+    return conn
+
+
+def network_seconds(requests):
+    """Tempo coperto da almeno una richiesta: unione degli intervalli [inizio, inizio + durata]"""
+    intervals = sorted((started, started + seconds) for _, _, seconds, _, _, started in requests)
+    total = 0.0
+    current_start = current_end = None
+    for start, end in intervals:
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def record_run(source, stats, requests, started=None, duration=None, db_file=DEFAULT_DB_FILE):
+    """
+    Salva un run: `stats` sono le statistiche passate a metrics.finish_run,
+    `requests` le tuple (fase, host, secondi, byte, stato, inizio) di metrics.take_requests().
+    Le pagine sono i soli GET 'fetch': le HEAD di verifica sono registrate come 'probe'.
+    Restituisce l'id del run.
+    """
+    finished = time.time()
+    fetch_seconds = [seconds for stage, _, seconds, *_ in requests if stage == 'fetch']
+    stages = defaultdict(int)
+    for stage, *_ in requests:
+        stages[stage] += 1
+    row = {
+        'source': source,
+        'started_at': started,
+        'finished_at': finished,
+        'duration': duration,
+        'pages': stages['fetch'],
+        'downloads': stages['download'],
+        'uploads': stages['upload'],
+        'bytes': sum(size for stage, _, _, size, *_ in requests if stage != 'upload'),
+        'network_seconds': network_seconds(requests),
+        'request_errors': sum(1 for _, _, _, _, status, _ in requests if status and status >= 400),
+        'flyers_found': _count(stats.get('found')),
+        'flyers_new': _count(stats.get('uploaded', stats.get('downloaded'))),
+        'flyers_duplicate': sum(_count(stats.get(key)) for key in DUPLICATE_KEYS),
+        'flyers_error': _count(stats.get('errors')),
+        'fetch_p50': percentile(fetch_seconds, 50),
+        'fetch_p95': percentile(fetch_seconds, 95),
+    }
+    conn = connect(db_file)
+    try:
+        with conn:
+            cursor = conn.execute(
+                f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})", tuple(row.values()))
+            run_id = cursor.lastrowid
+            conn.executemany('INSERT INTO requests (run_id, stage, host, seconds, bytes, status, started) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             [(run_id, *request) for request in requests])
+            conn.execute('DELETE FROM requests WHERE run_id IN (SELECT id FROM runs WHERE finished_at < ?)',
+                         (finished - REQUEST_RETENTION_DAYS * 86400,))
+    finally:
+        conn.close()
+    return run_id
+
+
+def _derived(run):
+    run = dict(run)
+    duration = run.get('duration')
+    run['own_seconds'] = None if duration is None else max(duration - run['network_seconds'], 0)
+    run['megabytes'] = run['bytes'] / 1024 / 1024
+    return run
+
+
+def _format(value, fmt):
+    if value is None:
+        return '-'
+    return fmt.format(int(value) if fmt == '{:d}' else value)
+
+
+def _when(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+
+def list_runs(conn, source=None, limit=20):
+    query = 'SELECT * FROM runs'
+    params = ()
+    if source:
+        query += ' WHERE source = ?'
+        params = (source,)
+    query += ' ORDER BY id DESC LIMIT ?'
+    return [_derived(row) for row in conn.execute(query, params + (limit,))]
+
+
+def host_latencies(conn, run_id):
+    """Latenza p50/p95 dei fetch per host di un run: {host: (richieste, p50, p95)}"""
+    by_host = defaultdict(list)
+    for row in conn.execute("SELECT host, seconds FROM requests WHERE run_id = ? AND stage = 'fetch'", (run_id,)):
+        by_host[row['host']].append(row['seconds'])
+    return {host: (len(values), percentile(values, 50), percentile(values, 95)) for host, values in by_host.items()}
+
+
+def compare_runs(conn, run_a, run_b):
+    """Stampa i due run affiancati con la variazione percentuale"""
+    runs = {row['id']: _derived(row) for row in conn.execute('SELECT * FROM runs WHERE id IN (?, ?)', (run_a, run_b))}
+    missing = [run_id for run_id in (run_a, run_b) if run_id not in runs]
+    if missing:
+        raise ValueError(f"Run non trovati: {', '.join(map(str, missing))}")
+    a, b = runs[run_a], runs[run_b]
+    print(f"📊 Run {run_a} ({a['source']}, {_when(a['finished_at'])})  →  run {run_b} ({b['source']}, {_when(b['finished_at'])})")
+    print(f"{'Metrica':<20} {'A':>12} {'B':>12} {'Variazione':>11}")
+    for column, label, fmt in COLUMNS:
+        before, after = a[column], b[column]
+        change = ''
+        if before and after is not None:
+            change = f"{(after - before) / before * 100:+.1f}%"
+        print(f"{label:<20} {_format(before, fmt):>12} {_format(after, fmt):>12} {change:>11}")
+
+    hosts_a, hosts_b = host_latencies(conn, run_a), host_latencies(conn, run_b)
+    if hosts_a or hosts_b:
+        print("\nFetch per host (richieste, p50/p95 s):")
+        for host in sorted(set(hosts_a) | set(hosts_b)):
+            cells = []
+            for hosts in (hosts_a, hosts_b):
+                count, p50, p95 = hosts.get(host, (0, None, None))
+                cells.append(f"{count:>4}  {_format(p50, '{:.3f}')}/{_format(p95, '{:.3f}')}")
+            print(f"  {host:<40} {cells[0]:>20}   {cells[1]:>20}")
+
+
+def weekly_trend(conn, source=None, weeks=8):
+    """Righe per fonte e settimana ISO (dalla più vecchia) con medie dei run e percentili esatti dei fetch"""
+    since = time.time() - weeks * 7 * 86400
+    query = 'SELECT * FROM runs WHERE finished_at >= ?'
+    params = (since,)
+    if source:
+        query += ' AND source = ?'
+        params += (source,)
+    groups = defaultdict(list)
+    for row in conn.execute(query + ' ORDER BY finished_at', params):
+        year, week, _ = datetime.fromtimestamp(row['finished_at']).isocalendar()
+        groups[(row['source'], f"{year}-W{week:02d}")].append(_derived(row))
+
+    latencies = defaultdict(list)
+    request_query = ("SELECT r.source, r.finished_at, q.seconds FROM requests q JOIN runs r ON r.id = q.run_id "
+                     "WHERE q.stage = 'fetch' AND r.finished_at >= ?")
+    if source:
+        request_query += ' AND r.source = ?'
+    for row in conn.execute(request_query, params):
+        year, week, _ = datetime.fromtimestamp(row['finished_at']).isocalendar()
+        latencies[(row['source'], f"{year}-W{week:02d}")].append(row['seconds'])
+
+    def mean(runs, column):
+        values = [run[column] for run in runs if run[column] is not None]
+        return sum(values) / len(values) if values else None
+
+    trend = []
+    for (run_source, week), runs in sorted(groups.items()):
+        samples = latencies.get((run_source, week))
+        trend.append({
+            'source': run_source,
+            'week': week,
+            'runs': len(runs),
+            'duration': mean(runs, 'duration'),
+            'network_seconds': mean(runs, 'network_seconds'),
+            'own_seconds': mean(runs, 'own_seconds'),
+            'pages': mean(runs, 'pages'),
+            'megabytes': sum(run['megabytes'] for run in runs),
+            # Richieste già eliminate dalla retention: media dei percentili dei singoli run
+            'fetch_p50': percentile(samples, 50) if samples else mean(runs, 'fetch_p50'),
+            'fetch_p95': percentile(samples, 95) if samples else mean(runs, 'fetch_p95'),
+            'flyers_new': sum(run['flyers_new'] for run in runs),
+            'flyers_duplicate': sum(run['flyers_duplicate'] for run in runs),
+            'flyers_error': sum(run['flyers_error'] for run in runs),
+        })
+    return trend
+
+
+def print_trend(trend):
+    header = (f"{'Fonte':<16} {'Settimana':<9} {'Run':>4} {'Durata':>8} {'Rete':>8} {'Nostro':>8} "
+              f"{'Pagine':>7} {'MB':>8} {'p50':>7} {'p95':>7} {'Nuovi':>6} {'Dup':>5} {'Err':>5}")
+    print(header)
+    print('-' * len(header))
+    previous = None
+    for row in trend:
+        if previous and previous != row['source']:
+            print()
+        previous = row['source']
+        print(f"{row['source']:<16} {row['week']:<9} {row['runs']:>4} "
+              f"{_format(row['duration'], '{:.1f}'):>8} {_format(row['network_seconds'], '{:.1f}'):>8} "
+              f"{_format(row['own_seconds'], '{:.1f}'):>8} {_format(row['pages'], '{:.1f}'):>7} "
+              f"{row['megabytes']:>8.1f} {_format(row['fetch_p50'], '{:.3f}'):>7} {_format(row['fetch_p95'], '{:.3f}'):>7} "
+              f"{row['flyers_new']:>6} {row['flyers_duplicate']:>5} {row['flyers_error']:>5}")
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Storico delle esecuzioni degli scraper VolantinoMix')
+    parser.add_argument('--db', default=DEFAULT_DB_FILE, help=f'Database SQLite (default: {DEFAULT_DB_FILE})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    runs_parser = subparsers.add_parser('runs', help='Elenca gli ultimi run')
+    runs_parser.add_argument('--source', help='Solo questa fonte')
+    runs_parser.add_argument('--limit', type=int, default=20)
+
+    compare_parser = subparsers.add_parser('compare', help='Confronta due run')
+    compare_parser.add_argument('run_ids', nargs='*', type=int, metavar='RUN_ID',
+                                help='Due id di run (default: gli ultimi due, della fonte se indicata)')
+    compare_parser.add_argument('--source', help='Fonte per scegliere gli ultimi due run')
+
+    trend_parser = subparsers.add_parser('trend', help='Trend settimanale per fonte')
+    trend_parser.add_argument('--source', help='Solo questa fonte')
+    trend_parser.add_argument('--weeks', type=int, default=8, help='Settimane da mostrare (default: 8)')
+
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        print(f"❌ Nessuno storico in {args.db}")
+        sys.exit(2)
+    conn = connect(args.db)
+    try:
+        if args.command == 'runs':
+            print(f"{'Id':>5}  {'Fine':<16}  {'Fonte':<16} {'Durata':>8} {'Pagine':>7} {'MB':>8} {'p95':>7} {'Nuovi':>6} {'Dup':>5} {'Err':>5}")
+            for run in list_runs(conn, args.source, args.limit):
+                print(f"{run['id']:>5}  {_when(run['finished_at']):<16}  {run['source']:<16} "
+                      f"{_format(run['duration'], '{:.1f}'):>8} {run['pages']:>7} {run['megabytes']:>8.2f} "
+                      f"{_format(run['fetch_p95'], '{:.3f}'):>7} {run['flyers_new']:>6} "
+                      f"{run['flyers_duplicate']:>5} {run['flyers_error']:>5}")
+        elif args.command == 'compare':
+            if args.run_ids and len(args.run_ids) != 2:
+                parser.error('compare vuole due id di run (oppure nessuno)')
+            run_ids = args.run_ids or [run['id'] for run in reversed(list_runs(conn, args.source, 2))]
+            if len(run_ids) < 2:
+                print("⚠️  Servono almeno due run da confrontare")
+                sys.exit(2)
+            try:
+                compare_runs(conn, *run_ids)
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+        else:
+            trend = weekly_trend(conn, args.source, args.weeks)
+            if not trend:
+                print(f"⚠️  Nessun run nelle ultime {args.weeks} settimane")
+            else:
+                print_trend(trend)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
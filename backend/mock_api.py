@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API VolantinoMix simulata per test end-to-end e misure di throughput
+Server HTTP in-process (thread) che risponde come il backend Node sugli endpoint
+usati dagli scraper: /health, /api/pdfs/upload (multipart), /api/eurospin/upload,
+/api/ipercoop/upload (JSON) e /api/volantini. Stesso contratto di risposta
+(success, data.totalFlyersCreated, data.totalDuplicatesSkipped, messaggio di
+duplicato) e deduplica per MD5 del contenuto, senza Node né MongoDB.
+Latenza, errori 500 e risposte 429 sono configurabili; il load driver misura il
+throughput degli upload di integratore e scraper a diversi livelli di concorrenza.
+
+Uso:
+    python mock_api.py serve --port 3001 --latency-ms 80 --error-rate 0.02
+    python mock_api.py load --targets integrator,deco --concurrency 1,4,8 --uploads 40 --output load.json
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import threading
+import statistics
+from datetime import datetime
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from hashing import LEGACY_HASH, hash_bytes, hash_file
+
+
+def parse_multipart(content_type, body):
+    """Parti di un corpo multipart/form-data: ({campo: valore}, [(campo, nome_file, contenuto)])"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    fields, files = {}, []
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True) or b''
+        if filename is not None:
+            files.append((name, filename, payload))
+        else:
+            fields[name] = payload.decode('utf-8', errors='replace')
+    return fields, files
+
+
+class MockVolantinoMixAPI:
+    """
+    Server simulato. latency e jitter in secondi; error_rate e rate_limit_rate sono
+    probabilità per richiesta; con max_rps oltre quella frequenza si risponde 429
+    come express-rate-limit.
+
+        with MockVolantinoMixAPI(latency=0.05) as api:
+            scraper = DecoVolantiniScraper(api_base_url=api.api_base_url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, max_rps=None, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_rps = max_rps
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = []
+        self.started_at = time.time()
+        self.reset()
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Header e corpo partono in due write: con Nagle attivo le connessioni keep-alive
+            # pagherebbero ~40 ms di ACK ritardato a risposta, falsando le latenze
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                api._handle(self)
+
+            def do_POST(self):
+                api._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_base_url(self):
+        return f"{self.base_url}/api"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def reset(self):
+        """Azzera contatori e volantini già ricevuti (deduplica)"""
+        with self._lock:
+            self.seen_hashes = set()
+            self.stats = {'requests': 0, 'by_status': {}, 'by_endpoint': {}, 'flyers_created': 0,
+                          'duplicates_skipped': 0, 'bytes_received': 0}
+
+    # -----------------------------------------------------------------
+    # Gestione richieste
+    # -----------------------------------------------------------------
+
+    def _count(self, endpoint, status, received):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_received'] += received
+            self.stats['by_status'][str(status)] = self.stats['by_status'].get(str(status), 0) + 1
+            self.stats['by_endpoint'][endpoint] = self.stats['by_endpoint'].get(endpoint, 0) + 1
+
+    def _rate_limited(self):
+        with self._lock:
+            if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+                return True
+            if not self.max_rps:
+                return False
+            now = time.monotonic()
+            self._window = [ts for ts in self._window if now - ts < 1.0]
+            if len(self._window) >= self.max_rps:
+                return True
+            self._window.append(now)
+            return False
+
+    def _register(self, digest):
+        """True se il contenuto è nuovo, False se è un duplicato"""
+        with self._lock:
+            if digest in self.seen_hashes:
+                self.stats['duplicates_skipped'] += 1
+                return False
+            self.seen_hashes.add(digest)
+            self.stats['flyers_created'] += 1
+            return True
+
+    def _handle(self, handler):
+        path = urlsplit(handler.path).path.rstrip('/') or '/'
+        length = int(handler.headers.get('content-length') or 0)
+        body = handler.rfile.read(length) if length else b''
+
+        if path not in ('/health', '/api/health') and self._rate_limited():
+            status, payload = 429, {'error': 'Troppe richieste, riprova più tardi'}
+            headers = {'Retry-After': str(self.retry_after)}
+        else:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            if delay:
+                time.sleep(delay)
+            headers = {}
+            if self.error_rate and self._random.random() < self.error_rate:
+                status, payload = 500, {'success': False, 'error': 'Errore interno del server (simulato)'}
+            else:
+                status, payload = self._route(handler.command, path, handler.headers.get('content-type', ''), body)
+
+        self._count(f"{handler.command} {path}", status, len(body))
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json; charset=utf-8')
+        handler.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _route(self, method, path, content_type, body):
+        if method == 'GET' and path in ('/health', '/api/health'):
+            return 200, {'status': 'OK', 'timestamp': datetime.now().isoformat(),
+                         'uptime': time.time() - self.started_at, 'environment': 'mock', 'version': 'mock'}
+        if method == 'POST' and path == '/api/pdfs/upload':
+            return self._pdfs_upload(content_type, body)
+        if method == 'POST' and path in ('/api/eurospin/upload', '/api/ipercoop/upload'):
+            return self._store_upload(body)
+        if method == 'POST' and path == '/api/volantini':
+            flyer = json.loads(body or b'{}')
+            return 201, {'success': True, 'data': {'_id': hash_bytes(body)[LEGACY_HASH][:24], **flyer}}
+        return 404, {'success': False, 'error': 'Endpoint non trovato', 'path': path}
+
+    def _pdfs_upload(self, content_type, body):
+        """Come POST /api/pdfs/upload: multipart con i file nel campo 'pdfs'"""
+        if not content_type.startswith('multipart/form-data'):
+            return 400, {'success': False, 'error': 'Nessun file caricato', 'message': 'Seleziona almeno un file PDF da caricare'}
+        fields, files = parse_multipart(content_type, body)
+        files = [(filename, content) for name, filename, content in files if name == 'pdfs']
+        if not files:
+            return 400, {'success': False, 'error': 'Nessun file caricato', 'message': 'Seleziona almeno un file PDF da caricare'}
+
+        uploaded_files, created_flyers, skipped_duplicates = [], [], []
+        for filename, content in files:
+            digest = hash_bytes(content)[LEGACY_HASH]
+            if not self._register(digest):
+                skipped_duplicates.append({'filename': filename, 'reason': 'File con lo stesso hash già presente'})
+                continue
+            uploaded_files.append({'originalName': filename, 'filename': f"{digest}.pdf", 'size': len(content)})
+            created_flyers.append({'id': digest[:24], 'store': fields.get('store', 'Sconosciuto'), 'filename': filename})
+
+        message = f"{len(uploaded_files)} file caricati con successo"
+        if created_flyers:
+            message += f", {len(created_flyers)} volantini creati"
+        if skipped_duplicates:
+            message += f", {len(skipped_duplicates)} duplicati saltati"
+        data = {
+            'uploadedFiles': uploaded_files,
+            'createdFlyers': created_flyers,
+            'totalProcessed': len(uploaded_files) + len(skipped_duplicates),
+            'totalUploaded': len(uploaded_files),
+            'totalFlyersCreated': len(created_flyers),
+            'totalDuplicatesSkipped': len(skipped_duplicates),
+            'totalErrors': 0
+        }
+        if skipped_duplicates:
+            data['skippedDuplicates'] = skipped_duplicates
+        return 200, {'success': True, 'message': message, 'data': data}
+
+    def _store_upload(self, body):
+        """Come POST /api/eurospin/upload e /api/ipercoop/upload: JSON con il percorso del PDF"""
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            return 400, {'success': False, 'error': 'JSON non valido'}
+        if not data.get('filename') or not data.get('store_name'):
+            return 400, {'success': False, 'error': 'Parametri mancanti: filename e store_name sono obbligatori'}
+
+        pdf_path = data.get('pdf_path')
+        if pdf_path and os.path.exists(pdf_path):
+            digest = hash_file(pdf_path)[LEGACY_HASH]
+        else:
+            digest = hash_bytes((data.get('pdf_url') or data['filename']).encode('utf-8'))[LEGACY_HASH]
+        if not self._register(digest):
+            return 200, {'success': False, 'message': 'Volantino duplicato non caricato',
+                         'reason': 'File con lo stesso hash già presente', 'duplicates': []}
+        return 200, {'success': True, 'message': 'Volantino caricato con successo',
+                     'volantino': {'id': digest[:24], 'filename': data['filename'], 'store_name': data['store_name'],
+                                   'upload_date': datetime.now().isoformat()}}
+
+
+# ---------------------------------------------------------------------
+# Load driver: upload concorrenti dai percorsi reali di integratore e scraper
+# ---------------------------------------------------------------------
+
+def _integrator(api_base):
+    from integrazione_volantini import VolantinoMixIntegrator
+    integrator = VolantinoMixIntegrator(api_base_url=api_base, volantini_folder='volantini')
+    return lambda path: integrator.upload_pdf_to_api(path, 'Benchmark', 'Supermercato', {'cap': '00100'})
+
+
+def _deco(api_base):
+    from scraper_deco import DecoVolantiniScraper
+    scraper = DecoVolantiniScraper(download_folder='volantini_deco', api_base_url=api_base)
+    return lambda path: scraper.upload_to_volantinomix(path, {'store': 'Decò', 'category': 'Supermercato', 'cap': '00100'})
+
+
+def _ipercoop(api_base):
+    from pathlib import Path
+    from scraper_ipercoop import IpercoopVolantiniScraper
+    scraper = IpercoopVolantiniScraper(download_folder='volantini_ipercoop', api_base_url=api_base)
+    return lambda path: scraper.upload_to_volantinomix(
+        Path(path), {'store': 'Ipercoop', 'location': {'cap': '00100'}, 'source_url': f'https://example.invalid/{os.path.basename(path)}'})
+
+
+def _eurospin(api_base):
+    from scraper_eurospin import EurospinScraper
+    scraper = EurospinScraper(api_base_url=api_base)
+    return lambda path: scraper.upload_to_volantinomix(path, {'store': 'Eurospin', 'category': 'Supermercato', 'cap': '00100'})
+
+
+def _mersi(api_base):
+    from scraper_mersi import MersiVolantiniScraper
+    scraper = MersiVolantiniScraper(upload_url=f'{api_base}/pdfs/upload', download_dir='volantini/mersi')
+    return lambda path: bool(scraper.upload_pdf(path))
+
+
+def _site(module, cls):
+    def factory(api_base):
+        scraper = getattr(__import__(module), cls)(api_base_url=api_base)
+        return scraper.upload
+    return factory
+
+
+UPLOAD_TARGETS = {
+    'integrator': _integrator,
+    'deco': _deco,
+    'ipercoop': _ipercoop,
+    'eurospin': _eurospin,
+    'mersi': _mersi,
+    'eurospin-site': _site('scraper_eurospin_site', 'EurospinSiteScraper'),
+    'lidl-site': _site('scraper_lidl_site', 'LidlSiteScraper'),
+    'md-site': _site('scraper_md_site', 'MDSiteScraper'),
+}
+
+
+def make_pdfs(folder, count, size_kb=256):
+    """PDF sintetici tutti diversi (altrimenti il server li scarterebbe come duplicati)"""
+    paths = []
+    filler = os.urandom(max(size_kb * 1024 - 64, 0))
+    for index in range(count):
+        path = os.path.join(folder, f"bench_{index:04d}.pdf")
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n%' + f"{index:08d}".encode() + b'\n' + filler + b'\n%%EOF\n')
+        paths.append(path)
+    return paths
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+def run_load(api, upload, files, concurrency):
+    """Carica tutti i file con `concurrency` thread; throughput e latenze lato client"""
+    api.reset()
+    latencies = []
+    lock = threading.Lock()
+
+    def timed_upload(path):
+        started = time.perf_counter()
+        try:
+            ok = bool(upload(path))
+        except Exception:
+            ok = False
+        with lock:
+            latencies.append(time.perf_counter() - started)
+        return ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_upload, files))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'uploads': len(files),
+        'succeeded': sum(results),
+        'failed': len(results) - sum(results),
+        'elapsed_s': elapsed,
+        'uploads_per_s': len(files) / elapsed if elapsed else 0.0,
+        'latency_p50_s': statistics.median(latencies) if latencies else 0.0,
+        'latency_p95_s': _percentile(latencies, 0.95),
+        'server': {key: api.stats[key] for key in ('requests', 'by_status', 'flyers_created', 'duplicates_skipped', 'bytes_received')}
+    }
+
+
+def load_test(targets, concurrency_levels, uploads=40, size_kb=256, **server_options):
+    """Esegue il load test di ogni target a ogni livello di concorrenza"""
+    workdir = tempfile.mkdtemp(prefix='mock_api_load_')
+    previous = os.getcwd()
+    results = {}
+    try:
+        os.chdir(workdir)
+        files = make_pdfs(workdir, uploads, size_kb)
+        with MockVolantinoMixAPI(**server_options) as api:
+            for name in targets:
+                with open(os.devnull, 'w') as devnull:
+                    stdout, sys.stdout = sys.stdout, devnull
+                    try:
+                        upload = UPLOAD_TARGETS[name](api.api_base_url)
+                        results[name] = []
+                        for level in concurrency_levels:
+                            results[name].append(run_load(api, upload, files, level))
+                    finally:
+                        sys.stdout = stdout
+                for row in results[name]:
+                    print(f"📈 {name:<14} c={row['concurrency']:<3} {row['uploads_per_s']:7.1f} upload/s  "
+                          f"p50 {row['latency_p50_s'] * 1000:6.1f} ms  p95 {row['latency_p95_s'] * 1000:6.1f} ms  "
+                          f"ok {row['succeeded']}/{row['uploads']}  stati {row['server']['by_status']}", file=sys.stderr)
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='API VolantinoMix simulata e load driver degli upload')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_server_options(sub):
+        sub.add_argument('--latency-ms', type=float, default=0, help='Latenza fissa per richiesta')
+        sub.add_argument('--jitter-ms', type=float, default=0, help='Latenza casuale aggiuntiva (uniforme)')
+        sub.add_argument('--error-rate', type=float, default=0, help='Probabilità di risposta 500')
+        sub.add_argument('--rate-limit-rate', type=float, default=0, help='Probabilità di risposta 429')
+        sub.add_argument('--max-rps', type=float, help='Oltre queste richieste al secondo risponde 429')
+        sub.add_argument('--seed', type=int, help='Seme per errori e latenze riproducibili')
+
+    serve_parser = subparsers.add_parser('serve', help='Avvia il server simulato finché non viene interrotto')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=3001)
+    add_server_options(serve_parser)
+
+    load_parser = subparsers.add_parser('load', help='Misura il throughput degli upload')
+    load_parser.add_argument('--targets', default=','.join(UPLOAD_TARGETS), help='Elenco separato da virgole (default: tutti)')
+    load_parser.add_argument('--concurrency', default='1,2,4,8', help='Livelli di concorrenza (default: 1,2,4,8)')
+    load_parser.add_argument('--uploads', type=int, default=40, help='Upload per livello (default: 40)')
+    load_parser.add_argument('--size-kb', type=int, default=256, help='Dimensione dei PDF sintetici (default: 256)')
+    load_parser.add_argument('--output', help='File JSON dei risultati')
+    add_server_options(load_parser)
+
+    args = parser.parse_args()
+    server_options = {
+        'latency': args.latency_ms / 1000, 'jitter': args.jitter_ms / 1000, 'error_rate': args.error_rate,
+        'rate_limit_rate': args.rate_limit_rate, 'max_rps': args.max_rps, 'seed': args.seed
+    }
+
+    if args.command == 'serve':
+        api = MockVolantinoMixAPI(host=args.host, port=args.port, **server_options)
+        print(f"🧪 API simulata su {api.api_base_url} (Ctrl+C per terminare)")
+        try:
+            api.server.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\n📊 {json.dumps(api.stats, ensure_ascii=False)}")
+        finally:
+            api.server.server_close()
+        return
+
+    targets = [name.strip() for name in args.targets.split(',') if name.strip()]
+    unknown = [name for name in targets if name not in UPLOAD_TARGETS]
+    if unknown:
+        parser.error(f"target sconosciuti: {', '.join(unknown)} (disponibili: {', '.join(UPLOAD_TARGETS)})")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    results = load_test(targets, levels, uploads=args.uploads, size_kb=args.size_kb, **server_options)
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'server': dict(server_options),
+        'uploads': args.uploads,
+        'size_kb': args.size_kb,
+        'targets': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Risultati salvati in {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rilevamento di volantini quasi duplicati tramite hash percettivi
+Rasterizza le prime pagine a bassa risoluzione, calcola un pHash a 64 bit per pagina
+con NumPy e confronta i volantini con un indice a distanza di Hamming persistente.
+Intercetta lo stesso volantino ricodificato (es. sito ufficiale vs aggregatori)
+che il confronto MD5 non vede.
+
+Uso:
+    python3 near_duplicates.py check volantino.pdf
+    python3 near_duplicates.py evaluate corpus/ --labels labels.json
+
+Dipendenze opzionali: numpy e PyMuPDF (oppure pdftoppm di poppler-utils)
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import threading
+from datetime import datetime
+from itertools import combinations
+
+from lazy_imports import lazy_module
+
+# Caricati al primo calcolo: importare il modulo (ogni scraper lo fa) non paga numpy e PyMuPDF
+np = lazy_module('numpy')
+NUMPY_AVAILABLE = np is not None
+
+fitz = lazy_module('pymupdf', 'fitz')  # 'fitz' per PyMuPDF < 1.24
+PYMUPDF_AVAILABLE = fitz is not None
+
+PDFTOPPM_AVAILABLE = shutil.which('pdftoppm') is not None
+
+DEFAULT_PAGES = 2
+DEFAULT_DPI = 36
+# Bit diversi (su 64) entro cui due pagine sono considerate la stessa immagine
+DEFAULT_THRESHOLD = 10
+# Accanto al modulo, non nella cartella da cui parte il processo: scraper e integratore condividono l'indice
+DEFAULT_INDEX_FILE = os.environ.get('PERCEPTUAL_INDEX_FILE',
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perceptual_index.json'))
+# La soglia non è ancora tarata su dati reali: di norma i match vengono solo segnalati
+# e l'upload prosegue; SKIP_NEAR_DUPLICATES=1 li salta
+SKIP_NEAR_DUPLICATES = os.environ.get('SKIP_NEAR_DUPLICATES', '').lower() in ('1', 'true', 'yes')
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+
+def is_available():
+    """True se sono disponibili NumPy e almeno un rasterizzatore PDF"""
+    return NUMPY_AVAILABLE and (PYMUPDF_AVAILABLE or PDFTOPPM_AVAILABLE)
+
+
+def _read_pgm(file_path):
+    """Legge un'immagine PGM binaria (P5) prodotta da pdftoppm"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    tokens = []
+    offset = 0
+    while len(tokens) < 4:
+        while data[offset:offset + 1].isspace():
+            offset += 1
+        if data[offset:offset + 1] == b'#':
+            offset = data.index(b'\n', offset) + 1
+            continue
+        end = offset
+        while not data[end:end + 1].isspace():
+            end += 1
+        tokens.append(data[offset:end])
+        offset = end
+    magic, width, height, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+    if magic != b'P5' or maxval > 255:
+        raise ValueError(f"PGM non supportato: {file_path}")
+    pixels = np.frombuffer(data, dtype=np.uint8, count=width * height, offset=offset + 1)
+    return pixels.reshape(height, width)
+
+
+def rasterize_pdf(pdf_path, pages=DEFAULT_PAGES, dpi=DEFAULT_DPI):
+    """Rasterizza le prime `pages` pagine in scala di grigi; restituisce array uint8 HxW"""
+    if PYMUPDF_AVAILABLE:
+        images = []
+        zoom = dpi / 72
+        with fitz.open(pdf_path) as doc:
+            for page in doc.pages(0, min(pages, doc.page_count)):
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+                img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+                images.append(img[:, :pix.width].copy())
+        return images
+
+    if PDFTOPPM_AVAILABLE:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prefix = os.path.join(tmp_dir, 'page')
+            subprocess.run(
+                ['pdftoppm', '-gray', '-r', str(dpi), '-f', '1', '-l', str(pages), str(pdf_path), prefix],
+                check=True, capture_output=True, timeout=120
+            )
+            return [_read_pgm(os.path.join(tmp_dir, name)) for name in sorted(os.listdir(tmp_dir))]
+
+    raise RuntimeError('Nessun rasterizzatore PDF disponibile (installare PyMuPDF o poppler-utils)')
+
+
+def _resize_area(img, size):
+    """Ridimensiona per media su blocchi (interpolazione 'area') a size x size"""
+    height, width = img.shape
+    if height < size or width < size:
+        rows = np.linspace(0, height - 1, size).astype(int)
+        cols = np.linspace(0, width - 1, size).astype(int)
+        return img[np.ix_(rows, cols)].astype(np.float64)
+
+    row_edges = np.linspace(0, height, size + 1).astype(int)
+    col_edges = np.linspace(0, width, size + 1).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(img.astype(np.float64), row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+    counts = np.outer(np.diff(row_edges), np.diff(col_edges))
+    return sums / counts
+
+
+_dct_matrix_cache = {}
+
+
+def _dct_matrix(n):
+    if n not in _dct_matrix_cache:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+        matrix[0] /= np.sqrt(2)
+        _dct_matrix_cache[n] = matrix
+    return _dct_matrix_cache[n]
+
+
+def phash(img):
+    """pHash a 64 bit: DCT 2D dell'immagine 32x32, segno delle 8x8 basse frequenze rispetto alla mediana"""
+    small = _resize_area(img, DCT_SIZE)
+    dct = _dct_matrix(DCT_SIZE)
+    coefficients = (dct @ small @ dct.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # La componente continua (DC) dipende solo dalla luminosità media: esclusa dalla mediana
+    median = np.median(coefficients[1:])
+    bits = coefficients > median
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def fingerprint_pdf(pdf_path, pages=DEFAULT_PAGES, dpi=DEFAULT_DPI):
+    """Lista dei pHash delle prime pagine del PDF"""
+    return [phash(img) for img in rasterize_pdf(pdf_path, pages, dpi)]
+
+
+def _popcount64(values):
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+def document_distance(query_hashes, candidate_hashes):
+    """
+    Distanza tra due volantini: media, sulle pagine della query, della distanza minima
+    dalle pagine del candidato (tollera copertine aggiunte o pagine riordinate)
+    """
+    query = np.array(query_hashes, dtype=np.uint64)
+    candidate = np.array(candidate_hashes, dtype=np.uint64)
+    distances = _popcount64(np.bitwise_xor(query[:, None], candidate[None, :]).ravel())
+    return float(distances.reshape(len(query), len(candidate)).min(axis=1).mean())
+
+
+class PerceptualIndex:
+    """Indice persistente degli hash percettivi con ricerca Hamming vettorializzata"""
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE, threshold=DEFAULT_THRESHOLD):
+        self.index_file = str(index_file)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.documents = self._load()
+        self._matrix = None
+
+    def _load(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('documents', {})
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Scrive l'indice su disco (atomicamente)"""
+        with self._lock:
+            snapshot = {'documents': dict(self.documents)}
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_file, self.index_file)
+
+    def _build_matrix(self):
+        """Array piatto di tutti gli hash di pagina con il documento di appartenenza"""
+        doc_ids, page_hashes, owners = [], [], []
+        for position, (doc_id, entry) in enumerate(self.documents.items()):
+            doc_ids.append(doc_id)
+            for value in entry['hashes']:
+                page_hashes.append(int(value, 16))
+                owners.append(position)
+        self._matrix = (doc_ids, np.array(page_hashes, dtype=np.uint64), np.array(owners, dtype=np.int64))
+        return self._matrix
+
+    def add(self, doc_id, hashes, **metadata):
+        """Registra un volantino nell'indice"""
+        with self._lock:
+            self.documents[doc_id] = {
+                'hashes': [f"{value:016x}" for value in hashes],
+                'added_at': datetime.now().isoformat(),
+                **metadata
+            }
+            self._matrix = None
+
+    def query(self, hashes, threshold=None, exclude=None):
+        """
+        Volantini entro la soglia, ordinati per distanza: [(doc_id, distanza)].
+        `exclude` è il documento controllato: la sua voce (chiave o path) non è un match.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        if not hashes or not self.documents:
+            return []
+
+        with self._lock:
+            doc_ids, page_hashes, owners = self._matrix or self._build_matrix()
+        if not len(page_hashes):
+            return []
+
+        query = np.array(hashes, dtype=np.uint64)
+        # Distanza di ogni pagina della query da ogni pagina dell'archivio in un'unica operazione
+        distances = _popcount64(np.bitwise_xor(query[:, None], page_hashes[None, :]).ravel()).reshape(len(query), -1)
+
+        # Minimo per documento e per pagina della query, poi media sulle pagine
+        per_doc = np.full((len(query), len(doc_ids)), 64, dtype=np.int64)
+        for row in range(len(query)):
+            np.minimum.at(per_doc[row], owners, distances[row])
+        scores = per_doc.mean(axis=0)
+
+        matches = [i for i in np.nonzero(scores <= threshold)[0] if not self._is_same(doc_ids[i], exclude)]
+        return sorted(((doc_ids[i], float(scores[i])) for i in matches), key=lambda item: item[1])
+
+    def _is_same(self, doc_id, exclude):
+        """True se la voce doc_id è il documento `exclude` (stessa chiave o stesso path)"""
+        if exclude is None:
+            return False
+        entry = self.documents.get(doc_id) or {}
+        return exclude in (doc_id, entry.get('path'))
+
+
+class NearDuplicateDetector:
+    """
+    Fase di ingest: segnala i quasi duplicati prima dell'upload e registra i nuovi volantini.
+    Con skip=True il chiamante salta l'upload dei quasi duplicati invece di segnalarli soltanto.
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE, threshold=DEFAULT_THRESHOLD, pages=DEFAULT_PAGES, dpi=DEFAULT_DPI,
+                 skip=SKIP_NEAR_DUPLICATES):
+        self.enabled = is_available()
+        self.skip = skip
+        self.pages = pages
+        self.dpi = dpi
+        self.index_file = index_file
+        self.threshold = threshold
+        self._index = None
+        self._lock = threading.Lock()
+        if not self.enabled:
+            print("⚠️  Controllo quasi-duplicati disattivato: servono numpy e PyMuPDF (o pdftoppm)")
+
+    @property
+    def index(self):
+        """Indice caricato al primo PDF controllato, non alla creazione dello scraper"""
+        with self._lock:
+            if self._index is None and self.enabled:
+                self._index = PerceptualIndex(self.index_file, self.threshold)
+            return self._index
+
+    def check(self, pdf_path):
+        """Restituisce (hash, miglior match o None); hash è None se il PDF non è rasterizzabile"""
+        if not self.enabled:
+            return None, None
+        try:
+            hashes = fingerprint_pdf(pdf_path, self.pages, self.dpi)
+        except Exception as e:
+            print(f"⚠️  Hash percettivo non calcolabile per {os.path.basename(str(pdf_path))}: {e}")
+            return None, None
+        # Un PDF già indicizzato (integratore rilanciato) non è il quasi duplicato di sé stesso
+        matches = self.index.query(hashes, exclude=os.path.abspath(str(pdf_path)))
+        return hashes, (matches[0] if matches else None)
+
+    def register(self, doc_id, hashes, **metadata):
+        """Aggiunge all'indice un volantino effettivamente caricato"""
+        if self.enabled and hashes:
+            self.index.add(doc_id, hashes, **metadata)
+            self.index.save()
+
+
+def evaluate(corpus_dir, labels_file, thresholds=(4, 6, 8, 10, 12, 14, 16), pages=DEFAULT_PAGES, dpi=DEFAULT_DPI):
+    """
+    Precision/recall sulle coppie di un corpus etichettato.
+    labels_file: JSON {"nome_file.pdf": "gruppo"}; file dello stesso gruppo sono duplicati.
+    """
+    with open(labels_file, 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+
+    fingerprints = {}
+    for name in sorted(labels):
+        try:
+            fingerprints[name] = fingerprint_pdf(os.path.join(corpus_dir, name), pages, dpi)
+        except Exception as e:
+            print(f"⚠️  Saltato {name}: {e}")
+
+    pairs = [(document_distance(fingerprints[a], fingerprints[b]), labels[a] == labels[b])
+             for a, b in combinations(sorted(fingerprints), 2)]
+
+    report = {
+        'corpus': corpus_dir,
+        'documents': len(fingerprints),
+        'pairs': len(pairs),
+        'duplicate_pairs': sum(1 for _, same in pairs if same),
+        'pages': pages,
+        'dpi': dpi,
+        'thresholds': []
+    }
+    for threshold in thresholds:
+        tp = sum(1 for distance, same in pairs if same and distance <= threshold)
+        fp = sum(1 for distance, same in pairs if not same and distance <= threshold)
+        fn = sum(1 for distance, same in pairs if same and distance > threshold)
+        report['thresholds'].append({
+            'threshold': threshold,
+            'tp': tp, 'fp': fp, 'fn': fn,
+            'precision': round(tp / (tp + fp), 4) if tp + fp else 1.0,
+            'recall': round(tp / (tp + fn), 4) if tp + fn else 1.0
+        })
+    return report
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Quasi-duplicati dei volantini tramite hash percettivi')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    check_parser = subparsers.add_parser('check', help="Cerca quasi-duplicati nell'indice")
+    check_parser.add_argument('files', nargs='+')
+    check_parser.add_argument('--index', default=DEFAULT_INDEX_FILE)
+    check_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    check_parser.add_argument('--add', action='store_true', help="Aggiunge all'indice i file senza match")
+
+    eval_parser = subparsers.add_parser('evaluate', help='Report precision/recall su un corpus etichettato')
+    eval_parser.add_argument('corpus', help='Cartella con i PDF')
+    eval_parser.add_argument('--labels', required=True, help='JSON {file: gruppo}')
+    eval_parser.add_argument('--pages', type=int, default=DEFAULT_PAGES)
+    eval_parser.add_argument('--dpi', type=int, default=DEFAULT_DPI)
+    eval_parser.add_argument('--output', help='Salva il report JSON in questo file')
+
+    args = parser.parse_args()
+
+    if not is_available():
+        print("❌ Servono numpy e PyMuPDF (oppure pdftoppm)")
+        return 1
+
+    if args.command == 'check':
+        detector = NearDuplicateDetector(args.index, args.threshold)
+        for path in args.files:
+            hashes, match = detector.check(path)
+            if match:
+                print(f"🔁 {path}: quasi-duplicato di {match[0]} (distanza {match[1]:.1f})")
+            elif hashes:
+                print(f"🆕 {path}: nessun quasi-duplicato")
+                if args.add:
+                    detector.register(os.path.abspath(path), hashes, path=os.path.abspath(path))
+        return 0
+
+    report = evaluate(args.corpus, args.labels, pages=args.pages, dpi=args.dpi)
+    print(f"📊 {report['documents']} documenti, {report['pairs']} coppie ({report['duplicate_pairs']} duplicate)")
+    print(f"{'soglia':>7} {'TP':>5} {'FP':>5} {'FN':>5} {'precision':>10} {'recall':>8}")
+    for row in report['thresholds']:
+        print(f"{row['threshold']:>7} {row['tp']:>5} {row['fp']:>5} {row['fn']:>5} {row['precision']:>10.3f} {row['recall']:>8.3f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Report salvato in: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
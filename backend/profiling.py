@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Profiling opzionale degli scraper (--profile)
+Esegue il job sotto cProfile, oppure sotto pyinstrument (profiler a campionamento)
+se installato, e salva nella cartella indicata:
+    <job>-<data>.pstats      statistiche per funzione (python -m pstats, snakeviz)
+    <job>-<data>.collapsed   stack campionati ogni 5 ms, pronti per flamegraph.pl/speedscope
+    <job>-<data>.alloc.txt   allocazioni principali (tracemalloc) delle fasi download e parse
+    <job>-<data>.html        report pyinstrument, solo se pyinstrument è installato
+Le fasi sono gli span 'download' e 'parse' di tracing.py, quindi valgono per
+tutti gli scraper senza modificarne il codice.
+
+Uso:
+    python scraper_eurospin.py --profile              # cartella di default: profiles/
+    python scraper_lidl_site.py --profile=/tmp/prof
+    python -m pstats profiles/eurospin-20250101-120000.pstats
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+import tracing
+
+DEFAULT_PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+SAMPLE_INTERVAL = 0.005
+ALLOCATION_STAGES = ('download', 'parse')
+TOP_ALLOCATIONS = 15
+# Righe dei profiler stessi, escluse dal report delle allocazioni
+IGNORED_ALLOCATION_FILES = (tracemalloc.__file__, __file__, '<frozen importlib._bootstrap')
+IGNORED_ALLOCATION_PACKAGES = (f"{os.sep}pyinstrument{os.sep}",)
+
+
+def _sampling_profiler():
+    """Classe Profiler di pyinstrument se installato (importata solo con --profile), altrimenti None"""
+    try:
+        from pyinstrument import Profiler
+        return Profiler
+    except ImportError:
+        return None
+
+
+def add_argument(parser):
+    """Aggiunge l'opzione uniforme --profile [DIR] a un parser argparse"""
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_DIR, metavar='DIR',
+                        help=f'Profila l\'esecuzione e salva pstats, stack e allocazioni in DIR (default: {DEFAULT_PROFILE_DIR})')
+
+
+def option_from_argv(argv=None):
+    """--profile / --profile=DIR per gli script senza argparse; None se assente"""
+    for arg in (sys.argv[1:] if argv is None else argv):
+        if arg == '--profile':
+            return DEFAULT_PROFILE_DIR
+        if arg.startswith('--profile='):
+            return arg.split('=', 1)[1] or DEFAULT_PROFILE_DIR
+    return None
+
+
+class StackSampler(threading.Thread):
+    """Campiona gli stack di tutti i thread e li conta in formato collapsed (frame;frame;... N)"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class StageAllocations:
+    """
+    Listener di tracing: per gli span delle fasi indicate confronta due snapshot
+    tracemalloc (inizio e fine) e somma per riga di codice la memoria allocata
+    e ancora viva a fine fase, più il picco raggiunto durante la fase.
+    """
+
+    def __init__(self, stages=ALLOCATION_STAGES):
+        self.stages = stages
+        self.totals = {stage: Counter() for stage in stages}
+        self.counts = {stage: Counter() for stage in stages}
+        self.peaks = dict.fromkeys(stages, 0)
+        self.calls = dict.fromkeys(stages, 0)
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def span_started(self, span):
+        if span.name not in self.stages or not tracemalloc.is_tracing():
+            return
+        with self._lock:
+            # Fasi annidate (es. parse dentro parse) si misurano una volta sola
+            if span.name in {name for name, _ in self._open.values()}:
+                return
+            tracemalloc.reset_peak()
+            # Niente filter_traces sugli snapshot: è Python puro e sotto pyinstrument costa
+            # secondi per fase; si filtrano solo le righe del confronto
+            self._open[span.span_id] = (span.name, tracemalloc.take_snapshot())
+
+    def span_ended(self, span):
+        with self._lock:
+            opened = self._open.pop(span.span_id, None)
+            if opened is None:
+                return
+            stage, before = opened
+            self.peaks[stage] = max(self.peaks[stage], tracemalloc.get_traced_memory()[1])
+            self.calls[stage] += 1
+            after = tracemalloc.take_snapshot()
+            for diff in after.compare_to(before, 'lineno'):
+                frame = diff.traceback[0]
+                if diff.size_diff <= 0 or frame.filename.startswith(IGNORED_ALLOCATION_FILES) \
+                        or any(package in frame.filename for package in IGNORED_ALLOCATION_PACKAGES):
+                    continue
+                key = f"{frame.filename}:{frame.lineno}"
+                self.totals[stage][key] += diff.size_diff
+                self.counts[stage][key] += max(diff.count_diff, 0)
+
+    def write(self, path, top=TOP_ALLOCATIONS):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stage in self.stages:
+                f.write(f"== {stage}: {self.calls[stage]} chiamate, picco {self.peaks[stage] / 1024 / 1024:.1f} MB\n")
+                for key, size in self.totals[stage].most_common(top):
+                    f.write(f"{size / 1024:10.1f} KB  {self.counts[stage][key]:>7} blocchi  {key}\n")
+                f.write("\n")
+
+
+@contextmanager
+def profiled(label, output_dir):
+    """
+    Esegue il blocco sotto profiler se output_dir è indicato, altrimenti non fa nulla.
+    A fine blocco (anche in caso di errore) scrive i file e ne stampa i percorsi.
+    """
+    if not output_dir:
+        yield
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}")
+
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    allocations = StageAllocations()
+    tracing.TRACER.listeners.append(allocations)
+    sampler = StackSampler()
+    sampler.start()
+    sampling_profiler = _sampling_profiler()
+    if sampling_profiler:
+        profiler = sampling_profiler()
+        profiler.start()
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    print(f"🔬 Profiling attivo ({'pyinstrument' if sampling_profiler else 'cProfile'}), output in {output_dir}")
+
+    try:
+        yield
+    finally:
+        files = []
+        if sampling_profiler:
+            profiler.stop()
+            from pyinstrument.renderers import PstatsRenderer
+            with open(f"{base}.pstats", 'wb') as f:
+                f.write(profiler.output(PstatsRenderer()).encode('utf-8', errors='surrogateescape'))
+            with open(f"{base}.html", 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            files += [f"{base}.pstats", f"{base}.html"]
+        else:
+            profiler.disable()
+            profiler.dump_stats(f"{base}.pstats")
+            files.append(f"{base}.pstats")
+        sampler.stop()
+        sampler.write(f"{base}.collapsed")
+        tracing.TRACER.listeners.remove(allocations)
+        allocations.write(f"{base}.alloc.txt")
+        if started_tracemalloc:
+            tracemalloc.stop()
+        files += [f"{base}.collapsed", f"{base}.alloc.txt"]
+        for path in files:
+            print(f"💾 Profilo salvato: {path}")
+
+
+def run_profiled(output_dir, label, func, *args, **kwargs):
+    """Chiama func(*args, **kwargs) dentro profiled(); restituisce il suo risultato"""
+    with profiled(label, output_dir):
+        return func(*args, **kwargs)
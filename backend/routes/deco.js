@@ -48,8 +48,8 @@ router.post('/scrape', scrapingRateLimit, [
     try {
         const { force = false, downloadFolder = 'volantini_deco', apiUrl = 'http://localhost:5000/api' } = req.body;
         
-        // Path dello script Python
-        const scriptPath = path.join(__dirname, '../../scraper_deco.py');
+        // Path dello script Python (quello della cartella backend, strumentato con metrics.py)
+        const scriptPath = path.join(__dirname, '../scraper_deco.py');
         
         // Verifica che lo script esista
         try {
@@ -65,9 +65,10 @@ router.post('/scrape', scrapingRateLimit, [
         }
         
         // Prepara gli argomenti per lo script Python
+        // Cartella relativa alla radice del progetto, dove i PDF Decò vengono cercati alla cancellazione
         const args = [
             scriptPath,
-            '--folder', downloadFolder,
+            '--folder', path.resolve(__dirname, '../..', downloadFolder),
             '--api', apiUrl
         ];
         
@@ -93,7 +94,7 @@ router.post('/scrape', scrapingRateLimit, [
         
         // Avvia lo script Python in modo asincrono
         const pythonProcess = spawn('python3', args, {
-            cwd: path.join(__dirname, '../..'),
+            cwd: path.join(__dirname, '..'),
             stdio: ['pipe', 'pipe', 'pipe']
         });
         
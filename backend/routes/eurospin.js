@@ -49,8 +49,8 @@ router.post('/scrape', scrapingRateLimit, [
     try {
         const { force = false, downloadFolder = 'volantini_eurospin', apiUrl = 'http://localhost:5000/api' } = req.body;
         
-        // Percorso dello script Python per Eurospin
-        const scriptPath = path.join(__dirname, '../../scraper_eurospin.py');
+        // Percorso dello script Python per Eurospin (quello della cartella backend, strumentato con metrics.py)
+        const scriptPath = path.join(__dirname, '../scraper_eurospin.py');
         
         // Verifica che lo script esista
         try {
@@ -69,22 +69,15 @@ router.post('/scrape', scrapingRateLimit, [
         console.log('🔗 DEBUG - API URL:', apiUrl);
         console.log('⚡ DEBUG - Force mode:', force);
         
-        // Prepara gli argomenti per lo script Python
-        const args = [
-            scriptPath,
-            '--download-folder', downloadFolder,
-            '--api-url', apiUrl
-        ];
-        
-        if (force) {
-            args.push('--force');
-        }
+        // Lo script non ha opzioni per cartella, API e force (la copia nella radice le ignorava):
+        // scarica in volantini_eurospin e usa l'API della porta corrente
+        const args = [scriptPath];
         
         console.log('🚀 DEBUG - Comando Python:', 'python3', args.join(' '));
         
         // Avvia il processo Python
         const pythonProcess = spawn('python3', args, {
-            cwd: path.join(__dirname, '../..'),
+            cwd: path.join(__dirname, '..'),
             stdio: ['pipe', 'pipe', 'pipe']
         });
         
@@ -69,16 +69,17 @@ router.get('/status', async (req, res) => {
  * @access Public (con rate limiting)
  */
 router.post('/run/:jobName', [
-    body('force').optional().isBoolean().withMessage('force deve essere boolean')
+    body('force').optional().isBoolean().withMessage('force deve essere boolean'),
+    body('profile').optional().isBoolean().withMessage('profile deve essere boolean')
 ], handleValidationErrors, async (req, res) => {
     try {
         const { jobName } = req.params;
-        const { force = false } = req.body;
+        const { force = false, profile = false } = req.body;
         
         console.log(`🔧 DEBUG - Esecuzione manuale job: ${jobName}`);
         
         // Verifica che il job esista
-        const validJobs = ['deco-scraping', 'eurospin-scraping', 'cleanup-expired', 'expired-check', 'pdf-cleanup'];
+        const validJobs = ['deco-scraping', 'eurospin-scraping', 'cleanup-expired', 'expired-check', 'pdf-cleanup', 'change-probe'];
         if (!validJobs.includes(jobName)) {
             return res.status(400).json({
                 success: false,
@@ -89,7 +90,7 @@ router.post('/run/:jobName', [
         }
         
         // Esegui il job
-        const result = await jobScheduler.runJobManually(jobName);
+        const result = await jobScheduler.runJobManually(jobName, { profile });
         
         console.log(`✅ DEBUG - Job '${jobName}' completato:`, result);
         
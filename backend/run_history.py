@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Storico delle esecuzioni a sola aggiunta
+Ogni run diventa una riga JSON nel segmento del mese (runs-AAAA-MM.jsonl) con i
+contatori del run, errori, download scartati e dettaglio dei volantini. Accanto
+ai segmenti, summary.json contiene solo i contatori cumulativi: è l'unica cosa
+letta all'avvio, quindi il costo non cresce con lo storico.
+Manutenzione ad ogni run, solo sui segmenti dei mesi chiusi:
+    - compattazione: i run più vecchi di DETAIL_RETENTION_DAYS perdono dettaglio
+      volantini ed elenco errori (restano i conteggi)
+    - retention: i segmenti più vecchi di RETENTION_DAYS vengono eliminati
+
+Uso:
+    python run_history.py volantini_eurospin/history runs --days 30
+    python run_history.py volantini_eurospin/history flyers --days 7 --search "nazionale"
+    python run_history.py volantini_eurospin/history compact
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+RETENTION_DAYS = int(os.environ.get('RUN_HISTORY_RETENTION_DAYS', 180))
+DETAIL_RETENTION_DAYS = int(os.environ.get('RUN_HISTORY_DETAIL_DAYS', 30))
+SUMMARY_FILENAME = 'summary.json'
+SEGMENT_PREFIX = 'runs-'
+# Valori dell'ultimo run, non cumulativi
+SNAPSHOT_KEYS = ('total_volantini_found',)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _segment_month(path):
+    """'runs-2025-03.jsonl' → datetime(2025, 3, 1)"""
+    return datetime.strptime(path.stem[len(SEGMENT_PREFIX):], '%Y-%m')
+
+
+def _month_end(month):
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+class RunHistory:
+    """Contatori cumulativi in summary.json, run in segmenti JSONL mensili"""
+
+    def __init__(self, history_dir, retention_days=RETENTION_DAYS, detail_retention_days=DETAIL_RETENTION_DAYS):
+        self.history_dir = Path(history_dir)
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+        self.summary_file = self.history_dir / SUMMARY_FILENAME
+        self.retention_days = retention_days
+        self.detail_retention_days = detail_retention_days
+        self._lock = threading.Lock()
+        self.summary = self.load_summary()
+
+    def load_summary(self):
+        """Carica i soli contatori cumulativi"""
+        try:
+            if self.summary_file.exists():
+                with open(self.summary_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception:
+            pass
+        return {'runs': 0, 'last_run': None, 'counters': {}, 'compacted': []}
+
+    def _save_summary(self):
+        tmp_file = f"{self.summary_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.summary, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.summary_file)
+
+    @property
+    def counters(self):
+        return dict(self.summary.get('counters', {}))
+
+    def segments(self):
+        """Segmenti in ordine cronologico"""
+        return sorted(self.history_dir.glob(f"{SEGMENT_PREFIX}*.jsonl"))
+
+    def append_run(self, stats, details=None, started_at=None):
+        """
+        Aggiunge il run al segmento corrente e aggiorna i contatori cumulativi.
+        `stats` porta i contatori cumulativi (come caricati da `counters`, più gli
+        incrementi del run): nel record finisce il delta rispetto al run precedente.
+        """
+        now = datetime.now()
+        with self._lock:
+            previous = self.summary.get('counters', {})
+            counters = {key: value for key, value in stats.items() if _is_number(value)}
+            record = {
+                'started_at': started_at,
+                'finished_at': now.isoformat(),
+                'counters': {key: value if key in SNAPSHOT_KEYS else value - previous.get(key, 0)
+                             for key, value in counters.items()},
+                'errors': stats.get('errors', []),
+                'rejected': stats.get('rejected', {}),
+                'volantini_details': details or []
+            }
+            segment = self.history_dir / f"{SEGMENT_PREFIX}{now.strftime('%Y-%m')}.jsonl"
+            # Una riga per write: un'interruzione lascia al massimo una riga troncata, ignorata in lettura
+            with open(segment, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.summary['counters'] = counters
+            self.summary['runs'] = self.summary.get('runs', 0) + 1
+            self.summary['last_run'] = record['finished_at']
+            self._save_summary()
+        return record
+
+    def runs(self, since=None):
+        """Run registrati (dal più vecchio), letti dai segmenti solo quando servono"""
+        for segment in self.segments():
+            if since and _month_end(_segment_month(segment)) <= since:
+                continue
+            with open(segment, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since and datetime.fromisoformat(record['finished_at']) < since:
+                        continue
+                    yield record
+
+    def flyers(self, since=None, search=None):
+        """Dettaglio dei volantini dei run, con il timestamp del run; `search` filtra sul titolo"""
+        search = search.lower() if search else None
+        for record in self.runs(since):
+            for volantino in record.get('volantini_details') or []:
+                title = volantino.get('title') or volantino.get('titolo') or ''
+                if search and search not in title.lower():
+                    continue
+                yield dict(volantino, run_finished_at=record['finished_at'])
+
+    def compact(self, now=None):
+        """Retention e compattazione dei segmenti dei mesi chiusi; restituisce (eliminati, compattati)"""
+        now = now or datetime.now()
+        current = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        retention_cutoff = now - timedelta(days=self.retention_days)
+        detail_cutoff = now - timedelta(days=self.detail_retention_days)
+        removed, compacted = [], []
+        with self._lock:
+            done = set(self.summary.get('compacted', []))
+            for segment in self.segments():
+                month = _segment_month(segment)
+                if month >= current:
+                    continue
+                if _month_end(month) <= retention_cutoff:
+                    segment.unlink()
+                    done.discard(segment.name)
+                    removed.append(segment.name)
+                elif segment.name not in done and _month_end(month) <= detail_cutoff:
+                    self._compact_segment(segment)
+                    done.add(segment.name)
+                    compacted.append(segment.name)
+            if removed or compacted:
+                self.summary['compacted'] = sorted(done)
+                self._save_summary()
+        return removed, compacted
+
+    def _compact_segment(self, segment):
+        tmp_file = f"{segment}.tmp"
+        with open(segment, 'r', encoding='utf-8') as src, open(tmp_file, 'w', encoding='utf-8') as dst:
+            for line in src:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                record['volantini'] = len(record.pop('volantini_details', None) or [])
+                errors = record.get('errors')
+                if isinstance(errors, list):
+                    record['errors'] = len(errors)
+                dst.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_file, segment)
+
+    def import_legacy(self, stats_file):
+        """
+        Importa il vecchio file di statistiche unico (contatori e ultimo dettaglio)
+        come primo run dello storico e lo rinomina in *.migrated
+        """
+        stats_file = Path(stats_file)
+        if not stats_file.exists() or self.summary.get('runs'):
+            return False
+        with open(stats_file, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+        self.append_run(legacy, legacy.get('volantini_details'), started_at=legacy.get('last_run'))
+        os.replace(stats_file, f"{stats_file}.migrated")
+        return True
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Storico delle esecuzioni degli scraper')
+    parser.add_argument('history_dir', help='Cartella dello storico (es. volantini_eurospin/history)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    runs_parser = subparsers.add_parser('runs', help='Elenca i run con i contatori')
+    runs_parser.add_argument('--days', type=int, default=30, help='Solo gli ultimi N giorni (default: 30)')
+    flyers_parser = subparsers.add_parser('flyers', help='Volantini trovati nei run')
+    flyers_parser.add_argument('--days', type=int, default=7, help='Solo gli ultimi N giorni (default: 7)')
+    flyers_parser.add_argument('--search', help='Filtra per titolo')
+    subparsers.add_parser('compact', help='Applica retention e compattazione')
+    args = parser.parse_args()
+
+    history = RunHistory(args.history_dir)
+    if args.command == 'compact':
+        removed, compacted = history.compact()
+        print(f"✅ Segmenti eliminati: {len(removed)}, compattati: {len(compacted)}")
+        return
+
+    since = datetime.now() - timedelta(days=args.days)
+    if args.command == 'runs':
+        print(f"📊 Run totali: {history.summary.get('runs', 0)}, ultimo: {history.summary.get('last_run')}")
+        for record in history.runs(since):
+            counters = ', '.join(f"{key}={value}" for key, value in sorted(record['counters'].items()) if value)
+            errors = record.get('errors')
+            errors = len(errors) if isinstance(errors, list) else errors
+            print(f"{record['finished_at'][:19]}  errori={errors}  {counters}")
+    else:
+        for volantino in history.flyers(since, args.search):
+            title = volantino.get('title') or volantino.get('titolo')
+            print(f"{volantino['run_finished_at'][:19]}  {title}  {volantino.get('pdf_url') or volantino.get('url') or ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,15 +9,21 @@ Autore: VolantinoMix Team
 """
 
 import requests
-from bs4 import BeautifulSoup
 import os
-import hashlib
+import sys
 import json
 import time
 from urllib.parse import urljoin, urlparse
 from pathlib import Path
 import re
 from datetime import datetime
+from hashing import LEGACY_HASH, HashCache
+from url_utils import RedirectCache, URLSet
+from downloads import StreamedDownload
+import metrics
+import tracing
+import profiling
+from change_probe import STATE_FILENAME, ChangeProbe, commit_pending, exit_code, extract_flyer_links
 
 class DecoVolantiniScraper:
     def __init__(self, download_folder="volantini_deco", api_base_url=None):
@@ -40,10 +46,20 @@ class DecoVolantiniScraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         })
+        # Latenze e byte di fetch, download e upload per le metriche Prometheus
+        metrics.instrument_session(self.session, 'deco')
+        tracing.instrument_session(self.session)
+        self.started_at = time.time()
         
         # Crea cartella download
         self.download_folder.mkdir(exist_ok=True)
         
+        # Digest dei file locali: i file invariati non vengono riletti
+        self.hash_cache = HashCache(self.download_folder / '.hash_cache.json')
+        # URL confrontati in forma canonica, seguendo i redirect già visti
+        self.redirects = RedirectCache(self.download_folder / '.redirect_cache.json')
+        self.fetched_urls = URLSet(redirects=self.redirects)
+        
         # Statistiche
         self.stats = {
             'found': 0,
@@ -55,15 +71,15 @@ class DecoVolantiniScraper:
     
     def get_file_hash(self, file_path):
         """Calcola hash MD5 del file per evitare duplicati"""
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        return self.hash_cache.get(file_path)[LEGACY_HASH]
     
+    @tracing.traced('parse')
     def extract_pdf_links(self, soup, base_url):
         """Estrae tutti i link PDF dalla pagina dei volantini Decò"""
-        pdf_links = set()
+        from bs4 import BeautifulSoup
+        
+        pdf_links = URLSet(redirects=self.redirects)
+        visited_pages = URLSet()
         
         print("🔍 Analizzando la struttura della pagina...")
         
@@ -73,10 +89,7 @@ class DecoVolantiniScraper:
             
             # Link diretti a PDF
             if href.lower().endswith('.pdf'):
-                if href.startswith('http'):
-                    pdf_links.add(href)
-                else:
-                    pdf_links.add(urljoin(base_url, href))
+                pdf_links.add(href, base=base_url)
             
             # Link che potrebbero portare a pagine con PDF
             elif any(keyword in href.lower() for keyword in ['volantino', 'promozioni', 'offerte']):
@@ -87,6 +100,10 @@ class DecoVolantiniScraper:
                 else:
                     continue
                 
+                # La stessa pagina è spesso linkata più volte (menu, banner, footer)
+                if not visited_pages.add(page_url):
+                    continue
+                
                 # Analizza la pagina del volantino
                 try:
                     print(f"📄 Analizzando pagina volantino: {page_url}")
@@ -98,19 +115,13 @@ class DecoVolantiniScraper:
                         for pdf_link in vol_soup.find_all('a', href=True):
                             pdf_href = pdf_link['href']
                             if pdf_href.lower().endswith('.pdf'):
-                                if pdf_href.startswith('http'):
-                                    pdf_links.add(pdf_href)
-                                else:
-                                    pdf_links.add(urljoin(page_url, pdf_href))
+                                pdf_links.add(pdf_href, base=page_url)
                         
                         # Cerca anche nei tag iframe (spesso usati per PDF)
                         for iframe in vol_soup.find_all('iframe', src=True):
                             iframe_src = iframe['src']
                             if iframe_src.lower().endswith('.pdf'):
-                                if iframe_src.startswith('http'):
-                                    pdf_links.add(iframe_src)
-                                else:
-                                    pdf_links.add(urljoin(page_url, iframe_src))
+                                pdf_links.add(iframe_src, base=page_url)
                     
                     time.sleep(1)  # Rate limiting
                 except Exception as e:
@@ -121,13 +132,11 @@ class DecoVolantiniScraper:
         for meta in soup.find_all('meta', content=True):
             content = meta.get('content', '')
             if content.lower().endswith('.pdf'):
-                if content.startswith('http'):
-                    pdf_links.add(content)
-                else:
-                    pdf_links.add(urljoin(base_url, content))
+                pdf_links.add(content, base=base_url)
         
         return list(pdf_links)
     
+    @tracing.traced('download', arg='url')
     def download_pdf(self, pdf_url, filename=None):
         """Scarica un singolo PDF"""
         try:
@@ -152,21 +161,28 @@ class DecoVolantiniScraper:
                 self.stats['skipped'] += 1
                 return str(file_path)
             
-            print(f"📥 Scaricando: {filename}")
-            response = self.session.get(pdf_url, timeout=30)
-            response.raise_for_status()
-            
-            # Verifica che sia effettivamente un PDF
-            if not response.content.startswith(b'%PDF'):
-                print(f"⚠️  File non è un PDF valido: {filename}")
-                self.stats['errors'] += 1
+            if pdf_url in self.fetched_urls:
+                print(f"⏭️  URL già scaricato: {pdf_url}")
+                self.stats['skipped'] += 1
                 return None
             
-            # Salva il file
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
+            print(f"📥 Scaricando: {filename}")
+            with StreamedDownload(self.session, pdf_url, timeout=30, stats=self.stats, dest_path=file_path) as download:
+                if not self.fetched_urls.add(self.redirects.record(download.response, pdf_url)):
+                    print(f"⏭️  Redirect verso un PDF già scaricato: {download.response.url}")
+                    self.stats['skipped'] += 1
+                    return None
+                
+                # Verifica sul primo blocco che sia effettivamente un PDF
+                if not download.expect('pdf'):
+                    print(f"⚠️  File non è un PDF valido ({download.kind}): {filename}")
+                    self.stats['errors'] += 1
+                    return None
+                
+                # Salva il file (scrittura atomica in streaming)
+                saved = download.save()
             
-            print(f"✅ Scaricato: {filename} ({len(response.content)} bytes)")
+            print(f"✅ Scaricato: {filename} ({saved['size']} bytes)")
             self.stats['downloaded'] += 1
             return str(file_path)
             
@@ -196,6 +212,7 @@ class DecoVolantiniScraper:
             'cap': '90100'  # CAP generico Sicilia (Gruppo Arena è siciliano)
         }
     
+    @tracing.traced('upload', arg='file')
     def upload_to_volantinomix(self, file_path, store_info):
         """Carica il PDF nel sistema VolantinoMix"""
         try:
@@ -239,8 +256,25 @@ class DecoVolantiniScraper:
             print(f"❌ Errore upload: {e}")
             return False
     
+    def check_for_changes(self):
+        """Probe economico: solo la pagina volantini con GET condizionale, senza seguire i link"""
+        probe = ChangeProbe(self.download_folder / STATE_FILENAME, self.session, source='deco')
+        return probe.run(self.volantini_url, lambda html, base: extract_flyer_links(
+            html, base, ('volantino', 'promozioni', 'offerte')))
+    
+    def commit_probe(self):
+        """Conferma l'impronta del probe dopo uno scraping completo riuscito"""
+        return commit_pending(self.download_folder / STATE_FILENAME)
+    
+    @tracing.traced('source', source='deco')
     def scrape_and_upload(self):
-        """Processo completo: scraping + upload"""
+        """
+        Processo completo: scraping + upload.
+        Restituisce True solo se lo scraping è arrivato in fondo senza errori
+        (l'uscita 0 del processo conferma l'impronta del probe).
+        """
+        from bs4 import BeautifulSoup
+        
         print("🏪 SCRAPER SUPERMERCATI DECÒ - GRUPPO ARENA")
         print("=" * 50)
         print(f"🌐 URL target: {self.volantini_url}")
@@ -253,7 +287,7 @@ class DecoVolantiniScraper:
             health_response = self.session.get(f"{self.api_base_url.replace('/api', '')}/health", timeout=5)
             if health_response.status_code != 200:
                 print("❌ API VolantinoMix non raggiungibile")
-                return
+                return False
             print("✅ Connessione API attiva")
             
             # Scarica la pagina principale
@@ -271,7 +305,7 @@ class DecoVolantiniScraper:
             
             if not pdf_links:
                 print("⚠️  Nessun PDF trovato sul sito")
-                return
+                return False
             
             print("-" * 50)
             
@@ -299,9 +333,12 @@ class DecoVolantiniScraper:
                 # Rate limiting
                 time.sleep(2)
             
+            return self.stats['errors'] == 0
+            
         except Exception as e:
             print(f"❌ Errore durante lo scraping: {e}")
             self.stats['errors'] += 1
+            return False
         
         finally:
             self.print_summary()
@@ -317,8 +354,14 @@ class DecoVolantiniScraper:
         print(f"📤 PDF caricati in VolantinoMix: {self.stats['uploaded']}")
         print(f"⚠️  Duplicati saltati: {self.stats.get('duplicates', 0)}")
         print(f"❌ Errori: {self.stats['errors']}")
+        if self.stats.get('rejected'):
+            print(f"🚫 Scartati al primo blocco: {self.stats['rejected']}")
         print(f"🌐 API endpoint: {self.api_base_url}")
         
+        self.hash_cache.save()
+        self.redirects.save()
+        metrics.finish_run('deco', self.stats, self.started_at)
+        
         # Salva statistiche
         stats_file = self.download_folder / 'deco_scraping_stats.json'
         stats_data = {
@@ -344,6 +387,11 @@ def main():
     default_api = f'http://localhost:{default_port}/api'
     parser.add_argument('--api', default=default_api, help='URL API VolantinoMix')
     parser.add_argument('--no-upload', action='store_true', help='Solo download, senza upload')
+    parser.add_argument('--probe', action='store_true',
+                        help='Controlla solo se la pagina volantini è cambiata (exit 10 = cambiata, 0 = invariata, 1 = errore)')
+    parser.add_argument('--probe-commit', action='store_true',
+                        help="Conferma l'impronta dell'ultimo probe dopo uno scraping completo riuscito")
+    profiling.add_argument(parser)
     
     args = parser.parse_args()
     
@@ -352,12 +400,20 @@ def main():
         api_base_url=args.api
     )
     
+    if args.probe:
+        sys.exit(exit_code(scraper.check_for_changes()))
+    if args.probe_commit:
+        scraper.commit_probe()
+        return
+    
     if args.no_upload:
         # Solo scraping senza upload
         print("🔍 Modalità solo download attivata")
         # Implementa logica solo download se necessario
     
-    scraper.scrape_and_upload()
+    success = profiling.run_profiled(args.profile, 'deco', scraper.scrape_and_upload)
+    # Uscita 1 se lo scraping fallisce: lo scheduler non conferma l'impronta del probe
+    sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,24 +6,67 @@ Estrae i volantini dal sito https://www.eurospin.it/
 """
 
 import requests
-import json
 import os
+import sys
 import time
 from datetime import datetime, timedelta
 from urllib.parse import urljoin, urlparse
+import atexit
+import queue
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from strategy_tracker import StrategyTracker
+from near_duplicates import NearDuplicateDetector
+from text_similarity import TextDuplicateDetector
+from url_utils import RedirectCache, URLSet
+from downloads import StreamedDownload
+from run_history import RunHistory
+import metrics
+import tracing
+import profiling
+from change_probe import STATE_FILENAME, ChangeProbe, commit_pending, exit_code, extract_flyer_links
 
-# Configurazione logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('eurospin_scraper.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+# Logging configurato da configure_logging() nel punto di ingresso: importare il modulo
+# non crea file né handler, e senza configurazione passano solo warning ed errori
+logger = logging.getLogger('scraper_eurospin')
+LOG_FILE = os.environ.get('EUROSPIN_LOG_FILE', 'eurospin_scraper.log')
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+_log_listener = None
+
+
+def configure_logging(level=logging.INFO, log_file=LOG_FILE):
+    """
+    Le chiamate al logger accodano il record e tornano subito; un thread
+    (QueueListener) scrive su console e su file con rotazione a LOG_MAX_BYTES.
+    I messaggi per singolo link sono a DEBUG (--verbose). Idempotente.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                       encoding='utf-8', delay=True)
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, file_handler, stream_handler)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    _log_listener.start()
+    # Svuota la coda prima dell'uscita del processo
+    atexit.register(_log_listener.stop)
+    return _log_listener
+
+# Esiti per le metriche Prometheus → contatori cumulativi del file di statistiche
+RUN_COUNTERS = {
+    'downloaded': 'total_volantini_downloaded',
+    'uploaded': 'uploaded',
+    'duplicates': 'duplicates'
+}
 
 class EurospinScraper:
     def __init__(self, api_base_url=None):
@@ -48,13 +91,28 @@ class EurospinScraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         })
+        # Latenze e byte di fetch, download e upload per le metriche Prometheus
+        metrics.instrument_session(self.session, 'eurospin')
+        tracing.instrument_session(self.session)
         
         # Directory per salvare i volantini
         self.download_dir = Path("volantini_eurospin")
         self.download_dir.mkdir(exist_ok=True)
         
-        # File per statistiche
-        self.stats_file = self.download_dir / "eurospin_scraping_stats.json"
+        # Storico dei run: contatori cumulativi + segmenti JSONL con il dettaglio di ogni run
+        self.history = RunHistory(self.download_dir / "history")
+        self.stats_file = self.history.summary_file
+        
+        # Esiti storici di strategie e fonti alternative: ordine dei tentativi e circuit breaker
+        self.strategy_tracker = StrategyTracker(self.download_dir / "eurospin_strategies.json")
+        
+        # Indice percettivo condiviso: lo stesso volantino ricodificato dagli aggregatori non va ricaricato
+        self.near_duplicates = NearDuplicateDetector()
+        self.text_duplicates = TextDuplicateDetector()
+        
+        # URL confrontati in forma canonica: lo stesso PDF dal sito e dagli aggregatori si scarica una volta
+        self.redirects = RedirectCache(self.download_dir / ".redirect_cache.json")
+        self.fetched_urls = URLSet(redirects=self.redirects)
         
         # Statistiche
         self.stats = {
@@ -62,27 +120,29 @@ class EurospinScraper:
             "total_volantini_found": 0,
             "total_volantini_downloaded": 0,
             "errors": [],
-            "volantini_details": []
+            "rejected": {}
         }
+        self.run_started_at = None
         
         self.load_stats()
     
     def load_stats(self):
-        """Carica le statistiche dal file JSON"""
+        """Carica i soli contatori cumulativi; il dettaglio dei run si legge da self.history quando serve"""
         try:
-            if self.stats_file.exists():
-                with open(self.stats_file, 'r', encoding='utf-8') as f:
-                    self.stats = json.load(f)
-                logger.info(f"Statistiche caricate: {len(self.stats.get('volantini_details', []))} volantini precedenti")
+            if self.history.import_legacy(self.download_dir / "eurospin_scraping_stats.json"):
+                logger.info("Statistiche JSON precedenti importate nello storico dei run")
+            self.stats.update(self.history.counters)
+            self.stats["last_run"] = self.history.summary.get('last_run')
+            logger.info(f"Statistiche caricate: {self.history.summary.get('runs', 0)} run precedenti")
         except Exception as e:
             logger.error(f"Errore nel caricamento delle statistiche: {e}")
     
-    def save_stats(self):
-        """Salva le statistiche nel file JSON"""
+    def save_stats(self, volantini=None):
+        """Aggiunge il run allo storico, poi applica retention e compattazione"""
         try:
-            self.stats["last_run"] = datetime.now().isoformat()
-            with open(self.stats_file, 'w', encoding='utf-8') as f:
-                json.dump(self.stats, f, indent=2, ensure_ascii=False)
+            record = self.history.append_run(self.stats, volantini, started_at=self.run_started_at)
+            self.stats["last_run"] = record['finished_at']
+            self.history.compact()
             logger.info("Statistiche salvate")
         except Exception as e:
             logger.error(f"Errore nel salvataggio delle statistiche: {e}")
@@ -172,36 +232,34 @@ class EurospinScraper:
             })
             return None
     
-    def search_api_endpoints(self):
-        """Cerca possibili endpoint API per i volantini"""
-        api_endpoints = [
-            f"{self.base_url}/api/volantini",
-            f"{self.base_url}/api/leaflets",
-            f"{self.base_url}/api/flyers",
-            f"{self.base_url}/wp-json/wp/v2/volantini",
-            f"{self.base_url}/wp-admin/admin-ajax.php"
-        ]
-        
-        for endpoint in api_endpoints:
-            try:
-                logger.info(f"Tentativo API: {endpoint}")
-                response = self.session.get(endpoint, timeout=10)
-                if response.status_code == 200:
-                    logger.info(f"API endpoint trovato: {endpoint}")
-                    return response.json()
-            except:
-                continue
+    def search_volantini_html(self):
+        """Strategia HTML: pagina volantini del sito ufficiale"""
+        logger.info("Ricerca tramite scraping HTML...")
+        html_content = self.get_volantini_page()
+        if not html_content:
+            logger.error("Impossibile ottenere la pagina dei volantini")
+            return []
         
-        return None
+        # Estrai informazioni sui volantini
+        return self.extract_volantini_info(html_content)
     
     def search_alternative_sources(self):
-        """Cerca volantini sui siti aggregatori"""
+        """Cerca volantini sui siti aggregatori; None se tutti i siti sono in cooldown"""
         from bs4 import BeautifulSoup
         from urllib.parse import urljoin
         
         volantini = []
+        attempted = 0
         
-        for url in self.alternative_urls:
+        tracker = self.strategy_tracker
+        for url in tracker.order(self.alternative_urls):
+            if not tracker.is_available(url):
+                logger.info(f"Sito alternativo in cooldown, saltato: {url}")
+                continue
+            
+            attempted += 1
+            started = time.time()
+            found_before = len(volantini)
             try:
                 logger.info(f"Ricerca su sito alternativo: {url}")
                 response = self.session.get(url, timeout=30)
@@ -228,7 +286,7 @@ class EurospinScraper:
                             'pages': 'Da definire'
                         }
                         volantini.append(volantino)
-                        logger.info(f"PDF trovato su sito alternativo: {pdf_url}")
+                        logger.debug("PDF trovato su sito alternativo: %s", pdf_url)
                 
                 # Cerca immagini di volantini che potrebbero essere convertibili
                 img_links = soup.find_all('img', src=True)
@@ -254,14 +312,22 @@ class EurospinScraper:
                                     'pages': 'Da definire'
                                 }
                                 volantini.append(volantino)
-                                logger.info(f"PDF da immagine trovato: {pdf_url}")
+                                logger.debug("PDF da immagine trovato: %s", pdf_url)
+                
+                found = len(volantini) - found_before
+                logger.info(f"Sito alternativo {url}: {found} PDF trovati")
+                tracker.record(url, found > 0, time.time() - started, found)
                                 
             except Exception as e:
                 logger.warning(f"Errore nella ricerca su {url}: {e}")
+                tracker.record(url, False, time.time() - started)
                 continue
         
+        if not attempted:
+            return None
         return volantini
     
+    @tracing.traced('parse')
     def find_sfoglia_volantino_pdf(self, html_content):
         """Cerca specificamente il PDF nella sezione 'Sfoglia volantino'"""
         try:
@@ -287,7 +353,7 @@ class EurospinScraper:
                     if pdf_link:
                         href = pdf_link.get('href')
                         pdf_url = urljoin(self.base_url, href)
-                        logger.info(f"PDF trovato tramite 'Sfoglia volantino': {pdf_url}")
+                        logger.debug("PDF trovato tramite 'Sfoglia volantino': %s", pdf_url)
                         return pdf_url
                     
                     # Cerca anche onclick o data attributes
@@ -299,7 +365,7 @@ class EurospinScraper:
                             pdf_matches = re.findall(r'["\']([^"\'\']*\.pdf[^"\'\']*)["\']', onclick)
                             if pdf_matches:
                                 pdf_url = urljoin(self.base_url, pdf_matches[0])
-                                logger.info(f"PDF trovato tramite onclick: {pdf_url}")
+                                logger.debug("PDF trovato tramite onclick: %s", pdf_url)
                                 return pdf_url
             
             # Cerca anche elementi con classi o ID specifici
@@ -317,7 +383,7 @@ class EurospinScraper:
                     href = elem.get('href')
                     if href and '.pdf' in href.lower():
                         pdf_url = urljoin(self.base_url, href)
-                        logger.info(f"PDF trovato tramite selettore {selector}: {pdf_url}")
+                        logger.debug("PDF trovato tramite selettore %s: %s", selector, pdf_url)
                         return pdf_url
             
             # Cerca iframe che potrebbero contenere il volantino
@@ -327,7 +393,7 @@ class EurospinScraper:
                 if src and any(keyword in src.lower() for keyword in ['volantino', 'leaflet', 'flyer', 'pdf']):
                     if '.pdf' in src.lower():
                         pdf_url = urljoin(self.base_url, src)
-                        logger.info(f"PDF trovato in iframe: {pdf_url}")
+                        logger.debug("PDF trovato in iframe: %s", pdf_url)
                         return pdf_url
             
             return None
@@ -336,6 +402,7 @@ class EurospinScraper:
             logger.error(f"Errore nella ricerca PDF 'Sfoglia volantino': {e}")
             return None
     
+    @tracing.traced('parse')
     def extract_volantini_info(self, html_content):
         """Estrae le informazioni sui volantini dalla pagina HTML"""
         volantini = []
@@ -351,11 +418,11 @@ class EurospinScraper:
             for iframe in iframes:
                 src = iframe.get('src')
                 if src:
-                    logger.info(f"Trovato iframe: {src}")
+                    logger.debug("Trovato iframe: %s", src)
                     
                     # Se l'iframe contiene 'digitalflyer' o 'promotion', accedi al contenuto
                     if any(keyword in src.lower() for keyword in ['digitalflyer', 'promotion', 'volantino']):
-                        logger.info(f"Iframe volantino trovato: {src}")
+                        logger.debug("Iframe volantino trovato: %s", src)
                         
                         try:
                             # Accedi al contenuto dell'iframe
@@ -380,7 +447,7 @@ class EurospinScraper:
                                      'citta': 'Nazionale'
                                  }
                                 volantini.append(volantino)
-                                logger.info(f"PDF trovato nell'iframe: {pdf_url}")
+                                logger.debug("PDF trovato nell'iframe: %s", pdf_url)
                                 return volantini
                             
                             # Cerca anche script che potrebbero contenere URL PDF
@@ -403,12 +470,12 @@ class EurospinScraper:
                                             'citta': 'Nazionale'
                                         }
                                         volantini.append(volantino)
-                                        logger.info(f"PDF trovato negli script dell'iframe: {pdf_url}")
+                                        logger.debug("PDF trovato negli script dell'iframe: %s", pdf_url)
                                         return volantini
                             
                             # Se non trova PDF, usa l'URL del volantino digitale
                             if 'digitalflyer' in src.lower() or 'promotion' in src.lower():
-                                logger.info(f"Volantino digitale trovato (non PDF): {src}")
+                                logger.debug("Volantino digitale trovato (non PDF): %s", src)
                                 
                                 volantino = {
                                     'titolo': 'Volantino Eurospin Nazionale (Digitale)',
@@ -419,7 +486,7 @@ class EurospinScraper:
                                     'citta': 'Nazionale'
                                 }
                                 volantini.append(volantino)
-                                logger.info(f"Volantino digitale aggiunto: {src}")
+                                logger.debug("Volantino digitale aggiunto: %s", src)
                                 return volantini
                                         
                         except Exception as e:
@@ -438,7 +505,7 @@ class EurospinScraper:
                              'citta': 'Nazionale'
                          }
                         volantini.append(volantino)
-                        logger.info(f"PDF trovato in iframe: {pdf_url}")
+                        logger.debug("PDF trovato in iframe: %s", pdf_url)
                         return volantini
             
             # Cerca immagini del volantino che potrebbero avere link PDF
@@ -458,7 +525,7 @@ class EurospinScraper:
                              'citta': 'Nazionale'
                          }
                         volantini.append(volantino)
-                        logger.info(f"PDF trovato tramite immagine: {pdf_url}")
+                        logger.debug("PDF trovato tramite immagine: %s", pdf_url)
                         return volantini
             
             # Prima cerca specificamente il PDF nella sezione 'Sfoglia volantino'
@@ -510,13 +577,13 @@ class EurospinScraper:
                 for iframe in iframes:
                     src = iframe.get('src')
                     if src and ('volantino' in src.lower() or 'leaflet' in src.lower() or 'flyer' in src.lower()):
-                        logger.info(f"Iframe volantino trovato: {src}")
+                        logger.debug("Iframe volantino trovato: %s", src)
             
             # Cerca script che potrebbero contenere dati del volantino
             scripts = soup.find_all('script')
             for script in scripts:
                 if script.string and ('volantino' in script.string.lower() or 'pdf' in script.string.lower()):
-                    logger.info("Script con riferimenti a volantino trovato")
+                    logger.debug("Script con riferimenti a volantino trovato")
                     # Cerca URL PDF nel contenuto JavaScript
                     import re
                     pdf_matches = re.findall(r'["\']([^"\'\']*\.pdf[^"\'\']*)["\']', script.string)
@@ -534,7 +601,7 @@ class EurospinScraper:
                                 'pages': 'Da definire'
                             }
                             volantini.append(volantino)
-                            logger.info(f"PDF trovato in script: {pdf_url}")
+                            logger.debug("PDF trovato in script: %s", pdf_url)
             
             # Se non troviamo elementi specifici, cerchiamo link PDF
             if not volantino_elements:
@@ -558,7 +625,7 @@ class EurospinScraper:
                         
                         # Salta le informative
                         if 'informativa' in title.lower() or 'comunicazioni' in title.lower():
-                            logger.info(f"Saltato documento informativo: {title}")
+                            logger.debug("Saltato documento informativo: %s", title)
                             continue
                         
                         volantino = {
@@ -573,7 +640,7 @@ class EurospinScraper:
                         }
                         
                         volantini.append(volantino)
-                        logger.info(f"Volantino trovato: {title} - {pdf_url}")
+                        logger.debug("Volantino trovato: %s - %s", title, pdf_url)
             
             # Se abbiamo trovato elementi specifici, estraiamo le informazioni
             else:
@@ -608,7 +675,7 @@ class EurospinScraper:
                             }
                             
                             volantini.append(volantino)
-                            logger.info(f"Volantino trovato: {title} - {pdf_url}")
+                            logger.debug("Volantino trovato: %s - %s", title, pdf_url)
                     
                     except Exception as e:
                         logger.error(f"Errore nell'estrazione di un volantino: {e}")
@@ -631,6 +698,7 @@ class EurospinScraper:
             })
             return []
     
+    @tracing.traced('download')
     def download_pdf(self, volantino):
         """Scarica un singolo PDF"""
         try:
@@ -650,32 +718,30 @@ class EurospinScraper:
                 logger.info(f"File già esistente: {filename}")
                 return str(filepath)
             
-            logger.info(f"Download di: {title} da {pdf_url}")
-            
-            # Download del PDF
-            response = self.session.get(pdf_url, timeout=60)
-            response.raise_for_status()
-            
-            # Verifica che sia un PDF
-            content_type = response.headers.get('content-type', '').lower()
-            content_text = response.content.decode('utf-8', errors='ignore')[:100].lower()
-            
-            # Controlla se il contenuto è HTML invece di PDF
-            if ('html' in content_type or 'text' in content_type or 
-                '<!doctype html>' in content_text or '<html' in content_text):
-                logger.warning(f"Contenuto HTML rilevato invece di PDF per {title}. Saltando il download.")
-                volantino['downloaded'] = False
-                volantino['error'] = 'Contenuto HTML invece di PDF'
+            if pdf_url in self.fetched_urls:
+                logger.info(f"URL già scaricato in questa esecuzione: {pdf_url}")
                 return None
             
-            if 'pdf' not in content_type and not pdf_url.lower().endswith('.pdf'):
-                logger.warning(f"Il contenuto potrebbe non essere un PDF: {content_type}")
+            logger.info(f"Download di: {title} da {pdf_url}")
             
-            # Salva il file solo se è un vero PDF
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            # Download del PDF in streaming: il tipo si decide sul primo blocco e
+            # un trasferimento interrotto nell'esecuzione precedente riprende con Range
+            with StreamedDownload(self.session, pdf_url, timeout=60, stats=self.stats, dest_path=filepath) as download:
+                if not self.fetched_urls.add(self.redirects.record(download.response, pdf_url)):
+                    logger.info(f"Redirect verso un PDF già scaricato: {download.response.url}")
+                    return None
+                
+                # Pagine HTML di errore, immagini o contenuti sconosciuti: connessione chiusa subito
+                if not download.expect('pdf'):
+                    logger.warning(f"Contenuto {download.kind} ({download.content_type}) invece di PDF per {title}. Saltando il download.")
+                    volantino['downloaded'] = False
+                    volantino['error'] = f'Contenuto {download.kind} invece di PDF'
+                    return None
+                
+                # Salva il file solo se è un vero PDF
+                saved = download.save()
             
-            file_size = len(response.content)
+            file_size = saved['size']
             logger.info(f"PDF scaricato: {filename} ({file_size} bytes)")
             
             # Aggiorna statistiche
@@ -709,6 +775,7 @@ class EurospinScraper:
             })
             return None
     
+    @tracing.traced('upload', arg='file')
     def upload_to_volantinomix(self, file_path, store_info):
         """Carica il PDF nel sistema VolantinoMix usando l'endpoint specifico di Eurospin"""
         try:
@@ -748,40 +815,63 @@ class EurospinScraper:
             logger.error(f"❌ Errore upload: {e}")
             return False
     
+    def check_for_changes(self):
+        """Probe economico: solo la home con GET condizionale, impronta dei link ai volantini"""
+        probe = ChangeProbe(self.download_dir / STATE_FILENAME, self.session, source='eurospin')
+        return probe.run(self.base_url, lambda html, base: extract_flyer_links(
+            html, base, ('volantino', 'sfoglia', 'digitalflyer')))
+    
+    def commit_probe(self):
+        """Conferma l'impronta del probe dopo uno scraping completo riuscito"""
+        return commit_pending(self.download_dir / STATE_FILENAME)
+    
+    @tracing.traced('source', source='eurospin')
     def scrape(self):
         """Esegue lo scraping completo"""
         logger.info("=== INIZIO SCRAPING EUROSPIN ===")
         start_time = time.time()
+        self.run_started_at = datetime.now().isoformat()
+        # I contatori del file di statistiche sono cumulativi: per le metriche serve il delta del run
+        counts_at_start = {key: self.stats.get(key, 0) for key in RUN_COUNTERS.values()}
         
         try:
             # Reset statistiche per questa sessione
             self.stats["errors"] = []
+            self.stats["rejected"] = {}
             
-            # Prova prima con le API
-            logger.info("Tentativo di ricerca tramite API...")
-            api_data = self.search_api_endpoints()
+            # Prova le strategie nell'ordine appreso dalle esecuzioni precedenti,
+            # saltando quelle con circuit breaker aperto
+            strategies = {
+                'html': self.search_volantini_html,
+                'alternative': self.search_alternative_sources
+            }
             volantini = []
             
-            if api_data:
-                logger.info("Dati trovati tramite API")
-                # Processa i dati API se disponibili
-                # Questo dipende dalla struttura specifica dell'API
-            
-            # Se non troviamo dati tramite API, usa lo scraping HTML
-            if not volantini:
-                logger.info("Ricerca tramite scraping HTML...")
-                html_content = self.get_volantini_page()
-                if not html_content:
-                    logger.error("Impossibile ottenere la pagina dei volantini")
-                    return False
+            for name in self.strategy_tracker.available(list(strategies)):
+                logger.info(f"Strategia '{name}' (successo storico: {self.strategy_tracker.success_rate(name):.0%})")
+                started = time.time()
+                try:
+                    volantini = strategies[name]()
+                except Exception as e:
+                    logger.error(f"Errore nella strategia '{name}': {e}")
+                    volantini = []
+                if volantini is None:
+                    # Nessun tentativo reale (sorgenti in cooldown): non è un fallimento della strategia
+                    logger.info(f"Strategia '{name}' saltata: tutte le sorgenti sono in cooldown")
+                    volantini = []
+                    continue
+                self.strategy_tracker.record(name, bool(volantini), time.time() - started, len(volantini))
                 
-                # Estrai informazioni sui volantini
-                volantini = self.extract_volantini_info(html_content)
+                if volantini:
+                    logger.info(f"Strategia '{name}': {len(volantini)} volantini trovati")
+                    break
             
-            # Se ancora non troviamo volantini, prova sui siti alternativi
-            if not volantini:
-                logger.info("Ricerca su siti alternativi...")
-                volantini = self.search_alternative_sources()
+            self.strategy_tracker.save()
+            
+            # Stesso PDF trovato con URL diversi (tracking, http/https, percorsi relativi)
+            unique_urls = URLSet(redirects=self.redirects)
+            volantini = [v for v in volantini
+                         if not (v.get('pdf_url') or v.get('url')) or unique_urls.add(v.get('pdf_url') or v.get('url'))]
             
             if not volantini:
                 logger.warning("Nessun volantino trovato con nessun metodo")
@@ -815,8 +905,34 @@ class EurospinScraper:
                         'cap': '00100'  # CAP di default per Roma
                     }
                     
+                    hashes, match = self.near_duplicates.check(filepath)
+                    if match and self.near_duplicates.skip:
+                        logger.info(f"🔁 Quasi-duplicato di {match[0]} (distanza {match[1]:.1f}), upload saltato")
+                        self.stats['near_duplicates'] = self.stats.get('near_duplicates', 0) + 1
+                        continue
+                    if match:
+                        # Soglia non ancora tarata: il match viene segnalato, l'upload prosegue
+                        logger.warning(f"🔁 NEAR_DUPLICATE {os.path.basename(filepath)} ~ {match[0]} (distanza {match[1]:.1f}), upload comunque")
+                        self.stats['near_duplicates_flagged'] = self.stats.get('near_duplicates_flagged', 0) + 1
+                    
+                    signature, outcome, text_match = self.text_duplicates.classify(filepath)
+                    if outcome == 'duplicate' and self.text_duplicates.skip:
+                        logger.info(f"🔁 Duplicato testuale di {text_match[0]} (Jaccard {text_match[1]:.2f}), upload saltato")
+                        self.stats['text_duplicates'] = self.stats.get('text_duplicates', 0) + 1
+                        continue
+                    if outcome == 'duplicate':
+                        # Come per i quasi duplicati: il match viene segnalato, l'upload prosegue
+                        logger.warning(f"🔁 TEXT_DUPLICATE {os.path.basename(filepath)} ~ {text_match[0]} (Jaccard {text_match[1]:.2f}), upload comunque")
+                        self.stats['text_duplicates_flagged'] = self.stats.get('text_duplicates_flagged', 0) + 1
+                    if outcome == 'new_version':
+                        logger.info(f"🆕 Nuova versione di {text_match[0]} (Jaccard {text_match[1]:.2f})")
+                    
                     upload_success = self.upload_to_volantinomix(filepath, store_info)
                     if upload_success:
+                        source_url = self.redirects.lookup(volantino.get('pdf_url') or volantino.get('url') or '')
+                        self.near_duplicates.register(os.path.abspath(filepath), hashes, source='eurospin', url=source_url)
+                        self.text_duplicates.register(os.path.abspath(filepath), signature, source='eurospin', url=source_url,
+                                                      previous_version=text_match[0] if outcome == 'new_version' else None)
                         logger.info(f"✓ Upload completato: {volantino.get('title') or volantino.get('titolo')}")
                     else:
                         logger.error(f"✗ Errore upload: {volantino.get('title') or volantino.get('titolo')}")
@@ -828,8 +944,8 @@ class EurospinScraper:
                     time.sleep(2)
             
             # Aggiorna statistiche
-            self.stats["volantini_details"] = volantini
-            self.save_stats()
+            self.save_stats(volantini)
+            self.redirects.save()
             
             # Riepilogo finale
             elapsed_time = time.time() - start_time
@@ -839,7 +955,10 @@ class EurospinScraper:
             logger.info(f"Volantini scaricati: {self.stats['total_volantini_downloaded']}")
             logger.info(f"Volantini caricati: {self.stats.get('uploaded', 0)}")
             logger.info(f"Duplicati saltati: {self.stats.get('duplicates', 0)}")
+            logger.info(f"Quasi-duplicati segnalati: {self.stats.get('near_duplicates_flagged', 0)}, saltati: {self.stats.get('near_duplicates', 0)}")
+            logger.info(f"Duplicati testuali segnalati: {self.stats.get('text_duplicates_flagged', 0)}, saltati: {self.stats.get('text_duplicates', 0)}")
             logger.info(f"Errori: {len(self.stats['errors'])}")
+            logger.info(f"Download scartati al primo blocco: {self.stats['rejected']}")
             
             return True
             
@@ -852,16 +971,42 @@ class EurospinScraper:
             })
             self.save_stats()
             return False
+        
+        finally:
+            run_stats = {name: self.stats.get(key, 0) - counts_at_start[key] for name, key in RUN_COUNTERS.items()}
+            run_stats['found'] = self.stats.get('total_volantini_found', 0)
+            run_stats['errors'] = len(self.stats.get('errors', []))
+            run_stats['rejected'] = self.stats.get('rejected')
+            metrics.finish_run('eurospin', run_stats, start_time)
 
 def main():
     """Funzione principale"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Scraper Eurospin per VolantinoMix')
+    parser.add_argument('--probe', action='store_true',
+                        help='Controlla solo se la home è cambiata (exit 10 = cambiata, 0 = invariata, 1 = errore)')
+    parser.add_argument('--probe-commit', action='store_true',
+                        help="Conferma l'impronta dell'ultimo probe dopo uno scraping completo riuscito")
+    parser.add_argument('--verbose', action='store_true',
+                        help='Log di DEBUG, con i singoli link e PDF esaminati')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    
+    configure_logging(logging.DEBUG if args.verbose else logging.INFO)
     scraper = EurospinScraper()
-    success = scraper.scrape()
+    if args.probe:
+        sys.exit(exit_code(scraper.check_for_changes()))
+    if args.probe_commit:
+        scraper.commit_probe()
+        return True
+    
+    success = profiling.run_profiled(args.profile, 'eurospin', scraper.scrape)
     
     if success:
         print("\n✓ Scraping Eurospin completato con successo!")
         print(f"I volantini sono stati salvati in: {scraper.download_dir}")
-        print(f"Statistiche salvate in: {scraper.stats_file}")
+        print(f"Storico dei run in: {scraper.history.history_dir}")
     else:
         print("\n✗ Errore durante lo scraping Eurospin")
         print("Controlla i log per maggiori dettagli")
@@ -869,4 +1014,4 @@ def main():
     return success
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(0 if main() else 1)
\ No newline at end of file
@@ -9,28 +9,58 @@ Autore: VolantinoMix Team
 """
 
 import requests
-from bs4 import BeautifulSoup
 import os
-import hashlib
+import sys
 import json
 import time
 from urllib.parse import urljoin, urlparse
 from pathlib import Path
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-try:
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    SELENIUM_AVAILABLE = True
-except ImportError:
-    SELENIUM_AVAILABLE = False
-    print("⚠️  Selenium non disponibile. Usando solo requests/BeautifulSoup.")
+from hashing import LEGACY_HASH, HashCache
+from headless_browser import SELENIUM_AVAILABLE, headless_browser, wait_for_page_ready
+from url_utils import URLSet
+from downloads import StreamedDownload
+import metrics
+import tracing
+import profiling
+from change_probe import STATE_FILENAME, ChangeProbe, commit_pending, exit_code, extract_flyer_links
+
+# Il PDF di ogni volantino è scaricabile dall'API conoscendo l'ID numerico di sfoglia.php/{id}
+PDF_API_URL = "https://app.coopgrupporadenza.it/api/frontend/volantino/scarica-pdf/0/{volantino_id}"
+SFOGLIA_ID_RE = re.compile(r'/sfoglia\.php/(\d+)')
+
+DIRECT_PDF_SELECTOR = "a[href*='.pdf'], a[href*='pdf']"
+VOLANTINO_SELECTOR = ".volantino-inner, .col-volantino, [data-id], [data-pdf], [data-url]"
+
+# Estrae in un solo round trip link diretti e candidati volantino (attributi + link figli).
+# arguments[0] = selettore link diretti, arguments[1] = selettore elementi volantino
+EXTRACT_CANDIDATES_JS = """
+const toLink = (a) => ({
+    href: a.href || '',
+    text: (a.innerText || '').trim(),
+    title: a.getAttribute('title') || ''
+});
+const direct = Array.from(document.querySelectorAll(arguments[0])).map(toLink);
+const candidates = Array.from(document.querySelectorAll(arguments[1])).map((el) => {
+    const attrs = {};
+    for (const attr of el.attributes) {
+        attrs[attr.name] = attr.value;
+    }
+    return {
+        tag: el.tagName.toLowerCase(),
+        text: (el.innerText || '').trim(),
+        attrs: attrs,
+        links: Array.from(el.querySelectorAll('a')).map(toLink)
+    };
+});
+return JSON.stringify({direct: direct, candidates: candidates});
+"""
 
 class IpercoopVolantiniScraper:
-    def __init__(self, download_folder="volantini_ipercoop", api_base_url=None):
+    def __init__(self, download_folder="volantini_ipercoop", api_base_url=None, verbose=False, render_timeout=15, probe_window=10, probe_workers=8, probe_per_host=4):
         # Auto-detect API URL based on environment
         if api_base_url is None:
             port = os.environ.get('PORT', '3000')
@@ -39,6 +69,17 @@ class IpercoopVolantiniScraper:
         self.volantini_url = "https://volantini.coopgrupporadenza.it/"
         self.download_folder = Path(download_folder)
         self.api_base_url = api_base_url
+        # Dump di debug per ogni elemento volantino (solo con --verbose)
+        self.verbose = verbose
+        # Limite massimo (secondi) di attesa del rendering JavaScript
+        self.render_timeout = render_timeout
+        # Ampiezza della finestra di ID sondati oltre l'high-water mark e richieste HEAD parallele
+        self.probe_window = probe_window
+        self.probe_workers = probe_workers
+        # Limite di richieste HEAD contemporanee verso lo stesso host
+        self.probe_per_host = probe_per_host
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
         self.session = requests.Session()
         
         # Headers per evitare blocchi
@@ -50,10 +91,26 @@ class IpercoopVolantiniScraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         })
+        # Latenze e byte di fetch, download e upload per le metriche Prometheus
+        metrics.instrument_session(self.session, 'ipercoop')
+        tracing.instrument_session(self.session)
+        self.started_at = time.time()
         
         # Crea cartella download
         self.download_folder.mkdir(exist_ok=True)
         
+        # Digest dei file locali: i file invariati non vengono riletti
+        self.hash_cache = HashCache(self.download_folder / '.hash_cache.json')
+        
+        # Stato della modalità per ID: high-water mark e ID già scaricati
+        self.state_file = self.download_folder / 'ipercoop_state.json'
+        self.state = self.load_state()
+        
+        # Cache degli esiti HEAD per ID: gli ID già confermati come PDF non vengono più sondati
+        self.probe_cache_file = self.download_folder / 'ipercoop_probe_cache.json'
+        self.probe_cache = self.load_probe_cache()
+        self._probe_cache_lock = threading.Lock()
+        
         # Statistiche
         self.stats = {
             'found': 0,
@@ -65,12 +122,170 @@ class IpercoopVolantiniScraper:
 
     def get_file_hash(self, file_path):
         """Calcola hash MD5 del file"""
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        return self.hash_cache.get(file_path)[LEGACY_HASH]
+
+    def load_state(self):
+        """Carica lo stato della modalità per ID"""
+        state = {'high_water_mark': 0, 'downloaded_ids': []}
+        try:
+            if self.state_file.exists():
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state.update(json.load(f))
+        except Exception as e:
+            print(f"⚠️  Stato Ipercoop non leggibile, riparto da zero: {e}")
+        return state
+
+    def save_state(self):
+        """Salva lo stato della modalità per ID"""
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+
+    def mark_downloaded(self, volantino_id):
+        """Registra un ID come scaricato e aggiorna l'high-water mark"""
+        if volantino_id not in self.state['downloaded_ids']:
+            self.state['downloaded_ids'].append(volantino_id)
+        self.state['high_water_mark'] = max(self.state['high_water_mark'], volantino_id)
+        self.save_state()
+
+    def collect_volantino_ids(self):
+        """Raccoglie gli ID sfoglia.php/{id} presenti nell'HTML statico della pagina"""
+        try:
+            response = self.session.get(self.volantini_url, timeout=30)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"⚠️  Pagina volantini non raggiungibile: {e}")
+            self.stats['errors'] += 1
+            return set()
+        return {int(match) for match in SFOGLIA_ID_RE.findall(response.text)}
+
+    def load_probe_cache(self):
+        """Carica la cache degli esiti HEAD (chiave: ID volantino)"""
+        try:
+            if self.probe_cache_file.exists():
+                with open(self.probe_cache_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"⚠️  Cache probe Ipercoop non leggibile: {e}")
+        return {}
+
+    def save_probe_cache(self):
+        """Salva la cache degli esiti HEAD"""
+        with self._probe_cache_lock:
+            snapshot = dict(self.probe_cache)
+        with open(self.probe_cache_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+
+    def _host_slot(self, url):
+        """Semaforo che limita le richieste contemporanee verso l'host dell'URL"""
+        host = urlparse(url).netloc.lower()
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.probe_per_host)
+            return self._host_slots[host]
+
+    def probe_volantino_id(self, volantino_id):
+        """Verifica con una richiesta HEAD che l'API restituisca il PDF dell'ID"""
+        key = str(volantino_id)
+        with self._probe_cache_lock:
+            cached = self.probe_cache.get(key)
+        if cached and cached['is_pdf']:
+            return cached
+        
+        pdf_api_url = PDF_API_URL.format(volantino_id=volantino_id)
+        result = {
+            'status': None,
+            'content_type': '',
+            'content_disposition': '',
+            'content_length': None,
+            'is_pdf': False,
+            'checked_at': datetime.now().isoformat()
+        }
+        try:
+            with self._host_slot(pdf_api_url):
+                response = self.session.head(pdf_api_url, timeout=10)
+        except Exception as e:
+            # Errore di rete: non va in cache, l'ID verrà sondato di nuovo
+            print(f"⚠️  HEAD fallita per ID {volantino_id}: {e}")
+            result['error'] = str(e)
+            return result
+        
+        content_type = response.headers.get('content-type', '').lower()
+        content_disposition = response.headers.get('content-disposition', '')
+        content_length = response.headers.get('content-length')
+        result.update({
+            'status': response.status_code,
+            'content_type': content_type,
+            'content_disposition': content_disposition,
+            'content_length': int(content_length) if content_length and content_length.isdigit() else None,
+            'is_pdf': response.status_code == 200 and (
+                'pdf' in content_type or 'application/octet-stream' in content_type
+                or 'attachment' in content_disposition)
+        })
+        with self._probe_cache_lock:
+            self.probe_cache[key] = result
+        return result
+
+    @tracing.traced('probe')
+    def probe_volantino_ids(self, ids):
+        """Sonda un insieme di ID in parallelo, restituisce quelli che hanno un PDF"""
+        ids = sorted(ids)
+        if not ids:
+            return []
+        with ThreadPoolExecutor(max_workers=self.probe_workers) as executor:
+            results = list(executor.map(self.probe_volantino_id, ids))
+        self.save_probe_cache()
+        # Le HEAD senza risposta sono errori, non ID inesistenti (404)
+        self.stats['errors'] += sum(1 for result in results if 'error' in result)
+        return [volantino_id for volantino_id, result in zip(ids, results) if result['is_pdf']]
 
+    def pdf_link_for_id(self, volantino_id):
+        """Descrittore del PDF scaricabile dall'API per un ID"""
+        return {
+            'url': PDF_API_URL.format(volantino_id=volantino_id),
+            'text': f'Volantino Ipercoop {volantino_id}',
+            'title': f'Volantino Ipercoop {volantino_id}',
+            'volantino_id': volantino_id
+        }
+
+    def extract_pdf_links_by_id(self, max_windows=5):
+        """
+        Modalità senza browser: enumera gli ID dei volantini e sonda l'API PDF.
+        Parte dagli ID nell'HTML statico e dall'high-water mark salvato, poi fa scorrere
+        una finestra di ID oltre il massimo noto finché trova nuovi volantini.
+        Restituisce None se non ha alcun ID da cui partire o se, senza nuovi ID trovati,
+        qualche richiesta è fallita per errore di rete.
+        """
+        errors_at_start = self.stats['errors']
+        static_ids = self.collect_volantino_ids()
+        high_water_mark = max([self.state['high_water_mark'], *static_ids])
+        if not high_water_mark:
+            print("⚠️  Nessun ID volantino noto: impossibile usare la modalità per ID")
+            return None
+        print(f"🆔 ID nell'HTML statico: {len(static_ids)}, high-water mark: {high_water_mark}")
+
+        downloaded = set(self.state['downloaded_ids'])
+        valid_ids = self.probe_volantino_ids(static_ids - downloaded)
+
+        # Finestra scorrevole oltre l'ID più alto noto
+        start = high_water_mark + 1
+        for _ in range(max_windows):
+            window = set(range(start, start + self.probe_window)) - downloaded
+            found = self.probe_volantino_ids(window)
+            if not found:
+                break
+            valid_ids.extend(found)
+            start = max(found) + 1
+
+        new_ids = sorted(set(valid_ids) - downloaded)
+        print(f"🆕 Nuovi ID con PDF: {new_ids or 'nessuno'}")
+        network_errors = self.stats['errors'] - errors_at_start
+        if network_errors and not new_ids:
+            # Senza risposta non si distingue "nessun volantino nuovo" da "API irraggiungibile"
+            print(f"⚠️  {network_errors} richieste fallite per errore di rete: esito per ID non affidabile")
+            return None
+        return [self.pdf_link_for_id(volantino_id) for volantino_id in new_ids]
+
+    @tracing.traced('selenium')
     def extract_pdf_links_selenium(self):
         """Estrae i link ai PDF usando Selenium per gestire JavaScript"""
         if not SELENIUM_AVAILABLE:
@@ -80,147 +295,119 @@ class IpercoopVolantiniScraper:
         pdf_links = []
         
         try:
-            # Configura Chrome in modalità headless
-            chrome_options = Options()
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-            
-            driver = webdriver.Chrome(options=chrome_options)
-            
-            print(f"🌐 Caricamento pagina con Selenium: {self.volantini_url}")
-            driver.get(self.volantini_url)
-            
-            # Aspetta che la pagina si carichi completamente
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            
-            # Aspetta un po' di più per il caricamento JavaScript
-            time.sleep(3)
-            
-            # Prima cerca link diretti ai PDF
-            direct_pdf_links = driver.find_elements(By.CSS_SELECTOR, "a[href*='.pdf'], a[href*='pdf']")
-            for link in direct_pdf_links:
-                href = link.get_attribute('href')
-                if href and ('.pdf' in href.lower() or href.lower().endswith('.pdf')):
-                    pdf_links.append({
-                        'url': href,
-                        'text': link.text or 'Volantino Ipercoop',
-                        'title': link.get_attribute('title') or 'Volantino Ipercoop'
-                    })
-                    print(f"📄 Trovato PDF diretto: {href}")
-            
-            # Cerca elementi volantino con attributi data
-            volantino_elements = driver.find_elements(By.CSS_SELECTOR, ".volantino-inner, .col-volantino, [data-id], [data-pdf], [data-url]")
-            print(f"🔍 Trovati {len(volantino_elements)} elementi volantino")
-            
-            for i, element in enumerate(volantino_elements):
-                try:
-                    print(f"\n🔍 Debug elemento {i+1}:")
-                    print(f"   Tag: {element.tag_name}")
-                    print(f"   Classe: {element.get_attribute('class')}")
-                    print(f"   Testo: {element.text[:100] if element.text else 'Nessun testo'}")
-                    
-                    # Controlla tutti gli attributi
-                    all_attrs = driver.execute_script("return arguments[0].attributes;", element)
-                    for attr_name in ['data-pdf', 'data-url', 'data-href', 'data-link', 'data-id', 'href', 'onclick']:
-                        attr_value = element.get_attribute(attr_name)
-                        if attr_value:
-                            print(f"   {attr_name}: {attr_value}")
-                    
-                    # Cerca link figli
-                    child_links = element.find_elements(By.TAG_NAME, "a")
-                    for link in child_links:
-                        href = link.get_attribute('href')
-                        if href:
-                            print(f"   Link figlio: {href}")
-                            # Controlla se è un link PDF diretto
-                            if '.pdf' in href.lower():
-                                pdf_links.append({
-                                    'url': href,
-                                    'text': link.text or element.text or 'Volantino Ipercoop',
-                                    'title': 'Volantino Ipercoop'
-                                })
-                                print(f"📄 Trovato PDF da link figlio: {href}")
-                            # Controlla se è un link a pagina di sfoglia
-                            elif 'sfoglia.php' in href:
-                                print(f"🔍 Trovato link sfoglia, cerco PDF nella pagina: {href}")
-                                sfoglia_pdf = self.extract_pdf_from_sfoglia_page(driver, href)
-                                if sfoglia_pdf:
-                                    pdf_links.extend(sfoglia_pdf)
-                                    print(f"📄 Trovati {len(sfoglia_pdf)} PDF dalla pagina sfoglia")
-                    
-                    # Controlla attributi data per URL PDF
-                    for attr in ['data-pdf', 'data-url', 'data-href', 'data-link']:
-                        pdf_url = element.get_attribute(attr)
-                        if pdf_url and ('.pdf' in pdf_url.lower() or pdf_url.lower().endswith('.pdf')):
-                            pdf_links.append({
-                                'url': pdf_url,
-                                'text': element.text or 'Volantino Ipercoop',
-                                'title': element.get_attribute('title') or 'Volantino Ipercoop'
-                            })
-                            print(f"📄 Trovato PDF da attributo {attr}: {pdf_url}")
-                            break
-                    
-                except Exception as e:
-                    print(f"⚠️  Errore nell'elaborazione elemento {i+1}: {e}")
-                    continue
-            
-            driver.quit()
-            
+            with headless_browser() as driver:
+                sfoglia_urls = self._collect_pdf_links_selenium(driver, pdf_links)
+            
+            # Il browser è già chiuso: gli ID sfoglia si verificano con HEAD parallele
+            if sfoglia_urls:
+                sfoglia_pdf = self.extract_pdf_from_sfoglia_pages(sfoglia_urls)
+                pdf_links.extend(sfoglia_pdf)
+                print(f"📄 Trovati {len(sfoglia_pdf)} PDF dalle pagine sfoglia")
         except Exception as e:
             print(f"❌ Errore Selenium: {e}")
-            try:
-                driver.quit()
-            except:
-                pass
         
         return pdf_links
     
-    def extract_pdf_from_sfoglia_page(self, driver, sfoglia_url):
-        """Estrae PDF da una pagina di sfoglia usando l'API"""
-        pdf_links = []
+    def _collect_pdf_links_selenium(self, driver, pdf_links):
+        """Naviga la pagina volantini con il browser headless e raccoglie i link PDF.
+        Restituisce gli URL sfoglia.php trovati, da verificare sull'API"""
+        print(f"🌐 Caricamento pagina con Selenium: {self.volantini_url}")
+        driver.get(self.volantini_url)
         
-        try:
-            # Estrai l'ID del volantino dall'URL
-            # URL formato: https://volantini.coopgrupporadenza.it/sfoglia.php/360
-            import re
-            match = re.search(r'/sfoglia\.php/(\d+)', sfoglia_url)
-            if not match:
-                print(f"❌ Impossibile estrarre ID volantino da: {sfoglia_url}")
-                return pdf_links
-            
-            volantino_id = match.group(1)
-            print(f"🆔 ID volantino estratto: {volantino_id}")
-            
-            # Costruisci l'URL dell'API per scaricare il PDF
-            pdf_api_url = f"https://app.coopgrupporadenza.it/api/frontend/volantino/scarica-pdf/0/{volantino_id}"
-            
-            # Verifica che l'API restituisca un PDF
-            response = self.session.head(pdf_api_url, timeout=10)
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '').lower()
-                content_disposition = response.headers.get('content-disposition', '')
+        # Aspetta che le card volantino smettano di cambiare e la rete sia inattiva
+        started = time.monotonic()
+        cards = wait_for_page_ready(driver, VOLANTINO_SELECTOR, timeout=self.render_timeout)
+        print(f"⏱️  Pagina pronta in {time.monotonic() - started:.1f}s ({cards} card volantino)")
+        
+        # Estrae in un'unica chiamata WebDriver tutti i candidati con attributi e link figli
+        page_data = json.loads(driver.execute_script(EXTRACT_CANDIDATES_JS, DIRECT_PDF_SELECTOR, VOLANTINO_SELECTOR))
+        
+        # Prima cerca link diretti ai PDF
+        for link in page_data['direct']:
+            href = link['href']
+            if href and '.pdf' in href.lower():
+                pdf_links.append({
+                    'url': href,
+                    'text': link['text'] or 'Volantino Ipercoop',
+                    'title': link['title'] or 'Volantino Ipercoop'
+                })
+                print(f"📄 Trovato PDF diretto: {href}")
+        
+        # Cerca elementi volantino con attributi data
+        volantino_elements = page_data['candidates']
+        print(f"🔍 Trovati {len(volantino_elements)} elementi volantino")
+        
+        sfoglia_urls = []
+        for i, element in enumerate(volantino_elements):
+            try:
+                attrs = element['attrs']
+                text = element['text']
                 
-                if 'application/octet-stream' in content_type or 'attachment' in content_disposition:
-                    pdf_links.append({
-                        'url': pdf_api_url,
-                        'text': f'Volantino Ipercoop {volantino_id}',
-                        'title': f'Volantino Ipercoop {volantino_id}'
-                    })
-                    print(f"📄 PDF API trovato: {pdf_api_url}")
-                else:
-                    print(f"⚠️  L'API non restituisce un PDF: {content_type}")
+                if self.verbose:
+                    print(f"\n🔍 Debug elemento {i+1}:")
+                    print(f"   Tag: {element['tag']}")
+                    print(f"   Classe: {attrs.get('class')}")
+                    print(f"   Testo: {text[:100] if text else 'Nessun testo'}")
+                    for attr_name in ['data-pdf', 'data-url', 'data-href', 'data-link', 'data-id', 'href', 'onclick']:
+                        if attrs.get(attr_name):
+                            print(f"   {attr_name}: {attrs[attr_name]}")
+                
+                # Cerca link figli
+                for link in element['links']:
+                    href = link['href']
+                    if href:
+                        if self.verbose:
+                            print(f"   Link figlio: {href}")
+                        # Controlla se è un link PDF diretto
+                        if '.pdf' in href.lower():
+                            pdf_links.append({
+                                'url': href,
+                                'text': link['text'] or text or 'Volantino Ipercoop',
+                                'title': 'Volantino Ipercoop'
+                            })
+                            print(f"📄 Trovato PDF da link figlio: {href}")
+                        # Link a pagina di sfoglia: l'ID viene verificato dopo, in blocco
+                        elif 'sfoglia.php' in href:
+                            sfoglia_urls.append(href)
+                
+                # Controlla attributi data per URL PDF
+                for attr in ['data-pdf', 'data-url', 'data-href', 'data-link']:
+                    pdf_url = attrs.get(attr)
+                    if pdf_url and '.pdf' in pdf_url.lower():
+                        pdf_links.append({
+                            'url': pdf_url,
+                            'text': text or 'Volantino Ipercoop',
+                            'title': attrs.get('title') or 'Volantino Ipercoop'
+                        })
+                        print(f"📄 Trovato PDF da attributo {attr}: {pdf_url}")
+                        break
+                
+            except Exception as e:
+                print(f"⚠️  Errore nell'elaborazione elemento {i+1}: {e}")
+                continue
+        
+        return sfoglia_urls
+    
+    def extract_pdf_from_sfoglia_pages(self, sfoglia_urls):
+        """Estrae i PDF dalle pagine di sfoglia verificando gli ID sull'API in un'unica tornata"""
+        # URL formato: https://volantini.coopgrupporadenza.it/sfoglia.php/360
+        ids = set()
+        for sfoglia_url in sfoglia_urls:
+            match = SFOGLIA_ID_RE.search(sfoglia_url)
+            if match:
+                ids.add(int(match.group(1)))
             else:
-                print(f"❌ API non disponibile (status: {response.status_code}): {pdf_api_url}")
-            
-        except Exception as e:
-            print(f"❌ Errore nell'estrazione PDF da API: {e}")
+                print(f"❌ Impossibile estrarre ID volantino da: {sfoglia_url}")
         
-        return pdf_links
+        print(f"🆔 ID volantino da verificare: {sorted(ids)}")
+        valid_ids = self.probe_volantino_ids(ids)
+        for volantino_id in sorted(ids - set(valid_ids)):
+            result = self.probe_cache.get(str(volantino_id), {})
+            print(f"⚠️  L'API non restituisce un PDF per ID {volantino_id} (status: {result.get('status')}, {result.get('content_type')})")
+        
+        return [self.pdf_link_for_id(volantino_id) for volantino_id in valid_ids]
     
+    @tracing.traced('parse')
     def extract_pdf_links(self, soup, base_url):
         """Estrae i link ai PDF dalla pagina"""
         pdf_links = []
@@ -270,39 +457,16 @@ class IpercoopVolantiniScraper:
                         'title': link.get('title', '')
                     })
         
-        # Rimuovi duplicati
-        seen = set()
-        unique_links = []
-        for link in pdf_links:
-            if link['url'] not in seen:
-                seen.add(link['url'])
-                unique_links.append(link)
-        
-        return unique_links
+        # Rimuovi duplicati (confronto su URL canonico)
+        seen = URLSet()
+        return [link for link in pdf_links if seen.add(link['url'])]
 
+    @tracing.traced('download', arg='url')
     def download_pdf(self, pdf_url, filename=None):
         """Scarica un PDF"""
         try:
             print(f"📥 Scaricando: {pdf_url}")
             
-            response = self.session.get(pdf_url, timeout=30)
-            response.raise_for_status()
-            
-            # Verifica che sia effettivamente un PDF
-            content_type = response.headers.get('content-type', '').lower()
-            content_disposition = response.headers.get('content-disposition', '')
-            
-            # Accetta PDF diretti, octet-stream da API Ipercoop, o file con attachment
-            is_pdf = ('pdf' in content_type or 
-                     'application/octet-stream' in content_type or 
-                     'attachment' in content_disposition or 
-                     pdf_url.lower().endswith('.pdf') or 
-                     'scarica-pdf' in pdf_url)
-            
-            if not is_pdf:
-                print(f"⚠️  Non è un PDF: {content_type}")
-                return None
-            
             # Genera nome file se non fornito
             if not filename:
                 parsed_url = urlparse(pdf_url)
@@ -317,21 +481,23 @@ class IpercoopVolantiniScraper:
             
             file_path = self.download_folder / filename
             
-            # Controlla se il file esiste già
-            if file_path.exists():
-                existing_hash = self.get_file_hash(file_path)
-                new_hash = hashlib.md5(response.content).hexdigest()
-                if existing_hash == new_hash:
-                    print(f"⏭️  File già esistente: {filename}")
-                    self.stats['skipped'] += 1
-                    return file_path
+            # Un download interrotto in precedenza riprende dal file .part
+            with StreamedDownload(self.session, pdf_url, timeout=30, stats=self.stats, dest_path=file_path) as download:
+                # L'API Ipercoop risponde con octet-stream: decide il contenuto del primo blocco
+                if not download.expect('pdf'):
+                    print(f"⚠️  Non è un PDF: {download.kind} ({download.content_type})")
+                    return None
+                
+                # Se il file esiste già con lo stesso contenuto non viene riscritto
+                existing_hash = self.get_file_hash(file_path) if file_path.exists() else None
+                saved = download.save(unchanged_md5=existing_hash)
             
-            # Salva il file
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
+            if not saved['written']:
+                print(f"⏭️  File già esistente: {filename}")
+                self.stats['skipped'] += 1
+                return file_path
             
-            file_size = len(response.content)
-            print(f"✅ Scaricato: {filename} ({file_size:,} bytes)")
+            print(f"✅ Scaricato: {filename} ({saved['size']:,} bytes)")
             self.stats['downloaded'] += 1
             
             return file_path
@@ -352,6 +518,7 @@ class IpercoopVolantiniScraper:
             'scraped_at': datetime.now().isoformat()
         }
 
+    @tracing.traced('upload', arg='file')
     def upload_to_volantinomix(self, file_path, store_info):
         """Carica il PDF su VolantinoMix"""
         try:
@@ -367,7 +534,7 @@ class IpercoopVolantiniScraper:
                 'pdf_path': str(file_path.resolve())  # Percorso assoluto del file
             }
             
-            response = requests.post(upload_url, json=data, timeout=60)
+            response = self.session.post(upload_url, json=data, timeout=60)
             
             if response.status_code == 200:
                 result = response.json()
@@ -382,36 +549,84 @@ class IpercoopVolantiniScraper:
             print(f"❌ Errore upload {file_path.name}: {e}")
             return False
 
-    def scrape_and_upload(self):
-        """Esegue lo scraping completo e carica i PDF"""
+    def extract_pdf_links_browser(self):
+        """Estrae i link PDF con Selenium, ripiegando su requests/BeautifulSoup"""
+        from bs4 import BeautifulSoup
+        
+        pdf_links = []
+        
+        # Prova prima con Selenium se disponibile
+        if SELENIUM_AVAILABLE:
+            print("🔧 Tentativo con Selenium per contenuti dinamici...")
+            pdf_links = self.extract_pdf_links_selenium()
+        else:
+            print("⚠️  Selenium non disponibile. Usando solo requests/BeautifulSoup.")
+            
+        # Se Selenium non trova nulla o non è disponibile, usa il metodo tradizionale
+        if not pdf_links:
+            print("📄 Caricamento pagina con requests/BeautifulSoup...")
+            response = self.session.get(self.volantini_url, timeout=30)
+            response.raise_for_status()
+            
+            soup = BeautifulSoup(response.content, 'html.parser')
+            pdf_links = self.extract_pdf_links(soup, self.volantini_url)
+        
+        return pdf_links
+
+    def check_for_changes(self):
+        """Probe economico: solo la pagina volantini con GET condizionale, senza browser né API"""
+        def extract_links(html, base):
+            from bs4 import BeautifulSoup
+            
+            soup = BeautifulSoup(html, 'html.parser')
+            links = [link['url'] for link in self.extract_pdf_links(soup, base)]
+            return links + extract_flyer_links(html, base, ('sfoglia', 'volantin'))
+        
+        probe = ChangeProbe(self.download_folder / STATE_FILENAME, self.session, source='ipercoop')
+        return probe.run(self.volantini_url, extract_links)
+
+    def commit_probe(self):
+        """Conferma l'impronta del probe dopo uno scraping completo riuscito"""
+        return commit_pending(self.download_folder / STATE_FILENAME)
+
+    @tracing.traced('source', source='ipercoop')
+    def scrape_and_upload(self, mode='auto'):
+        """
+        Esegue lo scraping completo e carica i PDF.
+        mode: 'id' solo enumerazione degli ID via API, 'browser' solo Selenium/BeautifulSoup,
+        'auto' enumerazione per ID e ripiego sul browser se non ci sono ID noti
+        o se le richieste per ID falliscono per errore di rete.
+        Restituisce True solo se lo scraping è arrivato in fondo senza errori
+        (l'uscita 0 del processo conferma l'impronta del probe).
+        """
         print("🚀 Avvio scraping Ipercoop...")
         print(f"📂 Cartella download: {self.download_folder}")
         print(f"🌐 URL base: {self.volantini_url}")
         
         try:
-            pdf_links = []
-            
-            # Prova prima con Selenium se disponibile
-            if SELENIUM_AVAILABLE:
-                print("🔧 Tentativo con Selenium per contenuti dinamici...")
-                pdf_links = self.extract_pdf_links_selenium()
-                
-            # Se Selenium non trova nulla o non è disponibile, usa il metodo tradizionale
-            if not pdf_links:
-                print("📄 Caricamento pagina con requests/BeautifulSoup...")
-                response = self.session.get(self.volantini_url, timeout=30)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                pdf_links = self.extract_pdf_links(soup, self.volantini_url)
-            
+            pdf_links = None
+            
+            # Modalità senza browser: poche richieste HTTP leggere
+            if mode in ('auto', 'id'):
+                print("🆔 Enumerazione ID volantini senza browser...")
+                pdf_links = self.extract_pdf_links_by_id()
+                if pdf_links is not None and not pdf_links:
+                    print("✅ Nessun nuovo volantino rispetto all'ultima esecuzione")
+                    return True
+            
+            if pdf_links is None and mode != 'id':
+                pdf_links = self.extract_pdf_links_browser()
+            
+            # Lo stesso PDF può arrivare da più elementi della pagina o con parametri diversi
+            seen = URLSet()
+            pdf_links = [link for link in pdf_links or [] if seen.add(link['url'], base=self.volantini_url)]
             self.stats['found'] = len(pdf_links)
             
             print(f"🔍 Trovati {len(pdf_links)} potenziali PDF")
             
             if not pdf_links:
                 print("⚠️  Nessun PDF trovato. Il sito potrebbe aver cambiato struttura.")
-                return
+                return False
             
             # Scarica ogni PDF
             for i, pdf_info in enumerate(pdf_links, 1):
@@ -429,6 +644,9 @@ class IpercoopVolantiniScraper:
                 file_path = self.download_pdf(pdf_info['url'], filename)
                 
                 if file_path:
+                    if pdf_info.get('volantino_id'):
+                        self.mark_downloaded(pdf_info['volantino_id'])
+                    
                     # Estrai info negozio
                     store_info = self.extract_store_info(file_path.name, pdf_info['url'])
                     
@@ -438,9 +656,12 @@ class IpercoopVolantiniScraper:
                 # Pausa tra download
                 time.sleep(1)
             
+            return self.stats['errors'] == 0
+            
         except Exception as e:
             print(f"❌ Errore durante lo scraping: {e}")
             self.stats['errors'] += 1
+            return False
         
         finally:
             self.print_summary()
@@ -455,8 +676,13 @@ class IpercoopVolantiniScraper:
         print(f"⏭️  PDF saltati (già esistenti): {self.stats['skipped']}")
         print(f"☁️  PDF caricati su VolantinoMix: {self.stats['uploaded']}")
         print(f"❌ Errori: {self.stats['errors']}")
+        if self.stats.get('rejected'):
+            print(f"🚫 Scartati al primo blocco: {self.stats['rejected']}")
         print("="*50)
         
+        self.hash_cache.save()
+        metrics.finish_run('ipercoop', self.stats, self.started_at)
+        
         # Salva statistiche
         stats_file = self.download_folder / 'ipercoop_scraping_stats.json'
         with open(stats_file, 'w', encoding='utf-8') as f:
@@ -468,13 +694,38 @@ class IpercoopVolantiniScraper:
 
 def main():
     """Funzione principale"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Scraper Ipercoop per VolantinoMix')
+    parser.add_argument('--verbose', action='store_true', help='Stampa il dump di debug degli elementi volantino')
+    parser.add_argument('--mode', choices=['auto', 'id', 'browser'], default='auto',
+                        help="auto: ID via API con ripiego sul browser, id: solo API senza browser, browser: solo Selenium/HTML")
+    parser.add_argument('--render-timeout', type=float, default=15, help='Attesa massima in secondi del rendering della pagina (default: 15)')
+    parser.add_argument('--probe', action='store_true',
+                        help='Controlla solo se la pagina volantini è cambiata (exit 10 = cambiata, 0 = invariata, 1 = errore)')
+    parser.add_argument('--probe-commit', action='store_true',
+                        help="Conferma l'impronta dell'ultimo probe dopo uno scraping completo riuscito")
+    profiling.add_argument(parser)
+    
+    args = parser.parse_args()
+    
+    if args.probe:
+        scraper = IpercoopVolantiniScraper(verbose=args.verbose)
+        sys.exit(exit_code(scraper.check_for_changes()))
+    if args.probe_commit:
+        IpercoopVolantiniScraper(verbose=args.verbose).commit_probe()
+        return
+    
+    success = False
     try:
-        scraper = IpercoopVolantiniScraper()
-        scraper.scrape_and_upload()
+        scraper = IpercoopVolantiniScraper(verbose=args.verbose, render_timeout=args.render_timeout)
+        success = profiling.run_profiled(args.profile, 'ipercoop', scraper.scrape_and_upload, mode=args.mode)
     except KeyboardInterrupt:
         print("\n⏹️  Scraping interrotto dall'utente")
     except Exception as e:
         print(f"❌ Errore fatale: {e}")
+    # Uscita 1 se lo scraping fallisce: lo scheduler non conferma l'impronta del probe
+    sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,11 +4,18 @@
 Scraper MD (sito ufficiale) – recupera link PDF dalla sezione volantino e carica su VolantinoMix
 """
 import os
+import sys
 import time
 from urllib.parse import urljoin, urlparse
 from pathlib import Path
 import requests
-from bs4 import BeautifulSoup
+
+from url_utils import RedirectCache, URLSet
+from downloads import StreamedDownload
+import metrics
+import tracing
+import profiling
+from change_probe import STATE_FILENAME, ChangeProbe, commit_pending, exit_code, extract_flyer_links
 
 
 class MDSiteScraper:
@@ -26,43 +33,60 @@ class MDSiteScraper:
             "Accept-Language": "it-IT,it;q=0.9,en;q=0.8",
             "Connection": "keep-alive",
         })
+        # Latenze e byte di fetch, download e upload per le metriche Prometheus
+        metrics.instrument_session(self.session, "md-site")
+        tracing.instrument_session(self.session)
         self.download_dir.mkdir(parents=True, exist_ok=True)
+        # Deduplica per URL canonico, seguendo i redirect già visti
+        self.redirects = RedirectCache(self.download_dir / ".redirect_cache.json")
+        self.fetched_urls = URLSet(redirects=self.redirects)
+        # Download scartati al primo blocco, per motivo (html, image, http_404, ...)
+        self.stats = {"errors": 0, "rejected": {}}
 
+    @tracing.traced("parse")
     def find_pdf_links(self, html: bytes, base: str) -> list[str]:
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(html, "html.parser")
-        links = set()
+        links = URLSet()
         for a in soup.find_all("a", href=True):
             href = a["href"].strip()
             if href.lower().endswith(".pdf"):
-                links.add(href if href.startswith("http") else urljoin(base, href))
+                links.add(href, base=base)
         for iframe in soup.find_all("iframe", src=True):
             src = iframe["src"].strip()
             if src.lower().endswith(".pdf"):
-                links.add(src if src.startswith("http") else urljoin(base, src))
+                links.add(src, base=base)
         # Fallback generico
         text = soup.get_text("\n", strip=True) + "\n" + str(soup)
         for token in text.split():
             if token.lower().endswith('.pdf') and ('http' in token or token.startswith('/')):
-                full = token if token.startswith('http') else urljoin(base, token)
-                links.add(full)
+                links.add(token, base=base)
         return list(links)
 
+    @tracing.traced("download", arg="url")
     def download_pdf(self, url: str) -> str | None:
         try:
-            r = self.session.get(url, timeout=30)
-            r.raise_for_status()
-            if not r.content.startswith(b"%PDF"):
-                print(f"[MDSite] Non-PDF content: {url}")
+            if url in self.fetched_urls:
+                print(f"[MDSite] URL già scaricato: {url}")
                 return None
             name = os.path.basename(urlparse(url).path) or f"md_{int(time.time())}.pdf"
             path = self.download_dir / name
-            with open(path, "wb") as f:
-                f.write(r.content)
+            with StreamedDownload(self.session, url, timeout=30, stats=self.stats, dest_path=path) as download:
+                if not self.fetched_urls.add(self.redirects.record(download.response, url)):
+                    print(f"[MDSite] Redirect verso un PDF già scaricato: {download.response.url}")
+                    return None
+                if not download.expect("pdf"):
+                    print(f"[MDSite] Non-PDF content ({download.kind}): {url}")
+                    return None
+                download.save()
             return str(path)
         except Exception as e:
             print(f"[MDSite] Download error {url}: {e}")
+            self.stats["errors"] += 1
             return None
 
+    @tracing.traced("upload", arg="file")
     def upload(self, file_path: str) -> bool:
         try:
             url = f"{self.api_base_url}/pdfs/upload"
@@ -82,17 +106,36 @@ class MDSiteScraper:
             print("[MDSite] Upload error:", e)
         return False
 
-    def run(self):
+    def check_for_changes(self) -> dict:
+        """Probe economico: solo la pagina iniziale con GET condizionale, senza scaricare PDF"""
+        probe = ChangeProbe(self.download_dir / STATE_FILENAME, self.session, source="md-site")
+        return probe.run(self.start_url, lambda html, base: (
+            self.find_pdf_links(html, base) + extract_flyer_links(html, base, ('volantino', 'offerte', 'promo'))))
+
+    def commit_probe(self):
+        """Conferma l'impronta del probe dopo uno scraping completo riuscito"""
+        return commit_pending(self.download_dir / STATE_FILENAME)
+
+    @tracing.traced("source", source="md-site")
+    def run(self) -> bool:
+        """Scraping completo + upload; True solo se arrivato in fondo senza errori"""
+        from bs4 import BeautifulSoup
+
+        started = time.time()
         try:
             r = self.session.get(self.start_url, timeout=20)
             r.raise_for_status()
-            pdfs = set(self.find_pdf_links(r.content, self.start_url))
+            pdfs = URLSet(self.find_pdf_links(r.content, self.start_url), redirects=self.redirects)
             soup = BeautifulSoup(r.content, 'html.parser')
+            visited = URLSet([self.start_url])
             for a in soup.find_all('a', href=True):
                 href = a['href']
                 if any(k in href.lower() for k in ['volantino', 'offerte', 'promo']):
+                    # Stessa pagina linkata più volte (menu, footer, banner)
+                    if not visited.add(href, base=self.start_url):
+                        continue
                     try:
-                        rr = self.session.get(href if href.startswith('http') else urljoin(self.start_url, href), timeout=20)
+                        rr = self.session.get(urljoin(self.start_url, href), timeout=20)
                         if rr.ok:
                             pdfs.update(self.find_pdf_links(rr.content, self.start_url))
                             time.sleep(1)
@@ -100,6 +143,7 @@ class MDSiteScraper:
                         pass
             pdfs = list(pdfs)
             print(f"[MDSite] PDF trovati: {len(pdfs)}")
+            self.stats["found"] = len(pdfs)
             created = 0
             for url in pdfs:
                 fp = self.download_pdf(url)
@@ -107,13 +151,32 @@ class MDSiteScraper:
                     continue
                 if self.upload(fp):
                     created += 1
+                    self.stats["uploaded"] = created
+                else:
+                    self.stats["errors"] += 1
                 time.sleep(1)
-            print(f"[MDSite] Completato. Caricati: {created}")
+            self.redirects.save()
+            print(f"[MDSite] Completato. Caricati: {created}, scartati: {self.stats['rejected']}")
+            return self.stats["errors"] == 0
         except Exception as e:
             print("[MDSite] Errore run:", e)
+            self.stats["errors"] += 1
+            return False
+        finally:
+            metrics.finish_run("md-site", self.stats, started)
 
 
 if __name__ == "__main__":
-    MDSiteScraper().run()
+    scraper = MDSiteScraper()
+    # --probe: exit 10 se la pagina è cambiata, 0 se invariata, 1 in caso di errore
+    if "--probe" in sys.argv[1:]:
+        sys.exit(exit_code(scraper.check_for_changes()))
+    # --probe-commit: conferma l'impronta del probe dopo uno scraping completo riuscito
+    if "--probe-commit" in sys.argv[1:]:
+        scraper.commit_probe()
+        sys.exit(0)
+    # --profile[=DIR]: statistiche cProfile/pyinstrument, stack campionati e allocazioni
+    # Uscita 1 se lo scraping fallisce: lo scheduler non conferma l'impronta del probe
+    sys.exit(0 if profiling.run_profiled(profiling.option_from_argv(), "md-site", scraper.run) else 1)
 
 
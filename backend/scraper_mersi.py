@@ -1,9 +1,17 @@
 import requests
-from bs4 import BeautifulSoup
 import os
 import re
+import sys
+import time
 import datetime
 
+from url_utils import RedirectCache, URLSet
+from downloads import StreamedDownload
+import metrics
+import tracing
+import profiling
+from change_probe import STATE_FILENAME, ChangeProbe, commit_pending, exit_code, extract_flyer_links
+
 class MersiVolantiniScraper:
     def __init__(self, base_url='https://www.mersisupermercati.com/volantino/', upload_url=None, download_dir='volantini/mersi'):
         # Auto-detect API URL based on environment
@@ -15,6 +23,11 @@ class MersiVolantiniScraper:
         self.upload_url = upload_url
         self.download_dir = download_dir
         os.makedirs(self.download_dir, exist_ok=True)
+        # URL confrontati in forma canonica, seguendo i redirect già visti
+        self.redirects = RedirectCache(os.path.join(self.download_dir, '.redirect_cache.json'))
+        self.fetched_urls = URLSet(redirects=self.redirects)
+        # Download scartati al primo blocco, per motivo (html, image, http_404, ...)
+        self.stats = {'errors': 0, 'rejected': {}}
         # Sessione con headers per evitare blocchi
         self.session = requests.Session()
         self.session.headers.update({
@@ -23,9 +36,14 @@ class MersiVolantiniScraper:
             'Accept-Language': 'it-IT,it;q=0.9,en;q=0.8',
             'Connection': 'keep-alive'
         })
+        # Fetch, download and upload latency/bytes for the Prometheus metrics
+        metrics.instrument_session(self.session, 'mersi')
+        tracing.instrument_session(self.session)
 
     def scrape(self):
-        response = requests.get(self.base_url)
+        from bs4 import BeautifulSoup
+        
+        response = self.session.get(self.base_url)
         response.raise_for_status()
         soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -69,38 +87,56 @@ class MersiVolantiniScraper:
                 if pdf_match:
                     pdf_urls.append(pdf_match.group(1))
         
-        # Remove duplicates
-        pdf_urls = list(set(pdf_urls))
+        # Remove duplicates: relative paths are resolved against the page, tracking params and http/https ignored
+        unique_urls = URLSet(redirects=self.redirects)
+        for url in pdf_urls:
+            unique_urls.add(url, base=response.url)
+        pdf_urls = list(unique_urls)
 
         print(f"Found {len(pdf_urls)} PDF URLs: {pdf_urls}")
         downloaded_files = []
         for url in pdf_urls:
-            if not url.startswith('http'):
-                url = 'https://www.mersisupermercati.com' + url
             filename = self.download_pdf(url)
             if filename:
                 downloaded_files.append(filename)
 
+        self.redirects.save()
         return downloaded_files
 
+    def check_for_changes(self):
+        # Cheap probe: conditional GET of the flyer page only, fingerprint of its PDF links
+        probe = ChangeProbe(os.path.join(self.download_dir, STATE_FILENAME), self.session, source='mersi')
+        return probe.run(self.base_url, extract_flyer_links)
+
+    def commit_probe(self):
+        # Confirm the probe fingerprint once a full scrape succeeded
+        return commit_pending(os.path.join(self.download_dir, STATE_FILENAME))
+
+    @tracing.traced('download', arg='url')
     def download_pdf(self, url):
         try:
-            print(f"Attempting to download: {url}")
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            print(f"Response status: {response.status_code}, Content length: {len(response.content)}")
-            # Verifica che sia un PDF valido
-            if not response.content.startswith(b'%PDF'):
-                print(f"File non PDF rilevato, skip: {url}")
+            if url in self.fetched_urls:
+                print(f"Already downloaded, skip: {url}")
                 return None
+            print(f"Attempting to download: {url}")
             filename = os.path.join(self.download_dir, os.path.basename(url))
-            print(f"Saving to: {filename}")
-            with open(filename, 'wb') as f:
-                f.write(response.content)
+            with StreamedDownload(self.session, url, timeout=30, stats=self.stats, dest_path=filename) as download:
+                response = download.response
+                if not self.fetched_urls.add(self.redirects.record(response, url)):
+                    print(f"Redirected to an already downloaded PDF, skip: {response.url}")
+                    return None
+                print(f"Response status: {response.status_code}, Content length: {response.headers.get('content-length', 'n/d')}")
+                # Verifica che sia un PDF valido (solo il primo blocco viene scaricato)
+                if not download.expect('pdf'):
+                    print(f"File non PDF rilevato ({download.kind}), skip: {url}")
+                    return None
+                print(f"Saving to: {filename}")
+                download.save()
             print(f"Successfully saved: {filename}")
             return filename
         except Exception as e:
             print(f"Error downloading {url}: {e}")
+            self.stats['errors'] += 1
             return None
 
     def extract_store_info(self, filename):
@@ -108,6 +144,7 @@ class MersiVolantiniScraper:
         # For now, placeholder
         return {'store_type': 'MerSi', 'cap': 'Unknown'}
 
+    @tracing.traced('upload', arg='file')
     def upload_pdf(self, filename):
         store_info = self.extract_store_info(filename)
         with open(filename, 'rb') as f:
@@ -126,16 +163,41 @@ class MersiVolantiniScraper:
                 'location.cap': cap,
                 'source': 'mersi'
             }
-            response = requests.post(self.upload_url, files=files, data=data, timeout=60)
+            response = self.session.post(self.upload_url, files=files, data=data, timeout=60)
             return response.json() if response.ok else None
 
+    @tracing.traced('source', source='mersi')
     def run(self):
-        files = self.scrape()
-        for file in files:
-            result = self.upload_pdf(file)
-            if result:
-                print(f"Uploaded {file}")
+        """Full scrape + upload; True only if it completed without errors"""
+        started = time.time()
+        try:
+            files = self.scrape()
+            self.stats['downloaded'] = len(files)
+            for file in files:
+                result = self.upload_pdf(file)
+                if result:
+                    print(f"Uploaded {file}")
+                    self.stats['uploaded'] = self.stats.get('uploaded', 0) + 1
+                else:
+                    print(f"Upload failed: {file}")
+                    self.stats['errors'] += 1
+            return self.stats['errors'] == 0
+        except Exception as e:
+            print(f"Error during scrape: {e}")
+            self.stats['errors'] += 1
+            return False
+        finally:
+            metrics.finish_run('mersi', self.stats, started)
 
 if __name__ == '__main__':
     scraper = MersiVolantiniScraper()
-    scraper.run()
\ No newline at end of file
+    # --probe: exit 10 if the flyer page changed, 0 if unchanged, 1 on error
+    if '--probe' in sys.argv[1:]:
+        sys.exit(exit_code(scraper.check_for_changes()))
+    # --probe-commit: confirm the probe fingerprint after a successful full scrape
+    if '--probe-commit' in sys.argv[1:]:
+        scraper.commit_probe()
+        sys.exit(0)
+    # --profile[=DIR]: cProfile/pyinstrument stats, collapsed stacks and allocations
+    # Exit 1 when the scrape fails, so the scheduler does not commit the probe fingerprint
+    sys.exit(0 if profiling.run_profiled(profiling.option_from_argv(), 'mersi', scraper.run) else 1)
\ No newline at end of file
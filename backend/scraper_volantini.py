@@ -8,13 +8,19 @@ Data: 2025
 """
 
 import os
+import sys
 import requests
-from bs4 import BeautifulSoup
 import time
-import hashlib
 from urllib.parse import urljoin, urlparse
 import json
 from datetime import datetime
+from hashing import LEGACY_HASH, hash_bytes
+from url_utils import RedirectCache, URLSet
+from downloads import StreamedDownload
+import metrics
+import tracing
+import profiling
+from change_probe import STATE_FILENAME, ChangeProbe, commit_pending, exit_code, extract_flyer_links
 
 class VolantiniScraper:
     def __init__(self, base_url="https://ultimivolantini.it", download_folder="volantini"):
@@ -24,7 +30,15 @@ class VolantiniScraper:
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        # Latenze e byte di fetch e download per le metriche Prometheus
+        metrics.instrument_session(self.session, 'volantini')
+        tracing.instrument_session(self.session)
+        self.started_at = time.time()
         self.downloaded_files = set()
+        # Redirect già visti e URL già scaricati, confrontati in forma canonica
+        self.redirects = RedirectCache(os.path.join(download_folder, '.redirect_cache.json'))
+        self.fetched_urls = URLSet(redirects=self.redirects)
+        self.visited_pages = URLSet()
         self.stats = {
             'found': 0,
             'downloaded': 0,
@@ -37,21 +51,24 @@ class VolantiniScraper:
         
     def get_file_hash(self, content):
         """Calcola l'hash MD5 del contenuto per evitare duplicati"""
-        return hashlib.md5(content).hexdigest()
+        return hash_bytes(content)[LEGACY_HASH]
     
     def is_valid_pdf_url(self, url):
         """Verifica se l'URL è un PDF valido"""
         return url.lower().endswith('.pdf') and url.startswith(('http://', 'https://'))
     
+    @tracing.traced('page', arg='url')
     def extract_pdf_links(self, url):
         """Estrae tutti i link PDF dalla pagina"""
+        from bs4 import BeautifulSoup
+        
         try:
             print(f"🔍 Analizzando: {url}")
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.content, 'html.parser')
-            pdf_links = set()
+            pdf_links = URLSet(redirects=self.redirects)
             
             # Cerca tutti i link che terminano con .pdf
             for link in soup.find_all('a', href=True):
@@ -70,7 +87,7 @@ class VolantiniScraper:
                     pdf_links.add(full_url)
             
             # Cerca anche link ai volantini che potrebbero contenere PDF
-            volantino_links = set()
+            volantino_links = URLSet()
             for link in soup.find_all('a', href=True):
                 href = link['href']
                 text = link.get_text().lower()
@@ -84,6 +101,9 @@ class VolantiniScraper:
             
             # Analizza le pagine dei volantini per trovare PDF
             for volantino_url in list(volantino_links)[:10]:  # Limita a 10 per test
+                # Pagina già analizzata partendo da un'altra sezione del sito
+                if not self.visited_pages.add(volantino_url):
+                    continue
                 try:
                     print(f"🔍 Analizzando volantino: {volantino_url}")
                     response = self.session.get(volantino_url, timeout=10)
@@ -94,10 +114,7 @@ class VolantiniScraper:
                         for link in vol_soup.find_all('a', href=True):
                             href = link['href']
                             if href.lower().endswith('.pdf'):
-                                if href.startswith('http'):
-                                    pdf_links.add(href)
-                                else:
-                                    pdf_links.add(urljoin(volantino_url, href))
+                                pdf_links.add(href, base=volantino_url)
                         
                         # Cerca anche immagini che potrebbero essere link a PDF
                         for img in vol_soup.find_all('img', src=True):
@@ -105,10 +122,7 @@ class VolantiniScraper:
                             if parent and parent.get('href'):
                                 href = parent['href']
                                 if href.lower().endswith('.pdf'):
-                                    if href.startswith('http'):
-                                        pdf_links.add(href)
-                                    else:
-                                        pdf_links.add(urljoin(volantino_url, href))
+                                    pdf_links.add(href, base=volantino_url)
                     
                     time.sleep(1)  # Rate limiting
                 except Exception as e:
@@ -124,6 +138,7 @@ class VolantiniScraper:
             print(f"❌ Errore nell'analisi della pagina {url}: {e}")
             return []
     
+    @tracing.traced('download', arg='url')
     def download_pdf(self, pdf_url):
         """Scarica un singolo PDF"""
         try:
@@ -137,6 +152,12 @@ class VolantiniScraper:
             
             filepath = os.path.join(self.download_folder, filename)
             
+            # Stesso PDF già scaricato da un altro URL (tracking, http/https, redirect)
+            if pdf_url in self.fetched_urls:
+                print(f"⏭️  URL già scaricato: {pdf_url}")
+                self.stats['skipped'] += 1
+                return False
+            
             # Controlla se il file esiste già
             if os.path.exists(filepath):
                 print(f"⏭️  File già esistente: {filename}")
@@ -145,32 +166,30 @@ class VolantiniScraper:
             
             print(f"⬇️  Scaricando: {filename}")
             
-            response = self.session.get(pdf_url, timeout=30, stream=True)
-            response.raise_for_status()
-            
-            # Verifica che sia effettivamente un PDF
-            content_type = response.headers.get('content-type', '').lower()
-            if 'pdf' not in content_type and not pdf_url.lower().endswith('.pdf'):
-                print(f"⚠️  Il file {filename} non sembra essere un PDF")
-                self.stats['errors'] += 1
-                return False
-            
-            # Scarica il contenuto
-            content = response.content
+            with StreamedDownload(self.session, pdf_url, timeout=30, stats=self.stats, dest_path=filepath) as download:
+                final_url = self.redirects.record(download.response, pdf_url)
+                if not self.fetched_urls.add(final_url):
+                    print(f"⏭️  Redirect verso un PDF già scaricato: {final_url}")
+                    self.stats['skipped'] += 1
+                    return False
+                
+                # Verifica sul primo blocco: una pagina HTML viene scartata senza scaricarla tutta
+                if not download.expect('pdf'):
+                    print(f"⚠️  Il file {filename} non è un PDF ({download.kind})")
+                    self.stats['errors'] += 1
+                    return False
+                
+                saved = download.save()
             
-            # Controlla duplicati tramite hash
-            file_hash = self.get_file_hash(content)
-            if file_hash in self.downloaded_files:
+            # Controlla duplicati tramite hash (calcolato durante la scrittura)
+            if saved['md5'] in self.downloaded_files:
+                os.remove(filepath)
                 print(f"⏭️  File duplicato (hash): {filename}")
                 self.stats['skipped'] += 1
                 return False
             
-            # Salva il file
-            with open(filepath, 'wb') as f:
-                f.write(content)
-            
-            self.downloaded_files.add(file_hash)
-            print(f"✅ Scaricato: {filename} ({len(content)} bytes)")
+            self.downloaded_files.add(saved['md5'])
+            print(f"✅ Scaricato: {filename} ({saved['size']} bytes)")
             self.stats['downloaded'] += 1
             
             # Pausa per evitare sovraccarico del server
@@ -187,8 +206,23 @@ class VolantiniScraper:
             self.stats['errors'] += 1
             return False
     
+    def check_for_changes(self):
+        """Probe economico: solo la home con GET condizionale, senza visitare le pagine interne"""
+        probe = ChangeProbe(os.path.join(self.download_folder, STATE_FILENAME), self.session, source='volantini')
+        return probe.run(self.base_url, lambda html, base: extract_flyer_links(
+            html, base, ('volantino', 'offerte', 'flyer')))
+    
+    def commit_probe(self):
+        """Conferma l'impronta del probe dopo uno scraping completo riuscito"""
+        return commit_pending(os.path.join(self.download_folder, STATE_FILENAME))
+    
+    @tracing.traced('source', source='volantini')
     def scrape_site(self, max_pages=5):
-        """Scraping principale del sito"""
+        """
+        Scraping principale del sito.
+        Restituisce True solo se lo scraping è arrivato in fondo senza errori
+        (l'uscita 0 del processo conferma l'impronta del probe).
+        """
         print(f"🚀 Avvio scraping di {self.base_url}")
         print(f"📁 Cartella di download: {self.download_folder}")
         print("-" * 50)
@@ -202,7 +236,7 @@ class VolantiniScraper:
             f"{self.base_url}/discount"
         ]
         
-        all_pdf_links = set()
+        all_pdf_links = URLSet(redirects=self.redirects)
         
         # Estrai link PDF da tutte le pagine
         for page_url in pages_to_scrape[:max_pages]:
@@ -217,7 +251,7 @@ class VolantiniScraper:
         
         if not all_pdf_links:
             print("⚠️  Nessun PDF trovato sul sito")
-            return
+            return False
         
         print("\n⬇️  Inizio download...")
         print("-" * 50)
@@ -227,15 +261,20 @@ class VolantiniScraper:
             self.download_pdf(pdf_url)
         
         self.print_summary()
+        return self.stats['errors'] == 0
     
     def print_summary(self):
         """Stampa il riepilogo finale"""
+        self.redirects.save()
+        metrics.finish_run('volantini', self.stats, self.started_at)
         print("\n" + "=" * 50)
         print("📊 RIEPILOGO SCRAPING")
         print("=" * 50)
         print(f"🔍 PDF trovati: {self.stats['found']}")
         print(f"✅ PDF scaricati: {self.stats['downloaded']}")
         print(f"⏭️  PDF saltati (duplicati/esistenti): {self.stats['skipped']}")
+        if self.stats.get('rejected'):
+            print(f"🚫 Scartati al primo blocco: {self.stats['rejected']}")
         print(f"❌ Errori: {self.stats['errors']}")
         print(f"📁 Cartella: {os.path.abspath(self.download_folder)}")
         
@@ -261,14 +300,33 @@ class VolantiniScraper:
 
 def main():
     """Funzione principale"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Scraper ultimivolantini.it per VolantinoMix')
+    parser.add_argument('--probe', action='store_true',
+                        help='Controlla solo se la home è cambiata (exit 10 = cambiata, 0 = invariata, 1 = errore)')
+    parser.add_argument('--probe-commit', action='store_true',
+                        help="Conferma l'impronta dell'ultimo probe dopo uno scraping completo riuscito")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    
+    if args.probe:
+        sys.exit(exit_code(VolantiniScraper().check_for_changes()))
+    if args.probe_commit:
+        VolantiniScraper().commit_probe()
+        return
+    
+    success = False
     try:
         scraper = VolantiniScraper()
-        scraper.scrape_site()
+        success = profiling.run_profiled(args.profile, 'volantini', scraper.scrape_site)
         
     except KeyboardInterrupt:
         print("\n⏹️  Scraping interrotto dall'utente")
     except Exception as e:
         print(f"\n❌ Errore fatale: {e}")
+    # Uscita 1 se lo scraping fallisce: lo scheduler non conferma l'impronta del probe
+    sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -18,6 +18,7 @@ const mersiRoutes = require('./routes/mersi');
 const jobRoutes = require('./routes/jobs');
 const duplicatesRoutes = require('./routes/duplicates');
 const importRoutes = require('./routes/import');
+const { collectTextfiles } = require('./utils/prometheusTextfiles');
 
 // Import middleware (commented out as files don't exist yet)
 // const errorHandler = require('./middleware/errorHandler');
@@ -159,6 +160,16 @@ app.get('/health', (req, res) => {
     });
 });
 
+// Metriche Prometheus degli scraper: i file .prom scritti da metrics.py a fine run, uniti
+app.get('/metrics', async (req, res) => {
+    try {
+        res.type('text/plain; version=0.0.4; charset=utf-8').send(await collectTextfiles());
+    } catch (error) {
+        console.error('❌ Errore lettura metriche:', error.message);
+        res.status(500).type('text/plain').send('# metriche non disponibili\n');
+    }
+});
+
 // Admin interface route
 app.get('/admin', (req, res) => {
     res.sendFile(path.join(__dirname, 'public', 'admin.html'));
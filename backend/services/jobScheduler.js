@@ -4,10 +4,50 @@ const path = require('path');
 const Volantino = require('../models/Volantino');
 const PDFService = require('./pdfService');
 
+// Cartella degli scraper Python (come in routes/import.js)
+const BACKEND_DIR = path.join(__dirname, '..');
+
+// Codici di uscita di `--probe` (vedi change_probe.py); `--probe-commit` conferma l'impronta dopo lo scraping
+const PROBE_EXIT_UNCHANGED = 0;
+const PROBE_EXIT_CHANGED = 10;
+
+// Scraper controllati dal probe: lo scraping completo parte solo se la pagina è cambiata.
+// I nomi coincidono con le fonti dello storico pubblicazioni (source= in change_probe.py)
+const PROBE_SOURCES = [
+    { name: 'deco', script: 'scraper_deco.py' },
+    { name: 'eurospin', script: 'scraper_eurospin.py' },
+    { name: 'ipercoop', script: 'scraper_ipercoop.py' },
+    { name: 'mersi', script: 'scraper_mersi.py' },
+    { name: 'eurospin-site', script: 'scraper_eurospin_site.py' },
+    { name: 'lidl-site', script: 'scraper_lidl_site.py' },
+    { name: 'md-site', script: 'scraper_md_site.py' }
+];
+
+// Job di scraping settimanali → script della cartella backend e relativi argomenti.
+// L'esecuzione profilata (--profile, vedi profiling.py) lancia la stessa riga di comando
+const SCRAPING_JOBS = {
+    'deco-scraping': {
+        script: 'scraper_deco.py',
+        store: 'Decò',
+        // PDF nella volantini_deco della radice, dove li cercano pdfService e routes/deco.js; API dalla porta corrente
+        args: () => [
+            '--folder', path.join(BACKEND_DIR, '..', 'volantini_deco'),
+            '--api', `http://localhost:${process.env.PORT || '3000'}/api`
+        ]
+    },
+    'eurospin-scraping': {
+        script: 'scraper_eurospin.py',
+        store: 'Eurospin',
+        args: () => []
+    }
+};
+const PROFILE_DIR = process.env.PROFILE_DIR || path.join(BACKEND_DIR, 'profiles');
+
 class JobScheduler {
     constructor() {
         this.jobs = new Map();
         this.isInitialized = false;
+        this.probeInProgress = false;
     }
 
     /**
@@ -36,6 +76,9 @@ class JobScheduler {
         // Job per pulizia file PDF temporanei - ogni giorno alle 03:00
         this.schedulePDFCleanup();
         
+        // Job per probe delle pagine volantini - ogni 15 minuti, solo le fonti in scadenza
+        this.scheduleChangeProbes();
+        
         this.isInitialized = true;
         console.log('✅ JobScheduler inizializzato con successo');
     }
@@ -216,74 +259,50 @@ class JobScheduler {
     }
 
     /**
-     * Esegue lo scraping automatico dei volantini Decò
+     * Programma il probe adattivo delle pagine volantini
+     * Ogni scraper scarica solo la pagina di ingresso (GET condizionale) e segnala se è cambiata;
+     * lo scraping completo parte solo per le fonti cambiate. Quali fonti controllare lo decide
+     * adaptive_scheduler.py in base agli orari di pubblicazione osservati
      */
-    async executeDecoScraping() {
-        return new Promise((resolve, reject) => {
-            console.log('🚀 [SCRAPING] Avvio script scraper_deco.py...');
-            
-            const scriptPath = path.join(__dirname, '../../scraper_deco.py');
-            // Auto-detect API URL based on environment
-            const port = process.env.PORT || '3000';
-            const apiUrl = `http://localhost:${port}/api`;
-            const args = [
-                scriptPath,
-                '--folder', 'volantini_deco',
-                '--api', apiUrl
-            ];
-            
-            const pythonProcess = spawn('python3', args, {
-                cwd: path.join(__dirname, '../..'),
-                stdio: ['pipe', 'pipe', 'pipe']
-            });
-            
-            let stdout = '';
-            let stderr = '';
-            
-            pythonProcess.stdout.on('data', (data) => {
-                stdout += data.toString();
-                console.log('📄 [SCRAPING]', data.toString().trim());
-            });
-            
-            pythonProcess.stderr.on('data', (data) => {
-                stderr += data.toString();
-                console.log('🚨 [SCRAPING ERROR]', data.toString().trim());
-            });
-            
-            pythonProcess.on('close', (code) => {
-                const jobInfo = this.jobs.get('deco-scraping');
-                if (jobInfo) {
-                    jobInfo.lastRun = new Date();
-                }
-                
-                if (code === 0) {
-                    console.log('✅ [SCRAPING] Scraping Decò completato con successo');
-                    resolve({ success: true, output: stdout });
-                } else {
-                    console.log('❌ [SCRAPING] Scraping Decò fallito:', { code, stderr });
-                    reject(new Error(`Scraping fallito con codice ${code}: ${stderr}`));
-                }
-            });
+    scheduleChangeProbes() {
+        const jobName = 'change-probe';
+        
+        // Cron: ogni 15 minuti (l'intervallo minimo tra due probe della stessa fonte)
+        const cronExpression = '*/15 * * * *';
+        
+        const task = cron.schedule(cronExpression, async () => {
+            console.log('🔎 [CRON] Avvio probe pagine volantini...');
             
-            pythonProcess.on('error', (error) => {
-                console.error('❌ [SCRAPING] Errore avvio processo:', error);
-                reject(error);
-            });
+            try {
+                await this.executeChangeProbes();
+            } catch (error) {
+                console.error('❌ [CRON] Errore durante probe volantini:', error);
+            }
+        }, {
+            scheduled: false,
+            timezone: 'Europe/Rome'
         });
+        
+        this.jobs.set(jobName, {
+            task,
+            cronExpression,
+            description: 'Probe adattivo delle pagine volantini, scraping solo se cambiate',
+            lastRun: null,
+            nextRun: null
+        });
+        
+        task.start();
+        console.log(`📅 Job '${jobName}' programmato: ${cronExpression}`);
     }
 
     /**
-     * Esegue lo scraping dei volantini Eurospin
+     * Esegue uno script Python della cartella backend e risolve con { code, stdout, stderr }
+     * (anche con codice di uscita diverso da 0: l'interpretazione spetta al chiamante)
      */
-    async executeEurospinScraping() {
+    runBackendScript(script, args = [], label = 'SCRAPING') {
         return new Promise((resolve, reject) => {
-            console.log('🚀 [SCRAPING] Avvio script scraper_eurospin.py...');
-            
-            const scriptPath = path.join(__dirname, '../../scraper_eurospin.py');
-            const args = [scriptPath];
-            
-            const pythonProcess = spawn('python3', args, {
-                cwd: path.join(__dirname, '../..'),
+            const pythonProcess = spawn('python3', [path.join(BACKEND_DIR, script), ...args], {
+                cwd: BACKEND_DIR,
                 stdio: ['pipe', 'pipe', 'pipe']
             });
             
@@ -292,36 +311,161 @@ class JobScheduler {
             
             pythonProcess.stdout.on('data', (data) => {
                 stdout += data.toString();
-                console.log('📄 [SCRAPING]', data.toString().trim());
+                console.log(`📄 [${label}]`, data.toString().trim());
             });
             
             pythonProcess.stderr.on('data', (data) => {
                 stderr += data.toString();
-                console.log('🚨 [SCRAPING ERROR]', data.toString().trim());
+                console.log(`🚨 [${label} ERROR]`, data.toString().trim());
             });
             
-            pythonProcess.on('close', (code) => {
-                const jobInfo = this.jobs.get('eurospin-scraping');
-                if (jobInfo) {
-                    jobInfo.lastRun = new Date();
-                }
-                
-                if (code === 0) {
-                    console.log('✅ [SCRAPING] Scraping Eurospin completato con successo');
-                    resolve({ success: true, output: stdout });
-                } else {
-                    console.log('❌ [SCRAPING] Scraping Eurospin fallito:', { code, stderr });
-                    reject(new Error(`Scraping fallito con codice ${code}: ${stderr}`));
-                }
-            });
+            pythonProcess.on('close', (code) => resolve({ code, stdout, stderr }));
             
             pythonProcess.on('error', (error) => {
-                console.error('❌ [SCRAPING] Errore avvio processo:', error);
+                console.error(`❌ [${label}] Errore avvio processo:`, error);
                 reject(error);
             });
         });
     }
 
+    /**
+     * Fonti da controllare adesso secondo lo scheduler adattivo.
+     * Se lo scheduler non risponde si torna al probe orario di tutte le fonti
+     */
+    async getDueProbeSources() {
+        const names = PROBE_SOURCES.map((source) => source.name);
+        
+        try {
+            const result = await this.runBackendScript('adaptive_scheduler.py', ['due', '--json', ...names], 'PROBE');
+            if (result.code === 0) {
+                const due = JSON.parse(result.stdout.trim().split('\n').pop());
+                return PROBE_SOURCES.filter((source) => due.includes(source.name));
+            }
+            console.log(`⚠️ [PROBE] Scheduler adattivo fallito (codice ${result.code}), uso il probe orario`);
+        } catch (error) {
+            console.error('⚠️ [PROBE] Scheduler adattivo non disponibile, uso il probe orario:', error);
+        }
+        
+        return new Date().getMinutes() < 15 ? PROBE_SOURCES : [];
+    }
+
+    /**
+     * Esegue il probe delle fonti in scadenza e lo scraping completo di quelle cambiate
+     * (con force=true controlla tutte le fonti, come nell'esecuzione manuale)
+     */
+    async executeChangeProbes(force = false, scrapeArgs = []) {
+        if (this.probeInProgress) {
+            console.log('⚠️ [PROBE] Probe precedente ancora in corso, salto questo giro');
+            return { skipped: true };
+        }
+        
+        this.probeInProgress = true;
+        const results = {};
+        
+        try {
+            const sources = force ? PROBE_SOURCES : await this.getDueProbeSources();
+            if (sources.length === 0) {
+                console.log('💤 [PROBE] Nessuna fonte in scadenza');
+            }
+            
+            for (const source of sources) {
+                try {
+                    const probe = await this.runBackendScript(source.script, ['--probe'], 'PROBE');
+                    
+                    if (probe.code === PROBE_EXIT_UNCHANGED) {
+                        results[source.name] = 'unchanged';
+                        continue;
+                    }
+                    if (probe.code !== PROBE_EXIT_CHANGED) {
+                        console.log(`❌ [PROBE] Probe ${source.name} fallito (codice ${probe.code})`);
+                        results[source.name] = 'error';
+                        continue;
+                    }
+                    
+                    console.log(`🆕 [PROBE] ${source.name}: pagina cambiata, avvio scraping completo...`);
+                    const scraping = await this.runBackendScript(source.script, scrapeArgs);
+                    if (scraping.code !== 0) {
+                        // L'impronta resta in sospeso: il prossimo probe rileva ancora la pagina come cambiata
+                        console.log(`❌ [PROBE] Scraping ${source.name} fallito (codice ${scraping.code})`);
+                        results[source.name] = 'scraping_failed';
+                        continue;
+                    }
+                    
+                    const commit = await this.runBackendScript(source.script, ['--probe-commit'], 'PROBE');
+                    results[source.name] = commit.code === 0 ? 'scraped' : 'commit_failed';
+                    console.log(commit.code === 0
+                        ? `✅ [PROBE] Scraping ${source.name} completato`
+                        : `⚠️ [PROBE] Scraping ${source.name} completato, impronta non confermata (codice ${commit.code})`);
+                } catch (error) {
+                    console.error(`❌ [PROBE] Errore su ${source.name}:`, error);
+                    results[source.name] = 'error';
+                }
+            }
+        } finally {
+            this.probeInProgress = false;
+            const jobInfo = this.jobs.get('change-probe');
+            if (jobInfo) {
+                jobInfo.lastRun = new Date();
+            }
+        }
+        
+        console.log('📊 [PROBE] Esito:', results);
+        return results;
+    }
+
+    /**
+     * Esegue lo script backend di un job di scraping con --profile e restituisce i file di profilo prodotti
+     */
+    async executeProfiledScraping(jobName) {
+        const { script, args } = SCRAPING_JOBS[jobName];
+        console.log(`🔬 [PROFILE] Avvio ${script} con profiling in ${PROFILE_DIR}...`);
+        
+        const result = await this.runBackendScript(script, [...args(), '--profile', PROFILE_DIR], 'PROFILE');
+        const profileFiles = [...result.stdout.matchAll(/Profilo salvato: (.+)/g)].map((match) => match[1].trim());
+        
+        console.log(result.code === 0
+            ? `✅ [PROFILE] ${script} completato, ${profileFiles.length} file di profilo`
+            : `❌ [PROFILE] ${script} fallito (codice ${result.code})`);
+        return { success: result.code === 0, code: result.code, profileFiles };
+    }
+
+    /**
+     * Esegue lo script backend di un job di scraping (vedi SCRAPING_JOBS)
+     */
+    async executeScrapingJob(jobName) {
+        const { script, store, args } = SCRAPING_JOBS[jobName];
+        console.log(`🚀 [SCRAPING] Avvio script ${script}...`);
+        
+        const { code, stdout, stderr } = await this.runBackendScript(script, args());
+        
+        const jobInfo = this.jobs.get(jobName);
+        if (jobInfo) {
+            jobInfo.lastRun = new Date();
+        }
+        
+        if (code !== 0) {
+            console.log(`❌ [SCRAPING] Scraping ${store} fallito:`, { code, stderr });
+            throw new Error(`Scraping fallito con codice ${code}: ${stderr}`);
+        }
+        
+        console.log(`✅ [SCRAPING] Scraping ${store} completato con successo`);
+        return { success: true, output: stdout };
+    }
+
+    /**
+     * Esegue lo scraping automatico dei volantini Decò
+     */
+    async executeDecoScraping() {
+        return this.executeScrapingJob('deco-scraping');
+    }
+
+    /**
+     * Esegue lo scraping dei volantini Eurospin
+     */
+    async executeEurospinScraping() {
+        return this.executeScrapingJob('eurospin-scraping');
+    }
+
     /**
      * Esegue il cleanup dei volantini scaduti
      */
@@ -452,10 +596,20 @@ class JobScheduler {
     /**
      * Avvia un job manualmente
      */
-    async runJobManually(jobName) {
-        console.log(`🔧 [MANUAL] Esecuzione manuale job: ${jobName}`);
+    async runJobManually(jobName, options = {}) {
+        console.log(`🔧 [MANUAL] Esecuzione manuale job: ${jobName}${options.profile ? ' (profiling)' : ''}`);
         
         try {
+            if (options.profile) {
+                if (jobName === 'change-probe') {
+                    return await this.executeChangeProbes(true, ['--profile', PROFILE_DIR]);
+                }
+                if (!SCRAPING_JOBS[jobName]) {
+                    throw new Error(`Profiling non disponibile per il job '${jobName}'`);
+                }
+                return await this.executeProfiledScraping(jobName);
+            }
+            
             switch (jobName) {
                 case 'deco-scraping':
                     return await this.executeDecoScraping();
@@ -467,6 +621,8 @@ class JobScheduler {
                     return await this.executePDFCleanup();
                 case 'expired-check':
                     return await this.checkExpiredFlyers();
+                case 'change-probe':
+                    return await this.executeChangeProbes(true);
                 default:
                     throw new Error(`Job '${jobName}' non riconosciuto`);
             }
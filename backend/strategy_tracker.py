@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memoria persistente degli esiti delle strategie di scraping
+Registra per ogni strategia/endpoint latenza e tasso di successo, ordina i tentativi
+in base allo storico e applica un circuit breaker con cooldown esponenziale
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import json
+import time
+import threading
+from pathlib import Path
+
+
+class StrategyTracker:
+    """Statistiche persistenti per strategia con circuit breaker"""
+
+    def __init__(self, stats_file, base_cooldown=3600, max_cooldown=7 * 24 * 3600, failure_threshold=3):
+        self.stats_file = Path(stats_file)
+        # Cooldown dopo `failure_threshold` fallimenti consecutivi, raddoppiato ad ogni fallimento successivo:
+        # un singolo errore transitorio del sito non deve escludere una strategia per ore
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.failure_threshold = failure_threshold
+        self._lock = threading.Lock()
+        self.strategies = self.load()
+
+    def load(self):
+        """Carica lo storico dal file JSON"""
+        try:
+            if self.stats_file.exists():
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception:
+            pass
+        return {}
+
+    def save(self):
+        """Salva lo storico nel file JSON"""
+        with self._lock:
+            snapshot = json.loads(json.dumps(self.strategies))
+        with open(self.stats_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+
+    def _entry(self, name):
+        return self.strategies.setdefault(name, {
+            'attempts': 0,
+            'successes': 0,
+            'consecutive_failures': 0,
+            'avg_latency': None,
+            'last_found': 0,
+            'last_success': None,
+            'last_failure': None,
+            'cooldown_until': 0
+        })
+
+    def record(self, name, success, latency, found=0):
+        """Registra l'esito di un tentativo"""
+        now = time.time()
+        with self._lock:
+            entry = self._entry(name)
+            entry['attempts'] += 1
+            entry['last_found'] = found
+            # Media mobile esponenziale: pesa di più le esecuzioni recenti
+            if entry['avg_latency'] is None:
+                entry['avg_latency'] = round(latency, 3)
+            else:
+                entry['avg_latency'] = round(0.7 * entry['avg_latency'] + 0.3 * latency, 3)
+
+            if success:
+                entry['successes'] += 1
+                entry['consecutive_failures'] = 0
+                entry['cooldown_until'] = 0
+                entry['last_success'] = now
+            else:
+                entry['consecutive_failures'] += 1
+                entry['last_failure'] = now
+                excess = entry['consecutive_failures'] - self.failure_threshold
+                if excess >= 0:
+                    cooldown = min(self.base_cooldown * (2 ** excess), self.max_cooldown)
+                    entry['cooldown_until'] = now + cooldown
+
+    def is_available(self, name):
+        """False se il circuit breaker della strategia è aperto"""
+        entry = self.strategies.get(name)
+        return not entry or entry['cooldown_until'] <= time.time()
+
+    def success_rate(self, name):
+        """Tasso di successo con smoothing di Laplace (0.5 senza storico)"""
+        entry = self.strategies.get(name)
+        if not entry:
+            return 0.5
+        return (entry['successes'] + 1) / (entry['attempts'] + 2)
+
+    def order(self, names):
+        """Ordina le strategie: prima le più affidabili, a parità le più veloci.
+        Senza storico mantiene l'ordine originale."""
+        def key(item):
+            index, name = item
+            entry = self.strategies.get(name) or {}
+            latency = entry.get('avg_latency')
+            return (-self.success_rate(name), latency if latency is not None else float('inf'), index)
+        return [name for _, name in sorted(enumerate(names), key=key)]
+
+    def available(self, names):
+        """Strategie ordinate con circuit breaker chiuso.
+        Se sono tutte in cooldown restituisce comunque la migliore (tentativo half-open)."""
+        ordered = self.order(names)
+        return [name for name in ordered if self.is_available(name)] or ordered[:1]
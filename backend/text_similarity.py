@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indice MinHash/LSH sul testo dei volantini
+Estrae il testo di ogni PDF, lo riduce a shingle di parole, calcola firme MinHash
+vettorializzate con NumPy e le salva in un indice LSH persistente. Un nuovo download
+viene confrontato in tempo sub-lineare con tutto l'archivio e classificato come
+duplicato, nuova versione di un volantino esistente oppure volantino nuovo,
+indipendentemente da byte, ordine delle pagine o copertina.
+
+Uso:
+    python3 text_similarity.py check volantino.pdf [--add]
+
+Dipendenze opzionali: numpy e PyMuPDF (oppure pdftotext di poppler-utils)
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import shutil
+import subprocess
+import threading
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+
+from lazy_imports import lazy_module
+
+# Caricati al primo calcolo: importare il modulo (ogni scraper lo fa) non paga numpy e PyMuPDF
+np = lazy_module('numpy')
+NUMPY_AVAILABLE = np is not None
+
+fitz = lazy_module('pymupdf', 'fitz')  # 'fitz' per PyMuPDF < 1.24
+PYMUPDF_AVAILABLE = fitz is not None
+
+PDFTOTEXT_AVAILABLE = shutil.which('pdftotext') is not None
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+# 32 bande da 4 righe: soglia LSH ~0.42, coppie con Jaccard 0.5 collidono nell'87% dei casi
+LSH_BANDS = 32
+MIN_SHINGLES = 20
+SEED = 42
+
+# Jaccard stimato oltre cui è lo stesso volantino, e oltre cui è una sua nuova versione
+DUPLICATE_THRESHOLD = 0.9
+VERSION_THRESHOLD = 0.4
+
+# Accanto al modulo, come l'indice percettivo di near_duplicates.py
+DEFAULT_INDEX_FILE = os.environ.get('TEXT_INDEX_FILE',
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'text_index.json'))
+# Come per i quasi duplicati percettivi: di norma i duplicati testuali vengono solo segnalati
+# e l'upload prosegue; SKIP_TEXT_DUPLICATES=1 li salta
+SKIP_TEXT_DUPLICATES = os.environ.get('SKIP_TEXT_DUPLICATES', '').lower() in ('1', 'true', 'yes')
+
+# Primo di Mersenne 2^31 - 1: a * x resta sotto 2^63, nessun overflow in uint64
+_MERSENNE_PRIME = (1 << 31) - 1
+_BLOCK = 4096
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available():
+    """True se sono disponibili NumPy e almeno un estrattore di testo PDF"""
+    return NUMPY_AVAILABLE and (PYMUPDF_AVAILABLE or PDFTOTEXT_AVAILABLE)
+
+
+def extract_text(pdf_path):
+    """Testo del PDF, pagina per pagina"""
+    if PYMUPDF_AVAILABLE:
+        with fitz.open(pdf_path) as doc:
+            return '\n'.join(page.get_text() for page in doc)
+
+    if PDFTOTEXT_AVAILABLE:
+        result = subprocess.run(['pdftotext', '-q', str(pdf_path), '-'],
+                                check=True, capture_output=True, timeout=120)
+        return result.stdout.decode('utf-8', errors='replace')
+
+    raise RuntimeError('Nessun estrattore di testo PDF disponibile (installare PyMuPDF o poppler-utils)')
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Insieme degli hash a 32 bit degli shingle di `size` parole (testo normalizzato)"""
+    normalized = unicodedata.normalize('NFKD', text.lower())
+    words = _WORD_RE.findall(normalized)
+    if len(words) < size:
+        return set()
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8'))
+            for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """Firme MinHash con permutazioni (a * x + b) mod p calcolate a blocchi con NumPy"""
+
+    def __init__(self, num_perm=NUM_PERM, seed=SEED):
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, shingle_set):
+        """Firma MinHash (array uint64 di num_perm elementi)"""
+        values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set)) % np.uint64(_MERSENNE_PRIME)
+        signature = np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.uint64)
+        for start in range(0, len(values), _BLOCK):
+            block = values[start:start + _BLOCK, None]
+            np.minimum(signature, ((block * self.a + self.b) % np.uint64(_MERSENNE_PRIME)).min(axis=0), out=signature)
+        return signature
+
+
+def estimate_jaccard(signature_a, signature_b):
+    """Similarità di Jaccard stimata: frazione di componenti uguali"""
+    return float(np.mean(np.asarray(signature_a) == np.asarray(signature_b)))
+
+
+class LSHIndex:
+    """Indice LSH persistente: le firme sono salvate su disco, i bucket ricostruiti al caricamento"""
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE, num_perm=NUM_PERM, bands=LSH_BANDS):
+        if num_perm % bands:
+            raise ValueError('num_perm deve essere multiplo del numero di bande')
+        self.index_file = str(index_file)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._lock = threading.Lock()
+        self.documents = {}
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('num_perm') != self.num_perm or data.get('bands') != self.bands:
+            print(f"⚠️  Parametri LSH cambiati: indice {self.index_file} ignorato")
+            return
+        for doc_id, entry in data.get('documents', {}).items():
+            self.documents[doc_id] = entry
+            self._insert(doc_id, np.array(entry['signature'], dtype=np.uint64))
+
+    def save(self):
+        """Scrive l'indice su disco (atomicamente)"""
+        with self._lock:
+            snapshot = {'num_perm': self.num_perm, 'bands': self.bands, 'documents': dict(self.documents)}
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_file, self.index_file)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _insert(self, doc_id, signature):
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band][key].add(doc_id)
+
+    def _remove(self, doc_id):
+        """Toglie dai bucket la firma registrata di doc_id (se c'è)"""
+        entry = self.documents.pop(doc_id, None)
+        if entry is None:
+            return
+        for band, key in enumerate(self._band_keys(np.array(entry['signature'], dtype=np.uint64))):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def add(self, doc_id, signature, **metadata):
+        """Registra la firma di un volantino (sostituisce quella già registrata con lo stesso doc_id)"""
+        with self._lock:
+            self._remove(doc_id)
+            self.documents[doc_id] = {
+                'signature': [int(value) for value in signature],
+                'added_at': datetime.now().isoformat(),
+                **metadata
+            }
+            self._insert(doc_id, signature)
+
+    def query(self, signature, min_similarity=VERSION_THRESHOLD, exclude=None):
+        """
+        Candidati che condividono almeno una banda, con Jaccard stimato: [(doc_id, similarità)].
+        `exclude` è il documento controllato: la sua voce (chiave o path) non è un candidato.
+        """
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(self._band_keys(signature)):
+                candidates |= self._buckets[band].get(key, set())
+            entries = {doc_id: self.documents[doc_id]['signature'] for doc_id in candidates
+                       if exclude is None or exclude not in (doc_id, self.documents[doc_id].get('path'))}
+
+        results = [(doc_id, estimate_jaccard(signature, stored)) for doc_id, stored in entries.items()]
+        return sorted((item for item in results if item[1] >= min_similarity), key=lambda item: -item[1])
+
+
+class TextDuplicateDetector:
+    """
+    Fase di ingest: classifica i PDF come 'duplicate', 'new_version' o 'new' rispetto all'archivio.
+    Con skip=True il chiamante salta l'upload dei duplicati invece di segnalarli soltanto.
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE, duplicate_threshold=DUPLICATE_THRESHOLD,
+                 version_threshold=VERSION_THRESHOLD, skip=SKIP_TEXT_DUPLICATES):
+        self.enabled = is_available()
+        self.skip = skip
+        self.duplicate_threshold = duplicate_threshold
+        self.version_threshold = version_threshold
+        self.index_file = index_file
+        self._hasher = None
+        self._index = None
+        self._lock = threading.Lock()
+        if not self.enabled:
+            print("⚠️  Confronto testuale disattivato: servono numpy e PyMuPDF (o pdftotext)")
+
+    def _ensure_loaded(self):
+        # Permutazioni MinHash e indice LSH (con numpy) solo al primo PDF, non alla creazione dello scraper
+        with self._lock:
+            if self._index is None and self.enabled:
+                self._hasher = MinHasher()
+                self._index = LSHIndex(self.index_file)
+
+    @property
+    def hasher(self):
+        self._ensure_loaded()
+        return self._hasher
+
+    @property
+    def index(self):
+        self._ensure_loaded()
+        return self._index
+
+    def classify(self, pdf_path):
+        """
+        Restituisce (firma, esito, miglior match o None).
+        La firma è None se il PDF non ha abbastanza testo (es. volantino solo immagini).
+        """
+        if not self.enabled:
+            return None, 'new', None
+        try:
+            shingle_set = shingles(extract_text(pdf_path))
+        except Exception as e:
+            print(f"⚠️  Testo non estraibile da {os.path.basename(str(pdf_path))}: {e}")
+            return None, 'new', None
+        if len(shingle_set) < MIN_SHINGLES:
+            return None, 'new', None
+
+        signature = self.hasher.signature(shingle_set)
+        # Un PDF già indicizzato (integratore rilanciato) non è il duplicato di sé stesso
+        matches = self.index.query(signature, self.version_threshold, exclude=os.path.abspath(str(pdf_path)))
+        if not matches:
+            return signature, 'new', None
+        best = matches[0]
+        return signature, ('duplicate' if best[1] >= self.duplicate_threshold else 'new_version'), best
+
+    def register(self, doc_id, signature, **metadata):
+        """Aggiunge all'indice un volantino effettivamente caricato"""
+        if self.enabled and signature is not None:
+            self.index.add(doc_id, signature, **metadata)
+            self.index.save()
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Duplicati testuali dei volantini (MinHash/LSH)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    check_parser = subparsers.add_parser('check', help="Classifica i PDF rispetto all'indice")
+    check_parser.add_argument('files', nargs='+')
+    check_parser.add_argument('--index', default=DEFAULT_INDEX_FILE)
+    check_parser.add_argument('--add', action='store_true', help="Aggiunge all'indice i file non duplicati")
+
+    args = parser.parse_args()
+
+    if not is_available():
+        print("❌ Servono numpy e PyMuPDF (oppure pdftotext)")
+        return 1
+
+    detector = TextDuplicateDetector(args.index)
+    for path in args.files:
+        signature, outcome, match = detector.classify(path)
+        if signature is None:
+            print(f"⚠️  {path}: testo insufficiente")
+            continue
+        if outcome == 'duplicate':
+            print(f"🔁 {path}: duplicato di {match[0]} (Jaccard {match[1]:.2f})")
+            continue
+        if outcome == 'new_version':
+            print(f"🆕 {path}: nuova versione di {match[0]} (Jaccard {match[1]:.2f})")
+        else:
+            print(f"🆕 {path}: volantino nuovo")
+        if args.add:
+            detector.register(os.path.abspath(path), signature, path=os.path.abspath(path))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
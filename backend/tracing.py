@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracing leggero delle esecuzioni degli scraper
+Ogni processo è un run (span radice) con sotto uno span per fonte e, dentro,
+pagine, parsing, download e upload dei volantini e le singole richieste HTTP,
+scomposte in connessione (DNS+TCP, TLS), attesa del server e trasferimento del
+corpo. Con TRACE_FILE impostata gli span vengono aggiunti a un file JSONL, uno
+per riga, nella forma degli span OTLP/JSON di OpenTelemetry; senza, il tracing
+è spento e costa un controllo per chiamata.
+
+Uso:
+    TRACE_FILE=trace.jsonl python scraper_deco.py
+    python tracing.py list trace.jsonl              # run registrati
+    python tracing.py show trace.jsonl --top 15     # percorso critico e span più lenti dell'ultimo run
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+DEFAULT_TRACE_FILE = os.environ.get('TRACE_FILE')
+SERVICE_NAME = 'volantinomix-scraper'
+
+KIND_INTERNAL = 'SPAN_KIND_INTERNAL'
+KIND_CLIENT = 'SPAN_KIND_CLIENT'
+
+
+def _new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+
+def _attribute(key, value):
+    """Attributo nella forma OTLP/JSON: {'key', 'value': {'<tipo>Value': ...}}"""
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def _attribute_value(typed):
+    if 'intValue' in typed:
+        return int(typed['intValue'])
+    return next(iter(typed.values()), None)
+
+
+class Span:
+    """Intervallo di tempo con attributi; i tempi sono ns epoch da un orologio monotono"""
+
+    __slots__ = ('tracer', 'name', 'kind', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, tracer, name, parent_id, kind=KIND_INTERNAL, attributes=None, start_ns=None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else tracer.now_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, end_ns=None):
+        if self.end_ns is None:
+            self.end_ns = end_ns if end_ns is not None else self.tracer.now_ns()
+            self.tracer.export(self)
+
+    def to_otlp(self, trace_id):
+        record = {
+            'resource': {'attributes': [_attribute('service.name', SERVICE_NAME)]},
+            'traceId': trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            'status': {'code': 'STATUS_CODE_ERROR', 'message': self.error} if self.error else {'code': 'STATUS_CODE_UNSET'}
+        }
+        return record
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Un trace per processo. Lo span radice 'run' si apre al primo span e si chiude
+    all'uscita; gli span aperti in thread senza genitore si agganciano al run.
+    """
+
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file
+        self.trace_id = _new_id(16)
+        self._epoch_ns = time.time_ns()
+        self._perf_ns = time.perf_counter_ns()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._output = None
+        self._run = None
+        # Oggetti con span_started(span)/span_ended(span), es. il profiling per fase
+        self.listeners = []
+
+    @property
+    def enabled(self):
+        return bool(self.trace_file or self.listeners)
+
+    def now_ns(self):
+        return self._epoch_ns + time.perf_counter_ns() - self._perf_ns
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        stack = self._stack()
+        if stack:
+            return stack[-1]
+        return self._root()
+
+    def _root(self):
+        with self._lock:
+            if self._run is None:
+                self._run = Span(self, 'run', None, attributes={
+                    'process.pid': os.getpid(),
+                    'process.command': os.path.basename(sys.argv[0]) if sys.argv else 'python'
+                })
+                atexit.register(self.shutdown)
+        return self._run
+
+    @contextmanager
+    def span(self, name, kind=KIND_INTERNAL, **attributes):
+        """Span figlio di quello corrente del thread per la durata del blocco"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        span = Span(self, name, self.current().span_id, kind, attributes)
+        stack = self._stack()
+        stack.append(span)
+        for listener in self.listeners:
+            listener.span_started(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            span.end()
+            for listener in self.listeners:
+                listener.span_ended(span)
+
+    def record(self, name, start_ns, end_ns, parent=None, **attributes):
+        """Span già concluso (es. fasi ricavate a posteriori da una richiesta HTTP)"""
+        if not self.enabled or end_ns <= start_ns:
+            return
+        parent = parent or self.current()
+        Span(self, name, parent.span_id, attributes=attributes, start_ns=start_ns).end(end_ns)
+
+    def export(self, span):
+        if not self.trace_file:
+            return
+        line = json.dumps(span.to_otlp(self.trace_id), ensure_ascii=False)
+        with self._lock:
+            if self._output is None:
+                directory = os.path.dirname(self.trace_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._output = open(self.trace_file, 'a', encoding='utf-8')
+            self._output.write(line + '\n')
+            self._output.flush()
+
+    def shutdown(self):
+        """Chiude il run e il file (chiamata anche all'uscita del processo)"""
+        if self._run is not None:
+            self._run.end()
+        with self._lock:
+            if self._output is not None:
+                self._output.close()
+                self._output = None
+
+
+TRACER = Tracer(DEFAULT_TRACE_FILE)
+
+
+def span(name, **attributes):
+    return TRACER.span(name, **attributes)
+
+
+def traced(name, arg=None, **attributes):
+    """
+    Decoratore: esegue il metodo dentro uno span `name`. Con `arg` il primo
+    argomento (dopo self) diventa l'attributo con quel nome, es. l'URL del volantino.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            extra = dict(attributes)
+            if arg and len(args) > 1 and isinstance(args[1], (str, os.PathLike)):
+                extra[arg] = os.fspath(args[1])
+            with TRACER.span(name, **extra):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Fine dell'ultima connessione aperta dal thread, per separare connessione e attesa del server
+_connections = threading.local()
+_connection_patched = False
+
+
+def _patch_connections():
+    """Span per l'apertura delle connessioni urllib3: 'connect' con dentro 'dns+tcp' e 'tls'"""
+    global _connection_patched
+    if _connection_patched:
+        return
+    _connection_patched = True
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+
+    original_new_conn = HTTPConnection._new_conn
+
+    def _new_conn(self):
+        with TRACER.span('dns+tcp', **{'server.address': self.host, 'server.port': self.port}):
+            result = original_new_conn(self)
+        self._trace_tcp_end_ns = TRACER.now_ns()
+        return result
+
+    def wrap_connect(original, tls):
+        def connect(self):
+            if not TRACER.enabled:
+                return original(self)
+            with TRACER.span('connect', **{'server.address': self.host, 'tls': tls}) as connect_span:
+                result = original(self)
+            if tls:
+                # Quanto non è DNS+TCP è handshake TLS
+                tcp_end = getattr(self, '_trace_tcp_end_ns', connect_span.start_ns)
+                TRACER.record('tls', tcp_end, connect_span.end_ns, parent=connect_span)
+            _connections.end_ns = connect_span.end_ns
+            return result
+        return connect
+
+    HTTPConnection._new_conn = _new_conn
+    HTTPConnection.connect = wrap_connect(HTTPConnection.connect, False)
+    HTTPSConnection.connect = wrap_connect(HTTPSConnection.connect, True)
+
+
+def _body_size(request):
+    body = request.body
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return int(request.headers.get('content-length') or 0)
+
+
+def instrument_session(session):
+    """
+    Traccia le richieste della sessione: uno span 'HTTP <metodo>' per richiesta
+    con connessione, attesa della risposta ('wait', fino agli header) e, per le
+    risposte non in streaming, trasferimento del corpo ('body'). Il corpo dei
+    download in streaming è misurato da downloads.StreamedDownload.
+    Il flag `stream` della richiesta non viene toccato: gli hook di risposta (es.
+    metrics.instrument_session) lo vedono com'è; l'arrivo degli header è segnato da
+    un hook registrato per primo.
+    """
+    send = session.send
+
+    def mark_headers(response, *args, **kwargs):
+        if TRACER.enabled:
+            response._trace_headers_ns = TRACER.now_ns()
+        return response
+
+    def traced_send(request, **kwargs):
+        if not TRACER.enabled:
+            return send(request, **kwargs)
+        _patch_connections()
+        stream = kwargs.get('stream', False)
+        url = urlsplit(request.url)
+        attributes = {'http.method': request.method, 'http.url': request.url, 'server.address': url.netloc}
+        with TRACER.span(f"HTTP {request.method}", kind=KIND_CLIENT, **attributes) as http_span:
+            response = send(request, **kwargs)
+            end_ns = TRACER.now_ns()
+            headers_ns = getattr(response, '_trace_headers_ns', end_ns)
+            connected_ns = getattr(_connections, 'end_ns', 0)
+            wait_start = connected_ns if connected_ns > http_span.start_ns else http_span.start_ns
+            TRACER.record('wait', wait_start, headers_ns, parent=http_span)
+            http_span.set(**{'http.status_code': response.status_code,
+                             'http.request.body.size': _body_size(request)})
+            if not stream:
+                # Senza streaming requests legge il corpo dentro send(), dopo gli hook
+                size = len(response.content)
+                TRACER.record('body', headers_ns, end_ns, parent=http_span, bytes=size)
+                http_span.set(**{'http.response.body.size': size})
+            return response
+
+    session.hooks['response'].insert(0, mark_headers)
+    session.send = traced_send
+    return session
+
+
+def load_spans(trace_file):
+    """Span del file JSONL come dizionari semplici, raggruppati per trace"""
+    traces = {}
+    with open(trace_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            start, end = int(record['startTimeUnixNano']), int(record['endTimeUnixNano'])
+            traces.setdefault(record['traceId'], []).append({
+                'id': record['spanId'],
+                'parent': record.get('parentSpanId') or None,
+                'name': record['name'],
+                'start': start,
+                'end': end,
+                'duration': (end - start) / 1e9,
+                'attributes': {item['key']: _attribute_value(item['value']) for item in record.get('attributes', [])},
+                'error': record.get('status', {}).get('message')
+            })
+    return traces
+
+
+def build_tree(spans):
+    """Figli per span (in ordine di inizio) e radici; gli span orfani diventano radici"""
+    by_id = {s['id']: s for s in spans}
+    children = {s['id']: [] for s in spans}
+    roots = []
+    for s in sorted(spans, key=lambda item: item['start']):
+        if s['parent'] in by_id:
+            children[s['parent']].append(s)
+        else:
+            roots.append(s)
+    for s in spans:
+        covered = sum(child['duration'] for child in children[s['id']])
+        s['self'] = max(s['duration'] - covered, 0.0)
+    return roots, children
+
+
+def critical_path(root, children):
+    """
+    Catena di span che determina la durata di `root`: partendo dalla fine si
+    sceglie il figlio che termina per ultimo, poi quello che termina prima del suo
+    inizio, e così via; si ripete dentro ogni figlio scelto.
+    """
+    path = [root]
+    cursor = root['end']
+    chosen = []
+    for child in sorted(children[root['id']], key=lambda item: item['end'], reverse=True):
+        if child['end'] <= cursor:
+            chosen.append(child)
+            cursor = child['start']
+    for child in reversed(chosen):
+        path.extend(critical_path(child, children))
+    return path
+
+
+def _label(s):
+    attrs = s['attributes']
+    detail = (attrs.get('source') or attrs.get('http.url') or attrs.get('url') or attrs.get('file')
+              or attrs.get('selector') or attrs.get('server.address') or '')
+    return f"{s['name']} {detail}".strip()
+
+
+def print_report(spans, top=10):
+    roots, children = build_tree(spans)
+    depth = {}
+
+    def assign(s, level):
+        depth[s['id']] = level
+        for child in children[s['id']]:
+            assign(child, level + 1)
+
+    for root in roots:
+        assign(root, 0)
+
+    root = max(roots, key=lambda s: s['duration'])
+    start = min(s['start'] for s in spans)
+    print(f"🧵 {len(spans)} span, run di {root['duration']:.2f}s ({root['attributes'].get('process.command', root['name'])})")
+
+    totals = {}
+    for s in spans:
+        entry = totals.setdefault(s['name'] if not s['name'].startswith('HTTP ') else 'HTTP', [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += s['duration']
+        entry[2] += s['self']
+    print("\n📊 Tempo per tipo di span (self = escluso il tempo dei figli)")
+    for name, (count, total, own) in sorted(totals.items(), key=lambda item: item[1][2], reverse=True):
+        print(f"   {name:<16} {count:>5}×  totale {total:8.3f}s  self {own:8.3f}s")
+
+    print("\n🛤️  Percorso critico")
+    for s in critical_path(root, children):
+        offset = (s['start'] - start) / 1e9
+        marker = '❌' if s['error'] else '  '
+        print(f"{marker} +{offset:7.3f}s {s['duration']:8.3f}s  self {s['self']:7.3f}s  {'  ' * depth[s['id']]}{_label(s)}")
+
+    print("\n🐢 Span più lenti (self)")
+    # La radice 'run' ha come self solo avvio e chiusura del processo
+    candidates = [s for s in spans if s['parent'] is not None]
+    for s in sorted(candidates, key=lambda item: item['self'], reverse=True)[:top]:
+        print(f"   {s['self']:8.3f}s  {_label(s)}" + (f"  ❌ {s['error']}" if s['error'] else ''))
+
+
+def main():
+    """Funzione principale"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Analisi dei trace degli scraper VolantinoMix')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='Elenca i run registrati')
+    list_parser.add_argument('trace_file')
+
+    show_parser = subparsers.add_parser('show', help='Percorso critico e span più lenti di un run')
+    show_parser.add_argument('trace_file')
+    show_parser.add_argument('--trace', help='ID del trace (default: l\'ultimo)')
+    show_parser.add_argument('--top', type=int, default=10, help='Numero di span più lenti (default: 10)')
+
+    args = parser.parse_args()
+    try:
+        traces = load_spans(args.trace_file)
+    except OSError as e:
+        print(f"❌ File non leggibile: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not traces:
+        print(f"⚠️  Nessuno span in {args.trace_file}")
+        return
+
+    ordered = sorted(traces.items(), key=lambda item: min(s['start'] for s in item[1]))
+    if args.command == 'list':
+        for trace_id, spans in ordered:
+            first = min(s['start'] for s in spans)
+            duration = (max(s['end'] for s in spans) - first) / 1e9
+            sources = sorted({s['attributes']['source'] for s in spans if s['name'] == 'source' and 'source' in s['attributes']})
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first / 1e9))
+            print(f"{trace_id}  {started}  {duration:8.2f}s  {len(spans):>5} span  {', '.join(sources)}")
+    elif args.command == 'show':
+        trace_id = args.trace or ordered[-1][0]
+        matches = [tid for tid in traces if tid.startswith(trace_id)]
+        if len(matches) != 1:
+            print(f"❌ Trace non trovato o ambiguo: {trace_id}", file=sys.stderr)
+            sys.exit(1)
+        print(f"🔎 Trace {matches[0]}")
+        print_report(traces[matches[0]], args.top)
+
+
+if __name__ == "__main__":
+    main()
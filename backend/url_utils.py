@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Canonicalizzazione degli URL condivisa dagli scraper
+Lo stesso PDF compare spesso con URL diversi: parametri di tracking, http/https,
+percorsi relativi, host CDN al posto dell'origine, redirect. Tutte le decisioni di
+deduplicazione (insiemi di URL visitati, indici, chiavi di upload) passano da qui,
+così ogni volantino viene scaricato una sola volta.
+
+Compatibile con Python 3.9+
+Autore: VolantinoMix Team
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode, quote
+
+# Parametri che identificano la campagna, non la risorsa
+TRACKING_PARAMS = frozenset({
+    'gclid', 'gclsrc', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid', 'twclid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'srsltid', 'ref', 'ref_src', 'cmpid'
+})
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_', 'mtm_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Host CDN equivalenti all'origine, es. URL_HOST_ALIASES="cdn.esempio.it=esempio.it,..."
+HOST_ALIASES = dict(
+    pair.split('=', 1) for pair in os.environ.get('URL_HOST_ALIASES', '').split(',') if '=' in pair
+)
+
+REDIRECT_TTL = 7 * 24 * 3600
+
+_PERCENT_RE = re.compile(r'%[0-9a-fA-F]{2}')
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def _normalize_path(path):
+    """Risolve i segmenti '.' e '..', comprime le barre doppie e normalizza i percent-escape"""
+    segments = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if segments:
+                segments.pop()
+        elif segment not in ('', '.'):
+            segments.append(segment)
+    normalized = '/' + '/'.join(segments)
+    if path.endswith('/') and segments:
+        normalized += '/'
+    normalized = quote(normalized, safe="/%:@!$&'()*+,;=-._~")
+    return _PERCENT_RE.sub(lambda match: match.group(0).upper(), normalized)
+
+
+def canonicalize_url(url, base=None):
+    """
+    Forma canonica di un URL: risolto rispetto a `base`, schema e host minuscoli,
+    porta di default e frammento rimossi, parametri di tracking eliminati e query ordinata.
+    Gli URL non http(s) vengono restituiti invariati.
+    """
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.rstrip('.')
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking(name)
+    ))
+    return urlunsplit((scheme, netloc, _normalize_path(parts.path), query, ''))
+
+
+def url_key(url, base=None):
+    """
+    Chiave di deduplicazione: URL canonico senza schema, senza 'www.' e con gli host
+    CDN ricondotti all'origine. http://www.x.it/a.pdf e https://x.it/a.pdf hanno la stessa chiave.
+    """
+    canonical = canonicalize_url(url, base)
+    parts = urlsplit(canonical)
+    if not parts.hostname:
+        return canonical
+    host = parts.netloc
+    host = HOST_ALIASES.get(host, host)
+    if host.startswith('www.'):
+        host = host[4:]
+    return f"//{host}{parts.path}" + (f"?{parts.query}" if parts.query else '')
+
+
+class RedirectCache:
+    """
+    Cache persistente delle catene di redirect: ogni URL intermedio punta all'URL finale.
+    Le risposte già scaricate si registrano con record() senza richieste aggiuntive.
+    """
+
+    def __init__(self, cache_file=None, ttl=REDIRECT_TTL):
+        self.cache_file = str(cache_file) if cache_file else None
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.entries = self._load()
+
+    def _load(self):
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Scrive la cache su disco (atomicamente) se è cambiata"""
+        if not self.cache_file:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self.entries)
+            self._dirty = False
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.cache_file)
+
+    def lookup(self, url):
+        """URL finale canonico se la catena è in cache, altrimenti l'URL canonico stesso"""
+        canonical = canonicalize_url(url)
+        with self._lock:
+            entry = self.entries.get(url_key(canonical))
+        if entry and time.time() - entry['checked_at'] < self.ttl:
+            return entry['final']
+        return canonical
+
+    def record(self, response, url=None):
+        """Registra la catena di redirect di una risposta requests; restituisce l'URL finale canonico"""
+        final = canonicalize_url(response.url)
+        hops = [hop.url for hop in getattr(response, 'history', [])]
+        if url:
+            hops.append(url)
+        now = time.time()
+        with self._lock:
+            for hop in hops:
+                key = url_key(hop)
+                if key != url_key(final):
+                    self.entries[key] = {'final': final, 'checked_at': now}
+                    self._dirty = True
+        return final
+
+    def resolve(self, url, session, timeout=10):
+        """Segue i redirect con una HEAD (solo se la catena non è già in cache)"""
+        cached = self.lookup(url)
+        if cached != canonicalize_url(url):
+            return cached
+        try:
+            response = session.head(url, allow_redirects=True, timeout=timeout)
+        except Exception:
+            return cached
+        return self.record(response, url)
+
+
+class URLSet:
+    """
+    Insieme di URL deduplicato per chiave canonica (vedi url_key).
+    Conserva il primo URL canonico visto per ogni chiave; con una RedirectCache
+    due URL che portano allo stesso file contano come uno solo.
+    """
+
+    def __init__(self, urls=(), redirects=None):
+        self.redirects = redirects
+        self._urls = {}
+        self.update(urls)
+
+    def _canonical(self, url, base=None):
+        canonical = canonicalize_url(url, base)
+        return self.redirects.lookup(canonical) if self.redirects else canonical
+
+    def add(self, url, base=None):
+        """Aggiunge l'URL; restituisce False se era già presente"""
+        canonical = self._canonical(url, base)
+        key = url_key(canonical)
+        if key in self._urls:
+            return False
+        self._urls[key] = canonical
+        return True
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        return url_key(self._canonical(url)) in self._urls
+
+    def __iter__(self):
+        return iter(list(self._urls.values()))
+
+    def __len__(self):
+        return len(self._urls)
@@ -8,15 +8,43 @@
 
 const Volantino = require('../models/Volantino');
 const crypto = require('crypto');
-const fs = require('fs').promises;
+const fs = require('fs');
+
+// Blocchi da 1 MiB: il file non viene mai caricato interamente in memoria
+const HASH_CHUNK_SIZE = 1024 * 1024;
+
+// Cache dei digest per percorso, valida finché inode, dimensione e mtime non cambiano
+const HASH_CACHE_MAX_ENTRIES = 5000;
+const fileHashCache = new Map();
 
 /**
  * Genera un hash del contenuto del file PDF per confronti più precisi
  */
 async function generateFileHash(filePath) {
     try {
-        const fileBuffer = await fs.readFile(filePath);
-        return crypto.createHash('md5').update(fileBuffer).digest('hex');
+        const stats = await fs.promises.stat(filePath, { bigint: true });
+        const signature = `${stats.ino}:${stats.size}:${stats.mtimeNs}`;
+
+        const cached = fileHashCache.get(filePath);
+        if (cached && cached.signature === signature) {
+            // Riporta la voce in coda (ordine LRU)
+            fileHashCache.delete(filePath);
+            fileHashCache.set(filePath, cached);
+            return cached.hash;
+        }
+
+        const hash = crypto.createHash('md5');
+        for await (const chunk of fs.createReadStream(filePath, { highWaterMark: HASH_CHUNK_SIZE })) {
+            hash.update(chunk);
+        }
+        const digest = hash.digest('hex');
+
+        fileHashCache.delete(filePath);
+        fileHashCache.set(filePath, { signature, hash: digest });
+        if (fileHashCache.size > HASH_CACHE_MAX_ENTRIES) {
+            fileHashCache.delete(fileHashCache.keys().next().value);
+        }
+        return digest;
     } catch (error) {
         console.warn(`Impossibile generare hash per ${filePath}:`, error.message);
         return null;
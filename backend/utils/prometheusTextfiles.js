@@ -0,0 +1,79 @@
+/**
+ * Lettura dei file .prom scritti dagli scraper (metrics.py, export_run)
+ * Ogni fonte ha il suo file con HELP/TYPE ripetuti: per esporli su un unico
+ * /metrics si uniscono le famiglie di metriche, tenendo HELP e TYPE una volta sola.
+ * Le serie non si sovrappongono perché ogni file porta l'etichetta source della fonte.
+ */
+
+const fs = require('fs');
+const path = require('path');
+
+// Stessa cartella di metrics.DEFAULT_TEXTFILE_DIR (relativa alla cartella backend, qualunque sia la cwd degli scraper)
+const METRICS_TEXTFILE_DIR = path.resolve(__dirname, '..', process.env.METRICS_TEXTFILE_DIR || 'metrics');
+
+/**
+ * Aggiunge le famiglie di un file .prom alla mappa nome → { help, type, samples }
+ */
+function addFamilies(families, content) {
+    let current = null;
+
+    const family = (name) => {
+        if (!families.has(name)) {
+            families.set(name, { help: null, type: null, samples: [] });
+        }
+        return families.get(name);
+    };
+
+    for (const line of content.split('\n')) {
+        if (!line.trim()) {
+            continue;
+        }
+        const comment = line.match(/^# (HELP|TYPE) (\S+)/);
+        if (comment) {
+            current = family(comment[2]);
+            const key = comment[1] === 'HELP' ? 'help' : 'type';
+            if (!current[key]) {
+                current[key] = line;
+            }
+            continue;
+        }
+        if (line.startsWith('#')) {
+            continue;
+        }
+        // Campioni senza TYPE precedente: famiglia dal nome della serie
+        (current || family(line.split(/[{\s]/)[0])).samples.push(line);
+    }
+}
+
+/**
+ * Metriche di tutte le fonti in formato testo Prometheus 0.0.4 ('' se non ce ne sono)
+ */
+async function collectTextfiles(textfileDir = METRICS_TEXTFILE_DIR) {
+    let names;
+    try {
+        names = (await fs.promises.readdir(textfileDir)).filter((name) => name.endsWith('.prom')).sort();
+    } catch (error) {
+        return '';
+    }
+
+    const families = new Map();
+    for (const name of names) {
+        try {
+            addFamilies(families, await fs.promises.readFile(path.join(textfileDir, name), 'utf8'));
+        } catch (error) {
+            // File riscritto o rimosso durante la lettura: lo si salta, il prossimo scrape lo rilegge
+            continue;
+        }
+    }
+
+    const blocks = [...families.keys()].sort().map((name) => {
+        const { help, type, samples } = families.get(name);
+        return [help, type, ...samples].filter(Boolean).join('\n');
+    });
+    return blocks.length ? blocks.join('\n') + '\n' : '';
+}
+
+module.exports = {
+    METRICS_TEXTFILE_DIR,
+    collectTextfiles
+};